@@ -2,9 +2,12 @@
 """
 Module containing command for sending funds
 """
+from datetime import datetime
+from pathlib import Path
 from typing import List
 
 import cryptnox_sdk_py
+from tabulate import tabulate
 
 from .command import Command
 from .helper.config import create_config_method
@@ -14,11 +17,29 @@ from .helper.security import check_pin_code
 try:
     import enums
     from config import get_configuration
-    from wallet.btc import BTCwallet, BlkHubApi
+    from lib.cryptos.psbt import PsbtError
+    from wallet.btc import DEFAULT_FETCH_WORKERS, BTCwallet
+    from wallet.btc_batch import DEFAULT_MAX_OUTPUTS, PaymentListError, chunk_payments, read_payments
+    from wallet.btc_history import AddressHistory
+    from wallet.btc_psbt import (
+        apply_signatures, broadcast, confirm_signing, read_psbt, record_spends,
+        signing_requests, wallet_psbts, write_psbt
+    )
+    from wallet.fee_cache import DEFAULT_BLOCKS, DEFAULT_TTL, FeeCache
+    from wallet.hedged import api_from_config
 except ImportError:
     from .. import enums
     from ..config import get_configuration
-    from ..wallet.btc import BTCwallet, BlkHubApi
+    from ..lib.cryptos.psbt import PsbtError
+    from ..wallet.btc import DEFAULT_FETCH_WORKERS, BTCwallet
+    from ..wallet.btc_batch import DEFAULT_MAX_OUTPUTS, PaymentListError, chunk_payments, read_payments
+    from ..wallet.btc_history import AddressHistory
+    from ..wallet.btc_psbt import (
+        apply_signatures, broadcast, confirm_signing, read_psbt, record_spends,
+        signing_requests, wallet_psbts, write_psbt
+    )
+    from ..wallet.fee_cache import DEFAULT_BLOCKS, DEFAULT_TTL, FeeCache
+    from ..wallet.hedged import api_from_config
 
 
 class Btc(Command):
@@ -36,6 +57,12 @@ class Btc(Command):
 
         if self.data.action == "send":
             self._send(card)
+        if self.data.action == "batch":
+            self._batch(card)
+        if self.data.action == "history":
+            self._history(card)
+        if self.data.action == "psbt":
+            self._psbt(card)
         if self.data.action == "config":
             return create_config_method(card, self.data.key, self.data.value, "btc")
 
@@ -51,12 +78,9 @@ class Btc(Command):
             print("Derivation is invalid")
             return
 
-        endpoint = BlkHubApi(network)
+        endpoint = api_from_config(network, config)
 
-        path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
-        pubkey = card.get_public_key(derivation, path=path)
-
-        wallet = BTCwallet(pubkey, network, endpoint, card)
+        wallet = Btc._wallet(card, derivation, network, endpoint, config)
         print("Sending BTC")
         amount = int(self.data.amount * 10 ** 8)
         card.derive(path=BTCwallet.PATH)
@@ -64,13 +88,15 @@ class Btc(Command):
         if self.data.fees:
             fees = self.data.fees
         else:
-            fees = endpoint.get_fee_estimates()
-            print(f"\nUsing fee (override with -f): {fees} Satoshi\n")
+            blocks = self.data.blocks or int(config.get("fee_blocks", DEFAULT_BLOCKS))
+            fee_cache = FeeCache(network, endpoint, ttl=int(config.get("fee_ttl", DEFAULT_TTL)))
+            fees = fee_cache.estimate(blocks)
+            print(f"\nUsing fee for confirmation in {blocks} blocks (override with -f): {fees} Satoshi\n")
 
         try:
             wallet.prepare(self.data.address, amount, fees)
 
-            signatures = Btc._sign(card, derivation, wallet.data_hash)
+            signatures = Btc._sign(card, derivation, wallet.data_hash, wallet.input_paths)
             message = wallet.send(self.data.address, amount, signatures)
         except Exception as error:
             print(error)
@@ -79,9 +105,248 @@ class Btc(Command):
         if message.startswith("\nDONE"):
             print(f"\nTransaction id: {message[13:]}\nBalance might take 30 s to be refreshed")
 
+    def _batch(self, card: cryptnox_sdk_py.Card) -> None:
+        config = get_configuration(card)["btc"]
+        network = self.data.network or config.get("network", "testnet")
+
+        try:
+            derivation = cryptnox_sdk_py.Derivation[config["derivation"]]
+        except KeyError:
+            print("Derivation is invalid")
+            return
+
+        endpoint = api_from_config(network, config)
+
+        wallet = Btc._wallet(card, derivation, network, endpoint, config)
+
+        try:
+            payments = read_payments(self.data.file, wallet.coin)
+        except OSError as error:
+            print(f"Can't read payment list: {error}")
+            return
+        except PaymentListError as error:
+            print(error)
+            return
+
+        try:
+            max_outputs = self.data.max_outputs or int(config.get("batch_max_outputs", DEFAULT_MAX_OUTPUTS))
+            groups = chunk_payments(payments, max_outputs)
+        except ValueError as error:
+            print(f"Invalid maximum number of outputs: {error}")
+            return
+        print(f"Sending BTC to {len(payments)} addresses in {len(groups)} transaction(s)")
+        card.derive(path=BTCwallet.PATH)
+
+        if self.data.fees:
+            fees = self.data.fees
+        else:
+            blocks = self.data.blocks or int(config.get("fee_blocks", DEFAULT_BLOCKS))
+            fee_cache = FeeCache(network, endpoint, ttl=int(config.get("fee_ttl", DEFAULT_TTL)))
+            fees = fee_cache.estimate(blocks)
+            print(f"\nUsing fee rate for confirmation in {blocks} blocks (override with -f): {fees} Satoshi "
+                  f"per byte\n")
+
+        try:
+            wallet.prepare_batch([[(payment.address, payment.value) for payment in group] for group in groups],
+                                 fees)
+            signatures = Btc._sign(card, derivation, wallet.data_hash, wallet.input_paths)
+            txids = wallet.send_batch(signatures)
+        except Exception as error:
+            print(error)
+            return
+
+        if not txids:
+            print("Canceled by the user.")
+            return
+        print("\nTransaction ids:")
+        for txid in txids:
+            print(txid)
+        print("Balance might take 30 s to be refreshed")
+
+    def _psbt(self, card: cryptnox_sdk_py.Card) -> None:
+        config = get_configuration(card)["btc"]
+        network = self.data.network or config.get("network", "testnet")
+
+        try:
+            derivation = cryptnox_sdk_py.Derivation[config["derivation"]]
+        except KeyError:
+            print("Derivation is invalid")
+            return
+
+        endpoint = api_from_config(network, config)
+
+        if self.data.psbt_action == "create":
+            self._psbt_create(card, config, network, derivation, endpoint)
+            return
+
+        try:
+            psbts = {name: read_psbt(name) for name in self.data.files}
+        except (OSError, PsbtError) as error:
+            print(f"Can't read PSBT: {error}")
+            return
+
+        if self.data.psbt_action == "sign":
+            self._psbt_sign(card, derivation, network, psbts)
+        elif self.data.psbt_action == "finalize":
+            for name, psbt in psbts.items():
+                try:
+                    psbt.finalize()
+                except PsbtError as error:
+                    print(f"{name}: {error}")
+                    continue
+                write_psbt(name, psbt)
+                print(f"{name}: {psbt.extract()}")
+        elif self.data.psbt_action == "broadcast":
+            path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
+            wallet = BTCwallet(card.get_public_key(derivation, path=path), network, endpoint, card)
+            for name, result in broadcast(endpoint, psbts, wallet=wallet).items():
+                print(f"{name}: {result}")
+
+    def _psbt_create(self, card: cryptnox_sdk_py.Card, config: dict, network: str,
+                     derivation: cryptnox_sdk_py.Derivation, endpoint) -> None:
+        path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
+        wallet = BTCwallet(card.get_public_key(derivation, path=path), network, endpoint, card)
+
+        if self.data.payments:
+            try:
+                payments = read_payments(self.data.payments, wallet.coin)
+            except OSError as error:
+                print(f"Can't read payment list: {error}")
+                return
+            except PaymentListError as error:
+                print(error)
+                return
+            try:
+                max_outputs = self.data.max_outputs or int(config.get("batch_max_outputs", DEFAULT_MAX_OUTPUTS))
+                groups = [[(payment.address, payment.value) for payment in group]
+                          for group in chunk_payments(payments, max_outputs)]
+            except ValueError as error:
+                print(f"Invalid maximum number of outputs: {error}")
+                return
+        elif self.data.address and self.data.amount:
+            groups = None
+        else:
+            print("Address and amount or a payment list is required")
+            return
+
+        if self.data.fees:
+            fees = self.data.fees
+        else:
+            blocks = self.data.blocks or int(config.get("fee_blocks", DEFAULT_BLOCKS))
+            fee_cache = FeeCache(network, endpoint, ttl=int(config.get("fee_ttl", DEFAULT_TTL)))
+            fees = fee_cache.estimate(blocks)
+            print(f"\nUsing fee{'' if groups is None else ' rate'} for confirmation in {blocks} blocks "
+                  f"(override with -f): {fees} Satoshi{'' if groups is None else ' per byte'}\n")
+
+        try:
+            if groups is None:
+                wallet.prepare(self.data.address, int(self.data.amount * 10 ** 8), fees)
+            else:
+                wallet.prepare_batch(groups, fees)
+            psbts = wallet_psbts(wallet)
+        except Exception as error:
+            print(error)
+            return
+
+        output = Path(self.data.output)
+        for number, psbt in enumerate(psbts, 1):
+            name = output if len(psbts) == 1 else output.with_name(f"{output.stem}-{number}{output.suffix}")
+            write_psbt(name, psbt)
+            record_spends(wallet, psbt)
+            print(f"{name}: {len(psbt.inputs)} inputs, {len(psbt.outputs)} outputs")
+
+    @staticmethod
+    def _psbt_sign(card: cryptnox_sdk_py.Card, derivation: cryptnox_sdk_py.Derivation, network: str,
+                   psbts: dict) -> None:
+        # The main path too, as the change goes to its address
+        paths = {path for psbt in psbts.values() for index in range(len(psbt.inputs))
+                 for path in psbt.derivations(index).values()} | {BTCwallet.PATH}
+        if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY:
+            pubkeys = {BTCwallet.PATH: card.get_public_key(derivation, path=b"")}
+        else:
+            pubkeys = {path: card.get_public_key(derivation, path=path) for path in paths}
+
+        try:
+            requests = signing_requests(psbts.values(), pubkeys)
+        except PsbtError as error:
+            print(error)
+            return
+        if not requests:
+            print("No inputs to sign with this card")
+            return
+
+        try:
+            confirmed = confirm_signing(psbts, network, pubkeys.values())
+        except PsbtError as error:
+            print(error)
+            return
+        if not confirmed:
+            print("Canceled by the user.")
+            return
+
+        print(f"Signing {len(requests)} inputs of {len(psbts)} PSBTs")
+        card.derive(path=BTCwallet.PATH)
+        signatures = Btc._sign(card, derivation, [request.data_hash for request in requests],
+                               [request.path for request in requests])
+        apply_signatures(requests, signatures)
+        for name, psbt in psbts.items():
+            write_psbt(name, psbt)
+
+    def _history(self, card: cryptnox_sdk_py.Card) -> None:
+        config = get_configuration(card)["btc"]
+        network = self.data.network or config.get("network", "testnet")
+
+        try:
+            derivation = cryptnox_sdk_py.Derivation[config["derivation"]]
+        except KeyError:
+            print("Derivation is invalid")
+            return
+
+        endpoint = api_from_config(network, config)
+        path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
+        wallet = BTCwallet(card.get_public_key(derivation, path=path), network, endpoint, card)
+        print(f"Transactions of {wallet.address} on {network}\n")
+
+        headers = ["Transaction id", "Block", "Time", "Amount [BTC]"]
+        pages = AddressHistory(wallet.address, network, endpoint).pages()
+        shown = 0
+        try:
+            for page in pages:
+                if shown and not self.data.all and \
+                        input("\nShow more? [y/N] ").strip().lower() not in ("y", "yes"):
+                    break
+                rows = [[tx["txid"], tx["block_height"] if tx["confirmed"] else "unconfirmed",
+                         datetime.fromtimestamp(tx["block_time"]).strftime("%Y-%m-%d %H:%M")
+                         if tx["block_time"] else "",
+                         f"{tx['value'] / 10 ** 8:+.8f}"] for tx in page]
+                print(tabulate(rows, headers=headers if not shown else (), tablefmt="plain"))
+                shown += len(page)
+        except Exception as error:
+            print(f"Error while getting the transactions: {error}")
+        finally:
+            pages.close()
+
+        if not shown:
+            print("No transactions found")
+
+    @staticmethod
+    def _wallet(card: cryptnox_sdk_py.Card, derivation: cryptnox_sdk_py.Derivation, network: str,
+                endpoint, config: dict) -> BTCwallet:
+        path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
+        wallet = BTCwallet(card.get_public_key(derivation, path=path), network, endpoint, card,
+                           fetch_workers=int(config.get("fetch_workers", DEFAULT_FETCH_WORKERS)))
+        if derivation != cryptnox_sdk_py.Derivation.CURRENT_KEY:
+            # The next receiving addresses of the account, after the main one at index 0
+            base_path = BTCwallet.PATH.rsplit("/", 1)[0]
+            for index in range(1, int(config.get("addresses", 1))):
+                address_path = f"{base_path}/{index}"
+                wallet.add_address(card.get_public_key(derivation, path=address_path), address_path)
+        return wallet
+
     @staticmethod
     def _sign(card: cryptnox_sdk_py.Card, derivation: cryptnox_sdk_py.Derivation,
-              data_hashes: List[bytes]) -> List[bytes]:
+              data_hashes: List[bytes], paths: List[str] = None) -> List[bytes]:
+        paths = paths or [BTCwallet.PATH] * len(data_hashes)
         signatures = []
         if card.auth_type == cryptnox_sdk_py.AuthType.PIN and len(data_hashes) > 1:
             pin_code = check_pin_code(card)
@@ -90,6 +355,6 @@ class Btc(Command):
 
         for index, data_hash in enumerate(data_hashes):
             print("\nSigning INPUT #", index + 1)
-            signatures.append(sign(card, data_hash, derivation, path=BTCwallet.PATH, pin_code=pin_code))
+            signatures.append(sign(card, data_hash, derivation, path=paths[index], pin_code=pin_code))
 
         return signatures
@@ -20,12 +20,14 @@ try:
     from ... import enums
     from ...config import get_configuration
     from ...wallet import eth
-    from ...wallet.btc import BTCwallet, BlkHubApi
+    from ...wallet.btc import BTCwallet
+    from ...wallet.hedged import api_from_config
 except ImportError:
     import enums
     from config import get_configuration
     from wallet import eth
-    from wallet.btc import BTCwallet, BlkHubApi
+    from wallet.btc import BTCwallet
+    from wallet.hedged import api_from_config
 
 __all__ = ['Cards']
 
@@ -63,7 +65,7 @@ class Info:
         except KeyError:
             return {"name": "Bad derivation type"}
         network = config.get("network", "testnet").lower()
-        endpoint = BlkHubApi(network)
+        endpoint = api_from_config(network, config)
 
         path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else BTCwallet.PATH
         pubkey = card.get_public_key(derivation, path=path)
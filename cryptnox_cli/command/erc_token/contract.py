@@ -5,10 +5,8 @@ token transfers, balance checking, gas estimation, and transaction building
 for ERC20, ERC721, and ERC1155 token standards.
 """
 
-import json
 import math
 from decimal import Decimal
-from pathlib import Path
 from typing import Tuple, Union
 
 import cryptnox_sdk_py
@@ -30,13 +28,8 @@ LIMIT = {
     "contract": 180000
 }
 
-
-def abi(value: int):
-    try:
-        folder = Path(__file__).parent.parent.parent.joinpath("contract_abi")
-        return json.loads(folder.joinpath(f"erc{value}.json").absolute().read_text())
-    except (FileNotFoundError, PermissionError, json.decoder.JSONDecodeError):
-        raise ValueError("ERC not recognized by the application.")
+# JSON-RPC error code of reverted calls
+_EXECUTION_ERROR = 3
 
 
 def gas(gas_price: int, set_price: int, set_limit: int,
@@ -64,7 +57,8 @@ def gas(gas_price: int, set_price: int, set_limit: int,
 
 def transfer(card, endpoint, network, api_key, contract_address: str, to: str, amount: float,
              price: int, limit: int,
-             derivation: cryptnox_sdk_py.Derivation = cryptnox_sdk_py.Derivation.CURRENT_KEY) -> int:
+             derivation: cryptnox_sdk_py.Derivation = cryptnox_sdk_py.Derivation.CURRENT_KEY,
+             wait: bool = False) -> int:
 
     try:
         endpoint = wallet.Api(endpoint, network, api_key)
@@ -73,7 +67,7 @@ def transfer(card, endpoint, network, api_key, contract_address: str, to: str, a
         return -1
 
     try:
-        contract = endpoint.contract(address=contract_address, abi=abi(20))
+        contract = endpoint.contract(address=contract_address, abi=wallet.erc_abi(20))
     except ValueError as error:
         print(error)
         return -1
@@ -85,23 +79,17 @@ def transfer(card, endpoint, network, api_key, contract_address: str, to: str, a
     public_key = card.get_public_key(derivation, path=path, compressed=False)
     address = wallet.checksum_address(public_key)
 
+    # Symbol, balances, gas price and nonce in one round trip
+    preflight = endpoint.preflight(address, contract)
     try:
-        symbol = contract.get_function_by_name("symbol")().call()
-    except (TypeError, web3.exceptions.BadFunctionCallOutput) as error:
+        symbol = preflight["symbol"].result()
+        token_balance = preflight["token_balance"].result()
+    except wallet.RpcError as error:
+        if error.code == _EXECUTION_ERROR or "revert" in error.message:
+            print(f"Error occurred with execution: {error}")
+            return -4
         print(error)
         return 2
-    except web3.exceptions.ContractLogicError as error:
-        print(f"Error occurred with execution: {error}")
-        return -4
-
-    try:
-        token_balance = contract.get_function_by_name("balanceOf")(address).call()
-    except (TypeError, web3.exceptions.BadFunctionCallOutput) as error:
-        print(error)
-        return 2
-    except web3.exceptions.ContractLogicError as error:
-        print(f"Error occurred with execution: {error}")
-        return -4
 
     if token_balance - amount < 0:
         print(f"Not enough {symbol} for transfer")
@@ -109,11 +97,14 @@ def transfer(card, endpoint, network, api_key, contract_address: str, to: str, a
 
     function = contract.get_function_by_name("transfer")
 
-    price, limit = gas(endpoint.gas_price, price, limit, LIMIT["contract"])
+    try:
+        gas_price, nonce, balance = (preflight[name].result() for name in ("gas_price", "nonce", "balance"))
+    except wallet.RpcError as error:
+        print(error)
+        return -1
 
-    nonce = endpoint.get_transaction_count(address)
+    price, limit = gas(gas_price, price, limit, LIMIT["contract"])
 
-    balance = endpoint.get_balance(address)
     if balance - price * limit < 0:
         print("Not enough fund for the transaction")
         return -2
@@ -150,12 +141,38 @@ def transfer(card, endpoint, network, api_key, contract_address: str, to: str, a
         print(error.args[0]["message"])
         return 4
 
+    if wait:
+        print(f"Request sent to network. Transaction id: {transaction.hex()}.")
+        return wait_for_inclusion(endpoint, transaction)
+
     print(f"Request sent to network. Transaction id: {transaction.hex()}. "
           f"It can take some time until you can see the change.")
 
     return 0
 
 
+def wait_for_inclusion(endpoint, transaction_hash) -> int:
+    """
+    Wait until a sent transaction is included in a block and show its result
+
+    :param endpoint: Api of the network the transaction was sent to
+    :param transaction_hash: Hash of the transaction
+    :return: 0 if the transaction succeeded, 1 if it failed or wasn't included in time
+    :rtype: int
+    """
+    print("Waiting for the transaction to be included in a block...")
+    try:
+        receipt = endpoint.wait_for_receipt(transaction_hash)
+    except web3.exceptions.TimeExhausted as error:
+        print(error)
+        return 1
+    if not receipt["status"]:
+        print(f"Transaction failed in block {receipt['blockNumber']}")
+        return 1
+    print(f"Transaction included in block {receipt['blockNumber']}")
+    return 0
+
+
 def _confirm_token_sending(contract: str, address: str, to: str,
                            token_balance: float, symbol: str, value: Union[Decimal, int],
                            balance: int, price: int, limit: float):
@@ -8,7 +8,7 @@ metadata display, and dual-card validation for enhanced security.
 import gzip
 import json
 import secrets
-from pathlib import Path
+from typing import Union
 
 import cryptnox_sdk_py
 import cryptography.exceptions
@@ -37,12 +37,6 @@ _SEED_SOURCE_TRANSLATION = {
     cryptnox_sdk_py.SeedSource.DUAL: "Dual card",
 }
 
-_ERC_PATH = Path(__file__).parent.parent.parent.joinpath("contract_abi")
-
-
-def _erc_abi_file(value):
-    return _ERC_PATH.joinpath(f"erc{value}.json").absolute()
-
 
 class Info:
     """
@@ -61,11 +55,7 @@ class Info:
             slots.append(gzip.decompress(card.user_data[i]))
 
         slot0 = json.loads(slots[0].decode("UTF8"))
-        if "erc" in slot0:
-            with open(_erc_abi_file(slot0["erc"])) as f:
-                abi = f.read()
-        else:
-            abi = slots[2].decode("UTF8")
+        abi = slot0["erc"] if "erc" in slot0 else slots[2].decode("UTF8")
         endpoint = slot0['endpoint']
 
         print("----------------------------------------------")
@@ -159,7 +149,7 @@ class Info:
     @staticmethod
     def _balance(endpoint, address):
         try:
-            w3 = Web3(Web3.HTTPProvider(endpoint))
+            w3 = eth.get_web3(endpoint)
             print(f"Balance: {Web3.from_wei(w3.eth.get_balance(address), 'ether')} ETH")
         except Exception as error:
             print(f"Error getting balance: {error}")
@@ -209,15 +199,15 @@ class Info:
     def _owner(
             endpoint: str,
             contract_address: ChecksumAddress,
-            abi: str,
+            abi: Union[int, str],
             account: str,
             token_id: int) -> None:
         print(f"Checking owner on contract: {contract_address}...")
-        w3 = Web3(Web3.HTTPProvider(endpoint))
+        w3 = eth.get_web3(endpoint)
         try:
-            contract = w3.eth.contract(address=contract_address, abi=abi)
-        except ValueError:
-            print("ABI format is not json")
+            contract = eth.get_abi(abi).contract(w3, contract_address)
+        except ValueError as error:
+            print(error)
             return
 
         function = contract.get_function_by_name("balanceOf")
@@ -230,14 +220,14 @@ class Info:
             print("FAILED!\nIssue with checking ownership")
 
     @staticmethod
-    def _token_balance(endpoint: str, contract_address: ChecksumAddress, abi: str,
+    def _token_balance(endpoint: str, contract_address: ChecksumAddress, abi: Union[int, str],
                        account: str) -> None:
         print(f"Checking token on contract: {contract_address}...")
-        w3 = Web3(Web3.HTTPProvider(endpoint))
+        w3 = eth.get_web3(endpoint)
         try:
-            contract = w3.eth.contract(address=contract_address, abi=abi)
-        except ValueError:
-            print("ABI format is not json")
+            contract = eth.get_abi(abi).contract(w3, contract_address)
+        except ValueError as error:
+            print(error)
             return
 
         try:
@@ -6,7 +6,6 @@ import json
 import re
 import shutil
 from decimal import Decimal
-from typing import Dict, Any, List
 
 import cryptnox_sdk_py
 import requests
@@ -18,7 +17,8 @@ from .command import Command
 from .erc_token import contract
 from .helper.config import create_config_method
 from .helper.helper_methods import sign
-from .helper.notification import MORE_THAN_X_RESULTS, MONTH_PERIOD_IN_BLOCKS
+from .helper.notification import MONTH_PERIOD_IN_BLOCKS
+from .helper.security import check_pin_code
 
 try:
     import enums
@@ -31,7 +31,7 @@ except ImportError:
     from ..wallet import eth as wallet
     from ..lib import cryptos
 
-_BLOCK_OFFSET = 500
+_EVENTS_PER_TABLE = 25
 _LARGE_SCREEN_SIZE = (4 - 1) * 3 + 4 + (64 + 2) + (42 + 2 + 6) + 8
 
 
@@ -41,15 +41,6 @@ class ApiKeyException(Exception):
     """
 
 
-def _abi(config) -> List[Any]:
-    try:
-        return contract.abi(int(config))
-    except ValueError:
-        return json.loads(config)
-    except TypeError:
-        return config
-
-
 def _large_screen():
     return shutil.get_terminal_size((80, 20)).columns > _LARGE_SCREEN_SIZE
 
@@ -98,7 +89,7 @@ class Event:
             return -1
 
         try:
-            abi = _abi(contract_config["abi"])
+            abi = wallet.get_abi(contract_config["abi"])
         except ValueError as error:
             print(error)
             return 3
@@ -141,79 +132,59 @@ class Event:
             return -1
 
         try:
-            abi = _abi(config_contract["abi"])
+            abi = wallet.get_abi(config_contract["abi"])
         except ValueError as error:
             print(error)
             return 3
 
-        contract_endpoint = endpoint.contract(address=config_contract["address"], abi=abi)
-
-        try:
-            event = getattr(contract_endpoint.events, self.data.event)
-        except web3.exceptions.ABIEventFunctionNotFound:
+        event_abi = next((entry for entry in abi.events if entry.get("name") == self.data.event), None)
+        if event_abi is None or event_abi.get("anonymous"):
             print("The event is not defined")
             return 1
 
+        to_block = endpoint.block_number if self.data.to_block is None else self.data.to_block
+        if self.data.all:
+            from_block = 0
+        elif self.data.from_block is not None:
+            from_block = self.data.from_block
+        elif config_contract.get(self.data.event) is not None:
+            from_block = config_contract[self.data.event] + 1
+        else:
+            from_block = max(0, to_block - MONTH_PERIOD_IN_BLOCKS)
+
         try:
-            entries = Event._get_logs(event)
+            conditions = wallet.parse_conditions(self.data.where or [])
         except ValueError as error:
+            print(error)
+            return 1
+
+        topic = web3.Web3.to_hex(abi.topic(self.data.event))
+        scanner = endpoint.log_scanner(config_contract["address"], [topic], wallet.EventDecoder(event_abi))
+        print(f"Looking for {self.data.event} events in blocks {from_block} to {to_block}")
+        try:
+            with wallet.LogIndex() as index:
+                # Only the blocks not indexed yet are fetched
+                index.sync(endpoint.network.value, scanner, topic, from_block, to_block)
+                entries = index.query(endpoint.network.value, scanner.address, topic, from_block, to_block,
+                                      conditions)
+        except wallet.RpcError as error:
             print(f"Error in getting the events: {error}")
             return -1
-        if entries:
-            tabulate_data = Event._logs_table(entries)
-            header = ["", "ARGUMENTS", "TRANSACTION HASH", "BLOCK"]
-            print(tabulate(tabulate_data, headers=header, tablefmt="grid"))
-        else:
-            print("No events have been found")
-        self.config["hidden"]["eth"]["contract"][self.data.alias][self.data.event] = \
-            endpoint.block_number
-        save_to_config(self.card, self.config)
-
-    @staticmethod
-    def _get_logs(event) -> List[Dict[str, Any]]:
-        min_offset = 0
-        max_offset = MONTH_PERIOD_IN_BLOCKS
-        offset = _BLOCK_OFFSET
-
-        current_block = event.w3.eth.block_number
-        event_signature = event.w3.keccak(
-            text=event.abi["name"] + "(" + ",".join([i["type"] for i in event.abi["inputs"]]) + ")"
-        )
-
-        decoded_logs = []
-
-        while True:
-            filter_params = {
-                "fromBlock": hex(current_block - offset),
-                "toBlock": hex(current_block),
-                "topics": [event_signature],
-                "address": event.address,
-            }
 
-            try:
-                logs = event.w3.eth.get_logs(filter_params)  # Stateless retrieval of logs
-                for log in logs:
-                    try:
-                        decoded_logs.append(event.process_log(log))
-                    except Exception as e:
-                        print(f"Error decoding log: {e}")
-            except ValueError as error:
-                if isinstance(error.args[0], dict) and error.args[0].get("code") != MORE_THAN_X_RESULTS:
-                    raise
-                max_offset = offset = ((max_offset - min_offset) // 2) + min_offset
-            else:
-                if len(decoded_logs) > 25 or offset >= MONTH_PERIOD_IN_BLOCKS:
-                    break
-                if max_offset == MONTH_PERIOD_IN_BLOCKS:
-                    min_offset = offset
-                    offset *= 2
-                else:
-                    min_offset = offset = ((max_offset - min_offset) // 2) + min_offset
+        header = ["", "ARGUMENTS", "TRANSACTION HASH", "BLOCK"]
+        count = len(entries)
+        for start in range(0, count, _EVENTS_PER_TABLE):
+            print(tabulate(Event._logs_table(entries[start:start + _EVENTS_PER_TABLE], start), headers=header,
+                           tablefmt="grid"))
+        print(f"{count} events found" if count else "No events have been found")
 
-        return list(map(dict, decoded_logs[-25:][::-1]))
+        if self.data.to_block is None:
+            self.config["hidden"]["eth"]["contract"][self.data.alias][self.data.event] = to_block
+            save_to_config(self.card, self.config)
+        return 0
 
     @staticmethod
-    def _logs_table(entries):
+    def _logs_table(entries, start: int = 0):
         tabulate_table = []
         for index, entry in enumerate(entries):
             entry = dict(entry)
@@ -226,7 +197,7 @@ class Event:
                     f"{transaction_hash[:half_hash_length]}\n" \
                     f"{transaction_hash[half_hash_length:]}"
             tabulate_table.append(
-                [index + 1, args, transaction_hash, entry["blockNumber"]])
+                [start + index + 1, args, transaction_hash, entry["blockNumber"]])
         return tabulate_table
 
 
@@ -283,9 +254,9 @@ class Contract(Command):
                 return -1
 
         try:
-            abi = _abi(abi)
-        except ValueError:
-            print("ERC not recognized by the application.")
+            abi = wallet.get_abi(abi)
+        except ValueError as error:
+            print(error)
             return -1
 
         try:
@@ -342,12 +313,12 @@ class Contract(Command):
         tabulate_table = []
 
         try:
-            abi = _abi(config["abi"])
+            abi = wallet.get_abi(config["abi"])
         except ValueError as error:
             print(error)
             return 3
 
-        for event in abi:
+        for event in abi.entries:
             if event["type"] == "function":
                 args = [[f"{arg['name'].strip('_')}:", arg["type"]] for arg in event.get("inputs")]
                 row = [event.get("name"), event.get("stateMutability"),
@@ -365,7 +336,7 @@ class Contract(Command):
             return -1
 
         try:
-            abi = _abi(config["abi"])
+            abi = wallet.get_abi(config["abi"])
         except ValueError as error:
             print(error)
             return 3
@@ -418,7 +389,7 @@ class Contract(Command):
             return 1
 
         try:
-            abi = _abi(contract_config["abi"])
+            abi = wallet.get_abi(contract_config["abi"])
         except ValueError as error:
             print(error)
             return 3
@@ -443,15 +414,18 @@ class Contract(Command):
                   "value.")
             return 4
 
-        price, limit = contract.gas(endpoint.gas_price, self.data.price, self.data.limit,
-                                    contract.LIMIT["contract"])
-
         path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else wallet.Api.PATH
         public_key = card.get_public_key(derivation, path=path, compressed=False)
 
-        nonce = endpoint.get_transaction_count(wallet.checksum_address(public_key))
+        preflight = endpoint.preflight(wallet.checksum_address(public_key))
+        try:
+            gas_price, nonce, balance = (preflight[name].result() for name in ("gas_price", "nonce", "balance"))
+        except ValueError as error:
+            print(error)
+            return -1
+
+        price, limit = contract.gas(gas_price, self.data.price, self.data.limit, contract.LIMIT["contract"])
 
-        balance = endpoint.get_balance(wallet.address(public_key))
         if balance - price * limit < 0:
             print("Not enough fund for the transaction")
             return -2
@@ -529,6 +503,8 @@ class Eth(Command):
         try:
             if self.data.eth_action == "send":
                 return self._send(card)
+            if self.data.eth_action == "batch":
+                return self._batch(card)
             if self.data.eth_action == "config":
                 return create_config_method(card, self.data.key, self.data.value, "eth")
             if self.data.eth_action == "contract":
@@ -548,8 +524,7 @@ class Eth(Command):
 
     def _send(self, card) -> int:
         if "contract" in self.data and self.data.contract:
-            self._send_token(card)
-            return 0
+            return self._send_token(card)
 
         config = get_configuration(card)["eth"]
 
@@ -565,13 +540,11 @@ class Eth(Command):
             print(error)
             return -1
 
-        price, limit = contract.gas(endpoint.gas_price, self.data.price, self.data.limit)
-
         print("Sending ETH")
         try:
             # eth path in the current key
             message = self._send_funds(card, derivation, endpoint, self.data.address,
-                                       self.data.amount, price, limit)
+                                       self.data.amount, self.data.price, self.data.limit)
         except ValueError as error:
             try:
                 print(error.args[0].get(
@@ -581,7 +554,10 @@ class Eth(Command):
                 raise error
 
         if message.startswith("DONE"):
-            print(f"\nTransaction id: {message[6:]}\nBalance might take 30 s to be refreshed.")
+            print(f"\nTransaction id: {message[6:]}")
+            if self.data.wait:
+                return contract.wait_for_inclusion(endpoint, message[6:])
+            print("Balance might take 30 s to be refreshed.")
 
         return 0
 
@@ -592,13 +568,15 @@ class Eth(Command):
 
         card.derive(path=wallet.Api.PATH)
         from_address = wallet.checksum_address(public_key)
-        balance = endpoint.get_balance(from_address)
+        preflight = endpoint.preflight(from_address, nonce_block="pending")
+        price, limit = contract.gas(preflight["gas_price"].result(), price, limit)
+        balance = preflight["balance"].result()
         max_spendable = balance - price * limit
         if web3.Web3.to_wei(amount, "ether") > max_spendable:
             raise ValueError({"message": "Not enough fund for the tx"})
 
         sanitized_transaction = dict(
-            nonce=endpoint.get_transaction_count(from_address, "pending"),
+            nonce=preflight["nonce"].result(),
             gasPrice=price,
             gas=limit,
             to=web3.Web3.to_checksum_address(address),
@@ -634,6 +612,121 @@ class Eth(Command):
             return "Canceled by the user."
         return "DONE: " + bytes(endpoint.push(sanitized_transaction, signature, public_key)).hex()
 
+    def _batch(self, card) -> int:
+        config = get_configuration(card)["eth"]
+
+        try:
+            derivation = cryptnox_sdk_py.Derivation[config["derivation"]]
+        except KeyError:
+            print("Derivation is invalid")
+            return 1
+
+        try:
+            endpoint = wallet.Api(config["endpoint"], config["network"], config["api_key"])
+        except ValueError as error:
+            print(error)
+            return -1
+
+        try:
+            payouts = wallet.read_payouts(self.data.file, integer=bool(self.data.contract))
+        except OSError as error:
+            print(f"Can't read payment list: {error}")
+            return 1
+        except wallet.PaymentListError as error:
+            print(error)
+            return 1
+
+        path = b"" if derivation == cryptnox_sdk_py.Derivation.CURRENT_KEY else wallet.Api.PATH
+        public_key = card.get_public_key(derivation, path=path, compressed=False)
+        sender = wallet.checksum_address(public_key)
+        token = None
+        erc20 = wallet.erc_abi(20)
+        if self.data.contract:
+            token = endpoint.contract(address=web3.Web3.to_checksum_address(self.data.contract), abi=erc20)
+
+        journal = wallet.PayoutJournal(sender, endpoint.network.value, payouts,
+                                       token.address if token else None)
+        if journal.done():
+            print("All payments of this list were already sent")
+            return 0
+        if any(entry["raw"] for entry in journal.entries):
+            print(f"Resuming batch from {journal.path}")
+
+        preflight = endpoint.preflight(sender, token, nonce_block="pending")
+        try:
+            price, limit = contract.gas(preflight["gas_price"].result(), self.data.price, self.data.limit,
+                                        contract.LIMIT["contract" if token else "transfer"])
+            balance = preflight["balance"].result()
+            entries = journal.allocate_nonces(preflight["nonce"].result())
+            symbol = preflight["symbol"].result() if token else "ETH"
+            token_balance = preflight["token_balance"].result() if token else None
+        except wallet.RpcError as error:
+            print(error)
+            return -1
+
+        transactions = []
+        for entry in entries:
+            to = web3.Web3.to_checksum_address(entry["to"])
+            if token:
+                transaction = dict(nonce=entry["nonce"], gasPrice=price, gas=limit, to=token.address, value=0,
+                                   data=erc20.encode_call("transfer", [to, int(Decimal(entry["amount"]))]))
+            else:
+                transaction = dict(nonce=entry["nonce"], gasPrice=price, gas=limit, to=to,
+                                   value=web3.Web3.to_wei(Decimal(entry["amount"]), "ether"), data=b'')
+            transactions.append((entry, transaction))
+
+        # Transactions signed by an earlier run are broadcast again, so they are paid for too
+        unsent = journal.unsent()
+        total = sum(Decimal(entry["amount"]) for entry in entries + unsent)
+        gas_cost = price * limit * len(transactions) + journal.unsent_gas_cost()
+        if token:
+            funds_missing = token_balance < total or balance < gas_cost
+        else:
+            funds_missing = balance < gas_cost + web3.Web3.to_wei(total, "ether")
+        if funds_missing:
+            print("Not enough fund for the batch")
+            return -2
+
+        if transactions:
+            print(tabulate([["FROM:", sender],
+                            ["PAYMENTS:", f"{len(transactions)} ({len(unsent)} signed before)"],
+                            ["TOTAL:", f"{total} {symbol} base units" if token else f"{total} {symbol}"],
+                            ["NONCES:", f"{entries[0]['nonce']} - {entries[-1]['nonce']}"],
+                            ["MAX GAS:", f"{web3.Web3.from_wei(gas_cost, 'ether')} ETH"]],
+                           tablefmt="plain"), "\n")
+            conf = input("Confirm ? [y/N] > ")
+            if conf.lower() != "y":
+                print("Canceled by the user.")
+                return 0
+
+            card.derive(path=wallet.Api.PATH)
+            if card.auth_type == cryptnox_sdk_py.AuthType.PIN and len(transactions) > 1:
+                pin_code = check_pin_code(card)
+            else:
+                pin_code = ""
+            print("\nSigning with the Cryptnox")
+            for entry, transaction in transactions:
+                signature = sign(card, endpoint.transaction_hash(transaction), derivation,
+                                 path=wallet.Api.PATH, pin_code=pin_code)
+                if not signature:
+                    print("Error in getting signature")
+                    return -1
+                journal.record_signed(entry, endpoint.signed_transaction(transaction, signature, public_key))
+
+        failed = 0
+        for entry in sorted(journal.broadcast(endpoint.push_raw, endpoint.has_transaction),
+                            key=lambda item: item["line"]):
+            failed += bool(entry["error"])
+            if entry["error"]:
+                print(f"Line {entry['line']}: {entry['to']} ERROR: {entry['error']}")
+            else:
+                print(f"Line {entry['line']}: {entry['to']} nonce {entry['nonce']} {entry['hash']}")
+        if failed:
+            print(f"\n{failed} transaction(s) failed. Run the command again to retry them.")
+            return 1
+        print("\nBalance might take 30 s to be refreshed.")
+        return 0
+
     def _send_token(self, card):
         config = get_configuration(card)["eth"]
         try:
@@ -642,6 +735,6 @@ class Eth(Command):
             print("Derivation value not valid")
             return 1
 
-        contract.transfer(card, config["endpoint"], config["network"], config["api_key"],
-                          self.data.contract, self.data.address, self.data.amount, self.data.price,
-                          self.data.limit, derivation)
+        return contract.transfer(card, config["endpoint"], config["network"], config["api_key"],
+                                 self.data.contract, self.data.address, self.data.amount, self.data.price,
+                                 self.data.limit, derivation, self.data.wait)
@@ -1,145 +1,99 @@
 """
-Module for monitoring and notifying users about ERC token activities,
-transaction events, and other blockchain-related notifications using
-multiprocessing for efficient parallel processing.
+Module for notifying users about new events of the contracts added to their cards.
+
+The events are watched in the background by an asyncio event watcher while the interactive
+command line waits for input, and the counts of new events are shown at the prompt.
 """
 
-import json
-from multiprocessing import Pool
-from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, List, Tuple
 
-import requests as requests
-import web3
+from web3 import Web3
 
 try:
     from config import (
-        get_cached_serials,
-        get_configuration
+        get_cached_configuration,
+        get_cached_serials
     )
     from wallet import eth as wallet
 except ImportError:
     from ...config import (
-        get_cached_serials,
-        get_configuration
+        get_cached_configuration,
+        get_cached_serials
     )
     from ...wallet import eth as wallet
 
-ERC_PATH = Path(__file__).parent.parent.parent.joinpath("contract_abi")
-MORE_THAN_X_RESULTS = -32005
 MONTH_PERIOD_IN_BLOCKS = 4 * 30 * 24 * 60 * 4  # average of 15 s
 
 
-def _erc_abi_file(value):
-    return ERC_PATH.joinpath(f"erc{value}.json").absolute()
-
-
-def _abi(config) -> Dict[str, Any]:
-    try:
-        path = _erc_abi_file(int(config))
-    except TypeError:
-        return config
-
-    try:
-        abi = json.loads(path.read_text())
-    except (FileNotFoundError, PermissionError,
-            json.decoder.JSONDecodeError):
-        raise ValueError("ERC not recognized by the application.")
-
-    return abi
-
-
-class Notification:
-    def __init__(self):
-        self.pool = Pool(processes=10)
-        self.work = None
-        self.last_checks = {}
-
-    @staticmethod
-    def _check(data):
+def _watches() -> List[wallet.Watch]:
+    watches = []
+    for serial in list(get_cached_serials()):
         try:
-            w3 = wallet.Web3Api(None,
-                                wallet.endpoint_factory(data["endpoint"], data["network"],
-                                                        data["api_key"])).web3
-            contract = w3.eth.contract(address=data["address"], abi=data["abi"])
-            event = contract.events[data["event_name"]]
-
-            event_filter = event.createFilter(fromBlock=data["from_block"],
-                                              toBlock=data["to_block"])
+            config = get_cached_configuration(serial)
+            eth_config = config["eth"]
+            contracts = config["hidden"]["eth"]["contract"]
+        except LookupError:
+            continue
+        for alias, contract_config in contracts.items():
             try:
-                data["count"] = len(event_filter.get_all_entries())
-            except web3.exceptions.LogTopicError:
-                data["count"] = -1
-            except ValueError as error:
-                if error.args[0]["code"] == MORE_THAN_X_RESULTS:
-                    data["count"] = "More than 10 000 results"
-                else:
-                    raise
-        except Exception as error:
-            print(error)
-
-        return data
-
-    def run(self):
-        if self.work:
-            return
-
-        data = []
-        for serial in get_cached_serials():
-            config = get_configuration(serial)
-            contract_config = config["hidden"]["eth"]["contract"]
-            for alias, contract_config in contract_config.items():
-                alias_config = contract_config[alias]
-                network_name = contract_config["network"].upper()
-
-                network = wallet.Web3Api(None, wallet.endpoint_factory(config["endpoint"],
-                                                                       network_name,
-                                                                       config["api_key"]))
-                w3 = network.web3
-                contract = w3.eth.contract(
-                    address=contract_config["address"],
-                    abi=_abi(contract_config["abi"]))
-                current_block = w3.eth.block_number
-                for event in contract.events:
-                    last_check = alias_config.get(event,
-                                                  current_block - MONTH_PERIOD_IN_BLOCKS)
-                    data.append({
-                        "serial": serial,
-                        "alias": alias,
-                        "address": contract_config["address"],
-                        "abi": _abi(contract_config["abi"]),
-                        "network": contract_config["network"],
-                        "endpoint": config["endpoint"],
-                        "api_key": config["api_key"],
-                        "event_name": event.event_name,
-                        "from_block": last_check,
-                        "to_block": current_block,
-                        "count": -1
-                    })
-
-        self.work = self.pool.map_async(Notification._check, data)
-
-    def get(self):
-        results = {}
-        try:
-            self.work.wait()
-        except AttributeError:
-            return results
-        try:
-            data = self.work.get()
-        except requests.exceptions.HTTPError:
-            print("There is an issue reading event notifications.")
-            return results
-        for entry in data:
-            if entry["count"] in [-1, 0]:
+                endpoint = wallet.Api(eth_config["endpoint"], contract_config.get("network", eth_config["network"]),
+                                      eth_config["api_key"])
+                abi = wallet.get_abi(contract_config["abi"])
+            except (LookupError, ValueError):
                 continue
+            for name in dict.fromkeys(event["name"] for event in abi.events if not event.get("anonymous")):
+                watches.append(wallet.Watch((str(serial), alias, name), endpoint.endpoint.provider,
+                                            contract_config["address"], Web3.to_hex(abi.topic(name)),
+                                            contract_config.get(name), endpoint.endpoint.websocket_provider,
+                                            endpoint.endpoint.network.value))
+    return watches
 
-            if entry["serial"] not in results:
-                results[entry["serial"]] = {}
-            if entry["alias"] not in results[entry["serial"]]:
-                results[entry["serial"]][entry["alias"]] = {}
-            results[entry["serial"]][entry["alias"]][entry["event_name"]] = \
-                entry["count"]
 
-        self.work = None
+class Notification:
+    """
+    Counts new events of the contracts of the cards used in the session
+
+    :param int interval: Seconds between checks for new events
+    """
+
+    def __init__(self, interval: int = wallet.DEFAULT_INTERVAL):
+        self.watcher = wallet.EventWatcher(interval)
+        self._shown: Dict[Tuple[str, str, str], int] = {}
+
+    def run(self) -> None:
+        """
+        Watch the events of the contracts of the cards read until now, in the background
+        """
+        watches = _watches()
+        self.watcher.watch(watches)
+        if watches:
+            self.watcher.start()
+
+    def get(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        :return: Number of new events by card serial number, contract alias and event name
+        :rtype: Dict[str, Dict[str, Dict[str, int]]]
+        """
+        results = {}
+        for (serial, alias, event), count in self.watcher.counts().items():
+            results.setdefault(serial, {}).setdefault(alias, {})[event] = count
         return results
+
+    def messages(self) -> List[str]:
+        """
+        :return: Messages about the counts that changed since the last call
+        :rtype: List[str]
+        """
+        counts = self.watcher.counts()
+        result = []
+        for (serial, alias, event), count in counts.items():
+            if self._shown.get((serial, alias, event)) == count:
+                continue
+            number = "Many" if count == wallet.MANY else str(count)
+            result.append(f"Card {serial}: {number} new {event} events on {alias}. "
+                          f"Show them with: eth contract list_events {alias} {event}")
+        self._shown = counts
+        return result
+
+    def stop(self) -> None:
+        self.watcher.stop()
@@ -98,6 +98,14 @@ def _add_contract_options(subparsers):
                                                                "of this command")
         sub_parser.add_argument("alias", help="Name of the contract to list events for")
         sub_parser.add_argument("event", help="Name of the event to list")
+        sub_parser.add_argument("-f", "--from-block", type=int,
+                                help="First block to list events from instead of the last run")
+        sub_parser.add_argument("-t", "--to-block", type=int, help="Last block to list events to instead "
+                                                                   "of the latest")
+        sub_parser.add_argument("-a", "--all", action="store_true",
+                                help="List all events since the first block")
+        sub_parser.add_argument("-w", "--where", action="append", metavar="NAME=VALUE",
+                                help="List only events with the argument value, can be repeated")
 
     def _add_transact(subparsers):
         sub_parser = subparsers.add_parser("transact", help="Call a contract function")
@@ -126,6 +134,18 @@ def _add_send(subparsers):
     sub_parser.add_argument("amount", type=_validate_decimal, help="Amount to send")
     sub_parser.add_argument("-c", "--contract", type=_validate,
                             help="Contract address of the contract")
+    sub_parser.add_argument("-w", "--wait", action="store_true",
+                            help="Wait until the transaction is included in a block")
+
+    _add_options(sub_parser)
+
+
+def _add_batch(subparsers):
+    sub_parser = subparsers.add_parser("batch", help="Pay many addresses from a CSV or JSON lines file")
+    sub_parser.add_argument("file", help="File with address and amount of each payment. Amounts are in "
+                                         "ETH, or in token units with a contract")
+    sub_parser.add_argument("-c", "--contract", type=_validate,
+                            help="Contract address of the ERC20 token to pay with")
 
     _add_options(sub_parser)
 
@@ -139,5 +159,6 @@ def options(subparsers, pin_option: bool):
     action_sub_parser = eth_sub_parser.add_subparsers(dest="eth_action", required=True)
 
     _add_send(action_sub_parser)
+    _add_batch(action_sub_parser)
     _add_contract_options(action_sub_parser)
     add_config_sub_parser(action_sub_parser, "Ethereum")
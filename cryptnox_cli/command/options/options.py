@@ -87,6 +87,62 @@ def _btc_options(subparsers, interactive_mode):
                                      help="Network to use for transaction")
         send_sub_parser.add_argument("-f", "--fees", type=int,
                                      help="Fees to pay for the transaction")
+        send_sub_parser.add_argument("-b", "--blocks", type=int,
+                                     help="Number of blocks the transaction should be confirmed in, "
+                                          "for estimating the fees")
+
+    def add_batch(sub_parser):
+        batch_sub_parser = sub_parser.add_parser("batch", help="Send Bitcoin to many addresses from a CSV or "
+                                                               "JSON lines file")
+        batch_sub_parser.add_argument("file", type=str,
+                                      help="File with address and amount in BTC of each payment")
+        batch_sub_parser.add_argument("-n", "--network", choices=["mainnet", "testnet"],
+                                      help="Network to use for transactions")
+        batch_sub_parser.add_argument("-f", "--fees", type=int,
+                                      help="Fee rate in Satoshi per byte, paid by each transaction for its "
+                                           "size")
+        batch_sub_parser.add_argument("-b", "--blocks", type=int,
+                                      help="Number of blocks the transactions should be confirmed in, "
+                                           "for estimating the fees")
+        batch_sub_parser.add_argument("-m", "--max-outputs", type=IntRange(1),
+                                      help="Maximum number of payments in one transaction")
+
+    def add_psbt(sub_parser):
+        psbt_sub_parser = sub_parser.add_parser("psbt", help="Create, sign and broadcast partially signed "
+                                                             "Bitcoin transactions")
+        psbt_sub_parser.add_argument("-n", "--network", choices=["mainnet", "testnet"],
+                                     help="Network to use for transactions")
+        psbt_action_parser = psbt_sub_parser.add_subparsers(dest="psbt_action", required=True)
+
+        create_parser = psbt_action_parser.add_parser("create", help="Create PSBTs of a payment or a payment list")
+        create_parser.add_argument("address", nargs="?", help="Address where to send funds")
+        create_parser.add_argument("amount", nargs="?", type=_validate_decimal, help="Amount to send")
+        create_parser.add_argument("-p", "--payments", type=str,
+                                   help="CSV or JSON lines file with address and amount in BTC of each payment")
+        create_parser.add_argument("-o", "--output", type=str, default="payment.psbt",
+                                   help="File to write the PSBT to, numbered if there are many")
+        create_parser.add_argument("-f", "--fees", type=int,
+                                   help="Fees to pay for the transaction of a payment, fee rate in Satoshi per "
+                                        "byte for a payment list")
+        create_parser.add_argument("-b", "--blocks", type=int,
+                                   help="Number of blocks the transactions should be confirmed in, "
+                                        "for estimating the fees")
+        create_parser.add_argument("-m", "--max-outputs", type=IntRange(1),
+                                   help="Maximum number of payments in one transaction")
+
+        for action, description in (("sign", "Sign the inputs of the card in all PSBTs in one session"),
+                                    ("finalize", "Finalize signed PSBTs and show their transactions"),
+                                    ("broadcast", "Finalize and broadcast signed PSBTs in parallel")):
+            action_parser = psbt_action_parser.add_parser(action, help=description)
+            action_parser.add_argument("files", nargs="+", help="PSBT files")
+
+    def add_history(sub_parser):
+        history_sub_parser = sub_parser.add_parser("history", help="Show transactions of the Bitcoin address "
+                                                                   "of the card")
+        history_sub_parser.add_argument("-n", "--network", choices=["mainnet", "testnet"],
+                                        help="Network to show the transactions from")
+        history_sub_parser.add_argument("-a", "--all", action="store_true",
+                                        help="Show all transactions without asking between pages")
 
     btc_sub_parser = subparsers.add_parser(enums.Command.BTC.value, help="Bitcoin commands")
     if interactive_mode:
@@ -95,6 +151,9 @@ def _btc_options(subparsers, interactive_mode):
     action_sub_parser = btc_sub_parser.add_subparsers(dest="action", required=True)
 
     add_send(action_sub_parser)
+    add_batch(action_sub_parser)
+    add_psbt(action_sub_parser)
+    add_history(action_sub_parser)
     add_config_sub_parser(action_sub_parser, "Bitcoin")
 
 
@@ -102,3 +102,15 @@ def read_card_config(card: cryptnox_sdk_py.Card) -> Dict:
 
 def get_cached_serials():
     return _CONFIGURATION.keys()
+
+
+def get_cached_configuration(serial_number: str) -> Dict:
+    """
+    Get the configuration of a card already read in this session
+
+    :param str serial_number: Serial number of the card
+    :return: Configuration of the card
+    :rtype: dict
+    :raises KeyError: Configuration of the card wasn't read
+    """
+    return _CONFIGURATION[serial_number]
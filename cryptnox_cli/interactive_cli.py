@@ -227,6 +227,7 @@ class InteractiveCli:
 
         self.subcommand = []
         self.parser = None
+        self._notification = None
 
     def run(self) -> int:
         print("Loading cards...")
@@ -244,13 +245,31 @@ class InteractiveCli:
 
         while True:
             try:
+                self._notify()
                 self._process_command()
             except InteractiveCli.ExitException:
                 self._close_client(client)
                 break
 
+        if self._notification:
+            self._notification.stop()
+
         return 0
 
+    def _notify(self) -> None:
+        if self._notification is None:
+            try:
+                from command.helper.notification import Notification
+            except ImportError:
+                from .command.helper.notification import Notification
+            self._notification = Notification()
+
+        # Events of contracts of the cards used until now are counted in the background
+        self._notification.run()
+        messages = self._notification.messages()
+        if messages:
+            print("\n".join(messages) + "\n")
+
     def _client(self):
         if not self.port:
             return None
@@ -11,6 +11,7 @@ from .mnemonic import *
 from .specials import *
 from .stealth import *
 from .transaction import *
+from .psbt import *
 from .coins import *
 from .keystore import *
 from .wallet import *
@@ -3,53 +3,300 @@
 """
 Block header encoding/decoding utilities and related primitives.
 """
+import hashlib
+
+from . import headers
 from .main import *
 
 
 def serialize_header(inp):
     o = encode(inp['version'], 256, 4)[::-1] + \
-        inp['prevhash'].decode('hex')[::-1] + \
-        inp['merkle_root'].decode('hex')[::-1] + \
+        safe_from_hex(inp['prevhash'])[::-1] + \
+        safe_from_hex(inp['merkle_root'])[::-1] + \
         encode(inp['timestamp'], 256, 4)[::-1] + \
         encode(inp['bits'], 256, 4)[::-1] + \
         encode(inp['nonce'], 256, 4)[::-1]
-    h = bin_sha256(bin_sha256(o))[::-1].encode('hex')
-    assert h == inp['hash'], (sha256(o), inp['hash'])
-    return o.encode('hex')
+    h = bytes_to_hex_string(headers.header_hash(o)[::-1])
+    assert h == inp['hash'], (h, inp['hash'])
+    return bytes_to_hex_string(o)
 
 
 def deserialize_header(inp):
-    inp = inp.decode('hex')
+    header = headers.parse_header(safe_from_hex(inp) if isinstance(inp, str) else inp)
     return {
-        "version": decode(inp[:4][::-1], 256),
-        "prevhash": inp[4:36][::-1].encode('hex'),
-        "merkle_root": inp[36:68][::-1].encode('hex'),
-        "timestamp": decode(inp[68:72][::-1], 256),
-        "bits": decode(inp[72:76][::-1], 256),
-        "nonce": decode(inp[76:80][::-1], 256),
-        "hash": bin_sha256(bin_sha256(inp))[::-1].encode('hex')
+        "version": header.version,
+        "prevhash": bytes_to_hex_string(header.prevhash[::-1]),
+        "merkle_root": bytes_to_hex_string(header.merkle_root[::-1]),
+        "timestamp": header.timestamp,
+        "bits": header.bits,
+        "nonce": header.nonce,
+        "hash": bytes_to_hex_string(header.hash[::-1])
     }
 
 
-def mk_merkle_proof(header, hashes, index):
-    nodes = [safe_from_hex(h)[::-1] for h in hashes]
-    if len(nodes) % 2 and len(nodes) > 2:
-        nodes.append(nodes[-1])
-    layers = [nodes]
-    while len(nodes) > 1:
-        newnodes = []
-        for i in range(0, len(nodes) - 1, 2):
-            newnodes.append(bin_sha256(bin_sha256(nodes[i] + nodes[i+1])))
-        if len(newnodes) % 2 and len(newnodes) > 2:
-            newnodes.append(newnodes[-1])
-        nodes = newnodes
-        layers.append(nodes)
+def verify_header_chain(inp, params=headers.MAINNET, state=None):
+    """
+    Verify linkage and proof of work of concatenated headers in hex or binary format,
+    see headers.verify_headers
+    """
+    return headers.verify_headers(safe_from_hex(inp) if isinstance(inp, str) else inp, params, state)
+
+
+def _merkle_parent(left, right):
+    return hashlib.sha256(hashlib.sha256(left + right).digest()).digest()
+
+
+def _merkle_leaf(txhash):
+    """
+    Transaction hash in internal byte order, from hex in display order or 32 raw bytes
+    """
+    if isinstance(txhash, str):
+        return bytes.fromhex(txhash)[::-1]
+    return bytes(txhash)
+
+
+def _merkle_level_sizes(leaf_count):
+    sizes = [leaf_count]
+    while sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+
+class MerkleTree:
+    """
+    Merkle tree of the transactions in a block, hashed once and kept as arrays of byte
+    level nodes so proofs are served without rehashing
+
+    An odd node at the end of a level is paired with itself, as in Bitcoin.
+
+    :param hashes: Transaction hashes in hex format as shown by explorers, or 32 bytes in
+                   internal byte order
+    """
+
+    def __init__(self, hashes):
+        nodes = [_merkle_leaf(h) for h in hashes]
+        if not nodes:
+            raise ValueError("Merkle tree needs at least one transaction hash")
+        self.levels = [nodes]
+        while len(nodes) > 1:
+            if len(nodes) % 2:
+                nodes = nodes + [nodes[-1]]
+            nodes = [_merkle_parent(nodes[i], nodes[i + 1]) for i in range(0, len(nodes), 2)]
+            self.levels.append(nodes)
+        self._positions = None
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self) -> bytes:
+        """
+        :return: Merkle root in internal byte order
+        :rtype: bytes
+        """
+        return self.levels[-1][0]
+
+    @property
+    def root_hex(self) -> str:
+        """
+        :return: Merkle root in hex format as stored in block explorers
+        :rtype: str
+        """
+        return self.root[::-1].hex()
+
+    def index(self, txhash) -> int:
+        """
+        Position of the transaction in the block
+
+        :param txhash: Transaction hash in hex or binary format
+        :return: Index of the transaction
+        :rtype: int
+        :raises ValueError: Transaction is not part of the tree
+        """
+        if self._positions is None:
+            self._positions = {}
+            for position, leaf in enumerate(self.levels[0]):
+                self._positions.setdefault(leaf, position)
+        try:
+            return self._positions[_merkle_leaf(txhash)]
+        except KeyError:
+            raise ValueError("Transaction is not part of the merkle tree") from None
+
+    def _sibling(self, level, position):
+        nodes = self.levels[level]
+        sibling = position ^ 1
+        return nodes[sibling] if sibling < len(nodes) else nodes[position]
+
+    def proof(self, index: int) -> list:
+        """
+        Sibling hashes from the leaf up to the root
+
+        :param int index: Index of the transaction
+        :return: Siblings in internal byte order
+        :rtype: List[bytes]
+        """
+        if not 0 <= index < len(self):
+            raise IndexError("Transaction index out of range")
+        return [self._sibling(level, index >> level) for level in range(len(self.levels) - 1)]
+
+    def batch_proof(self, indexes) -> dict:
+        """
+        Single proof for many transactions of the block holding every node that can't be
+        computed from the proven transactions themselves
+
+        :param indexes: Indexes of the transactions to prove
+        :return: Proof with the leaf count, the sorted indexes and the needed nodes in order
+                 of use, see verify_merkle_batch_proof
+        :rtype: dict
+        """
+        known = sorted(set(indexes))
+        if not known:
+            raise ValueError("No transactions to prove")
+        if known[0] < 0 or known[-1] >= len(self):
+            raise IndexError("Transaction index out of range")
+        proven = known
+        nodes = []
+        for level in range(len(self.levels) - 1):
+            positions = set(known)
+            for position in known:
+                sibling = position ^ 1
+                if sibling not in positions and sibling < len(self.levels[level]):
+                    nodes.append(self.levels[level][sibling])
+            known = sorted({position >> 1 for position in known})
+        return {
+            "leaf_count": len(self),
+            "indexes": proven,
+            "hashes": [self.levels[0][i][::-1].hex() for i in proven],
+            "nodes": [node[::-1].hex() for node in nodes],
+            "merkle_root": self.root_hex
+        }
+
+
+def merkle_root_from_proof(txhash, index, siblings):
+    """
+    Compute the merkle root from a transaction and its siblings
+
+    :param txhash: Transaction hash in hex or binary format
+    :param int index: Index of the transaction in the block
+    :param siblings: Sibling hashes, in the same format as the transaction hash
+    :return: Merkle root in internal byte order
+    :rtype: bytes
+    """
+    node = _merkle_leaf(txhash)
+    for sibling in siblings:
+        sibling = _merkle_leaf(sibling)
+        node = _merkle_parent(sibling, node) if index & 1 else _merkle_parent(node, sibling)
+        index >>= 1
+    return node
+
+
+def verify_merkle_proof(txhash, proof, merkle_root) -> bool:
+    """
+    Check a proof as returned by mk_merkle_proof or a tuple of index and siblings
+
+    :param txhash: Transaction hash in hex or binary format
+    :param proof: Proof of the transaction
+    :param merkle_root: Expected root in the same format as the transaction hash
+    :return: Whether the proof leads to the root
+    :rtype: bool
+    """
+    if isinstance(proof, dict):
+        index, siblings = proof["index"], proof["siblings"]
+    else:
+        index, siblings = proof
+    return merkle_root_from_proof(txhash, index, siblings) == _merkle_leaf(merkle_root)
+
+
+def verify_merkle_proofs(items) -> list:
+    """
+    Check many proofs at once
+
+    Pairs shared between proofs of the same block are hashed only once.
+
+    :param items: Iterable of (txhash, proof, merkle_root) triples, see verify_merkle_proof
+    :return: Result for each triple in the same order
+    :rtype: List[bool]
+    """
+    parents = {}
+    results = []
+    for txhash, proof, merkle_root in items:
+        if isinstance(proof, dict):
+            index, siblings = proof["index"], proof["siblings"]
+        else:
+            index, siblings = proof
+        node = _merkle_leaf(txhash)
+        for sibling in siblings:
+            sibling = _merkle_leaf(sibling)
+            pair = sibling + node if index & 1 else node + sibling
+            try:
+                node = parents[pair]
+            except KeyError:
+                node = parents[pair] = _merkle_parent(pair[:32], pair[32:])
+            index >>= 1
+        results.append(node == _merkle_leaf(merkle_root))
+    return results
+
+
+def verify_merkle_batch_proof(proof, merkle_root=None) -> bool:
+    """
+    Check a proof built by MerkleTree.batch_proof
+
+    :param dict proof: Batch proof
+    :param merkle_root: Expected root in hex or binary format, taken from the proof when None
+    :return: Whether all transactions of the proof lead to the root
+    :rtype: bool
+    """
+    if merkle_root is None:
+        merkle_root = proof["merkle_root"]
+    indexes = proof["indexes"]
+    if len(indexes) != len(proof["hashes"]) or list(indexes) != sorted(set(indexes)):
+        return False
+    sizes = _merkle_level_sizes(proof["leaf_count"])
+    if not indexes or indexes[0] < 0 or indexes[-1] >= sizes[0]:
+        return False
+    known = dict(zip(indexes, (_merkle_leaf(h) for h in proof["hashes"])))
+    nodes = iter(proof["nodes"])
+    try:
+        for size in sizes[:-1]:
+            parents = {}
+            for position in sorted(known):
+                parent = position >> 1
+                if parent in parents:
+                    continue
+                sibling = position ^ 1
+                if sibling >= size:
+                    sibling_node = known[position]
+                elif sibling in known:
+                    sibling_node = known[sibling]
+                else:
+                    sibling_node = _merkle_leaf(next(nodes))
+                if position & 1:
+                    parents[parent] = _merkle_parent(sibling_node, known[position])
+                else:
+                    parents[parent] = _merkle_parent(known[position], sibling_node)
+            known = parents
+    except StopIteration:
+        return False
+    if next(nodes, None) is not None:
+        return False
+    return known.get(0) == _merkle_leaf(merkle_root)
+
+
+def mk_merkle_proof(header, hashes, index, tree=None):
+    """
+    Proof that the transaction at index is part of the block
+
+    :param dict header: Block header with the merkle root in hex format
+    :param hashes: Transaction hashes of the block in hex format
+    :param int index: Index of the transaction to prove
+    :param MerkleTree tree: Tree of the block to reuse between proofs, built from hashes when None
+    """
+    tree = tree or MerkleTree(hashes)
     # Sanity check, make sure merkle root is valid
-    assert bytes_to_hex_string(nodes[0][::-1]) == header['merkle_root']
-    merkle_siblings = \
-        [layers[i][(index >> i) ^ 1] for i in range(len(layers)-1)]
+    assert tree.root_hex == header['merkle_root']
     return {
         "hash": hashes[index],
-        "siblings": [bytes_to_hex_string(x[::-1]) for x in merkle_siblings],
+        "index": index,
+        "siblings": [x[::-1].hex() for x in tree.proof(index)],
         "header": header
     }
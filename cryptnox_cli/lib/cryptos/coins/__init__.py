@@ -5,5 +5,6 @@ Re-exports available coin implementations for convenience.
 """
 
 from .bitcoin import *
+from .registry import get_coin, register_coin
 
-__all__ = ['Bitcoin']
+__all__ = ['Bitcoin', 'get_coin', 'register_coin']
@@ -3,8 +3,13 @@
 """
 Base classes and shared logic for UTXO-based coin implementations.
 """
-from .. import segwit_addr
-from ..blocks import mk_merkle_proof
+import copy
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from .. import script_cache, segwit_addr
+from ..blocks import MerkleTree, mk_merkle_proof
 # from ..explorers import blockchain
 # from ..electrumx_client.rpc import ElectrumXClient
 from ..keystore import *
@@ -13,6 +18,11 @@ from ..transaction import *
 from ..wallet import *
 
 
+@functools.lru_cache(maxsize=None)
+def _prefixes(magicbyte):
+    return magicbyte_to_prefix(magicbyte=magicbyte)
+
+
 class BaseCoin(object):
     """
     Base implementation of crypto coin class
@@ -26,7 +36,8 @@ class BaseCoin(object):
     magicbyte = None
     script_magicbyte = None
     segwit_hrp = None
-    # explorer = blockchain
+    explorer = None
+    explorer_workers = 8
     # client = ElectrumXClient
     client_kwargs = {
         'server_file': 'bitcoin.json',
@@ -83,14 +94,45 @@ class BaseCoin(object):
                     "Due to explorer limitations, testnet support for this coin has not been implemented yet!")
             else:
                 raise NotImplementedError("Support for this coin has not been implemented yet!")
-        self.address_prefixes = magicbyte_to_prefix(magicbyte=self.magicbyte)
+        self.address_prefixes = _prefixes(self.magicbyte)
         if self.script_magicbyte:
-            self.script_prefixes = magicbyte_to_prefix(magicbyte=self.script_magicbyte)
+            self.script_prefixes = _prefixes(self.script_magicbyte)
         else:
             self.script_prefixes = ()
+        self.xprv_header_bytes = MappingProxyType(
+            {xtype: encode(header, 256, 4) for xtype, header in self.xprv_headers.items()})
+        self.xpub_header_bytes = MappingProxyType(
+            {xtype: encode(header, 256, 4) for xtype, header in self.xpub_headers.items()})
+        self.script_templates = script_cache.TEMPLATES
         self.secondary_hashcode = self.secondary_hashcode or self.hashcode
         self._rpc_client = None
 
+    def __setattr__(self, key, value):
+        if getattr(self, '_frozen', False) and not key.startswith('_'):
+            raise AttributeError("Coin %s is shared and can't be modified, create a new instance instead" %
+                                 self.coin_symbol)
+        super().__setattr__(key, value)
+
+    def freeze(self):
+        """
+        Make public attributes read only so the instance can be shared, see coins.registry
+        """
+        self._frozen = True
+        return self
+
+    @property
+    def frozen(self):
+        return getattr(self, '_frozen', False)
+
+    def bip32_prefixes(self, xtype, electrum=False):
+        """
+        Version bytes of extended private and public keys for the script type
+        """
+        if electrum:
+            return (encode(self.electrum_xprv_headers[xtype], 256, 4),
+                    encode(self.electrum_xpub_headers[xtype], 256, 4))
+        return self.xprv_header_bytes[xtype], self.xpub_header_bytes[xtype]
+
     @property
     def rpc_client(self):
         """
@@ -100,35 +142,62 @@ class BaseCoin(object):
             self._rpc_client = self.client(**self.client_kwargs)
         return self._rpc_client
 
+    def with_explorer(self, explorer):
+        """
+        Copy of the coin using the explorer for blockchain queries. Shared coins are read only so the
+        explorer is bound on a copy.
+        """
+        coin = copy.copy(self)
+        object.__setattr__(coin, 'explorer', explorer)
+        return coin
+
+    def _get_explorer(self):
+        if self.explorer is None:
+            raise Exception("No explorer set for %s, use with_explorer" % self.display_name)
+        return self.explorer
+
     def unspent(self, *addrs):
         """
         Get unspent transactions for addresses
         """
-        return self.rpc_client.unspent(*addrs)
+        return self._get_explorer().unspent(*addrs, coin_symbol=self.coin_symbol)
 
     def history(self, *addrs, **kwargs):
         """
         Get transaction history for addresses
         """
-        return self.explorer.history(*addrs, coin_symbol=self.coin_symbol)
+        return self._get_explorer().history(*addrs, coin_symbol=self.coin_symbol)
 
     def fetchtx(self, tx):
         """
         Fetch a tx from the blockchain
         """
-        return self.explorer.fetchtx(tx, coin_symbol=self.coin_symbol)
+        return self._get_explorer().fetchtx(tx, coin_symbol=self.coin_symbol)
+
+    def fetchtxs(self, txs):
+        """
+        Fetch many txs from the blockchain in parallel, each unique hash only once. Returns a dict of raw txs by hash.
+        """
+        explorer = self._get_explorer()
+        if hasattr(explorer, 'fetchtxs'):
+            return explorer.fetchtxs(txs)
+        txs = list(dict.fromkeys(txs))
+        if len(txs) < 2:
+            return {tx: self.fetchtx(tx) for tx in txs}
+        with ThreadPoolExecutor(max_workers=min(self.explorer_workers, len(txs))) as executor:
+            return dict(zip(txs, executor.map(self.fetchtx, txs)))
 
     def txinputs(self, tx):
         """
         Fetch inputs of a transaction on the blockchain
         """
-        return self.explorer.txinputs(tx, coin_symbol=self.coin_symbol)
+        return self._get_explorer().txinputs(tx, coin_symbol=self.coin_symbol)
 
     def pushtx(self, tx):
         """
         Push/ Broadcast a transaction to the blockchain
         """
-        return self.explorer.push_tx(tx, coin_symbol=self.coin_symbol)
+        return self._get_explorer().push_tx(tx, coin_symbol=self.coin_symbol)
 
     def privtopub(self, privkey):
         """
@@ -162,6 +231,15 @@ class BaseCoin(object):
         all_prefixes = ''.join(list(self.address_prefixes) + list(self.script_prefixes))
         return any(str(i) == addr[0] for i in all_prefixes)
 
+    def validate_addresses(self, addresses):
+        """
+        Check many addresses for this chain at once, for example payout lists
+
+        :return: List of script_cache.AddressCheck in the order of given addresses
+        """
+        return script_cache.validate_addresses(addresses, self.magicbyte, self.script_magicbyte,
+                                               self.segwit_hrp)
+
     def is_p2sh(self, addr):
         """
         Check if addr is a a pay to script address
@@ -172,7 +250,8 @@ class BaseCoin(object):
         """
         Convert an output script to an address
         """
-        return output_script_to_address(script, self.magicbyte)
+        return script_cache.script_to_address(script, self.magicbyte, self.script_magicbyte,
+                                              self.segwit_hrp)
 
     def scripttoaddr(self, script):
         """
@@ -196,16 +275,10 @@ class BaseCoin(object):
 
     def addrtoscript(self, addr):
         """
-        Convert an output address to a script
+        Convert an output address to a script. Conversions are cached, see script_cache.
         """
-        if self.segwit_hrp:
-            witver, witprog = segwit_addr.decode(self.segwit_hrp, addr)
-            if witprog is not None:
-                return mk_p2w_scripthash_script(witver, witprog)
-        if self.is_p2sh(addr):
-            return mk_scripthash_script(addr)
-        else:
-            return mk_pubkey_script(addr)
+        return script_cache.address_to_script(addr, self.magicbyte, self.script_magicbyte,
+                                              self.segwit_hrp)
 
     def pubtop2w(self, pub):
         """
@@ -506,23 +579,25 @@ class BaseCoin(object):
         return self.mksend(*argz, segwit=segwit)
 
     def block_height(self, txhash):
-        return self.explorer.block_height(txhash, coin_symbol=self.coin_symbol)
+        return self._get_explorer().block_height(txhash, coin_symbol=self.coin_symbol)
 
     def current_block_height(self):
-        return self.explorer.current_block_height(coin_symbol=self.coin_symbol)
+        return self._get_explorer().current_block_height(coin_symbol=self.coin_symbol)
 
     def block_info(self, height):
-        return self.explorer.block_info(height, coin_symbol=self.coin_symbol)
+        return self._get_explorer().block_info(height, coin_symbol=self.coin_symbol)
 
     def inspect(self, tx):
         if not isinstance(tx, dict):
             tx = deserialize(tx)
+        parents = {h: deserialize(raw) for h, raw in
+                   self.fetchtxs(_in['outpoint']['hash'] for _in in tx['ins']).items()}
         isum = 0
         ins = {}
         for _in in tx['ins']:
             h = _in['outpoint']['hash']
             i = _in['outpoint']['index']
-            prevout = deserialize(self.fetchtx(h))['outs'][i]
+            prevout = parents[h]['outs'][i]
             isum += prevout['value']
             a = self.scripttoaddr(prevout['script'])
             ins[a] = ins.get(a, 0) + prevout['value']
@@ -552,6 +627,27 @@ class BaseCoin(object):
             raise Exception("Merkle proof failed because transaction %s is not part of the main chain" % txhash)
         return mk_merkle_proof(blockinfo, hashes, i)
 
+    def merkle_prove_many(self, txhashes):
+        """
+        Prove many transactions, building the merkle tree of each block only once. Only run on
+        txs with at least 1 confirmation.
+        """
+        blocks = {}
+        proofs = []
+        for txhash in txhashes:
+            blocknum = self.block_height(txhash)
+            if blocknum not in blocks:
+                blockinfo = self.block_info(blocknum)
+                hashes = blockinfo.pop('tx_hashes')
+                blocks[blocknum] = (blockinfo, hashes, MerkleTree(hashes))
+            blockinfo, hashes, tree = blocks[blocknum]
+            try:
+                i = tree.index(txhash)
+            except ValueError:
+                raise Exception("Merkle proof failed because transaction %s is not part of the main chain" % txhash)
+            proofs.append(mk_merkle_proof(blockinfo, hashes, i, tree))
+        return proofs
+
     def encode_privkey(self, privkey, formt, script_type="p2pkh"):
         return encode_privkey(privkey, formt=formt, vbyte=self.wif_prefix + self.wif_script_types[script_type])
 
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Shared coin instances, one per coin and network.
+
+Creating a coin computes its address prefixes and extended key headers, so instances are built
+once, frozen and handed out to every caller.
+"""
+import threading
+
+from .base import BaseCoin
+from .bitcoin import Bitcoin
+
+MAINNET = "mainnet"
+TESTNET = "testnet"
+
+_COINS = {
+    "btc": Bitcoin,
+}
+_INSTANCES = {}
+_LOCK = threading.Lock()
+
+
+def _is_testnet(network) -> bool:
+    if isinstance(network, bool):
+        return network
+    network = str(network).lower()
+    if network not in (MAINNET, TESTNET):
+        raise ValueError(f"Unknown network: {network}")
+    return network == TESTNET
+
+
+def register_coin(symbol: str, coin_class) -> None:
+    """
+    Make a coin class available through get_coin
+
+    :param str symbol: Symbol the coin is looked up by, case insensitive
+    :param coin_class: Subclass of BaseCoin
+    """
+    if not issubclass(coin_class, BaseCoin):
+        raise TypeError("Coin class has to be a subclass of BaseCoin")
+    with _LOCK:
+        _COINS[symbol.lower()] = coin_class
+        for key in [key for key in _INSTANCES if key[0] == symbol.lower()]:
+            del _INSTANCES[key]
+
+
+def get_coin(symbol: str = "btc", network=MAINNET) -> BaseCoin:
+    """
+    Get the shared instance of the coin for the network
+
+    :param str symbol: Symbol of the coin, case insensitive
+    :param network: Name of the network, mainnet or testnet, or True for testnet
+    :return: Frozen coin instance
+    :rtype: BaseCoin
+    :raises ValueError: Coin or network is not known
+    """
+    key = (symbol.lower(), _is_testnet(network))
+    try:
+        return _INSTANCES[key]
+    except KeyError:
+        pass
+    with _LOCK:
+        if key not in _INSTANCES:
+            try:
+                coin_class = _COINS[key[0]]
+            except KeyError:
+                raise ValueError(f"Unknown coin: {symbol}") from None
+            _INSTANCES[key] = coin_class(testnet=key[1]).freeze()
+        return _INSTANCES[key]
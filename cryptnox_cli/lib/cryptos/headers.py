@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Block header chain verification and a memory-mapped header store for SPV checks.
+
+Headers are handled as raw 80 byte records. Parsing is done on memoryview slices of the
+concatenated headers so that verifying a large chain doesn't copy or hex encode every header.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+
+HEADER_SIZE = 80
+HASH_SIZE = 32
+_INDEX_RECORD_SIZE = 2 * HASH_SIZE
+_HEADER_FORMAT = struct.Struct("<I32s32sIII")
+_NULL_HASH = b"\x00" * HASH_SIZE
+
+# Checkpoints are header hashes in displayed hex format by height, the genesis block at least, so
+# a chain can't be made up from scratch. allow_min_difficulty is the testnet rule letting a block
+# more than two target spacings after the previous one use the proof of work limit.
+ChainParams = namedtuple("ChainParams", ["name", "pow_limit", "retarget_interval", "target_timespan",
+                                         "allow_min_difficulty", "checkpoints", "no_retargeting"],
+                         defaults=({}, False))
+Header = namedtuple("Header", ["version", "prevhash", "merkle_root", "timestamp", "bits", "nonce",
+                               "hash"])
+
+MAINNET = ChainParams("mainnet", 0x00000000ffff << 208, 2016, 14 * 24 * 60 * 60, False,
+                      {0: "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f"})
+TESTNET = ChainParams("testnet", 0x00000000ffff << 208, 2016, 14 * 24 * 60 * 60, True,
+                      {0: "000000000933ea01ad0ee984209779baaec3ced90fa3f408719526f8d77f4943"})
+REGTEST = ChainParams("regtest", 0x7fffff << 232, 2016, 14 * 24 * 60 * 60, True,
+                      {0: "0f9188f13cb7b2c71f2a335e3a4fc328bf5beb436012afca590b1a11466e2206"}, True)
+
+
+class HeaderChainError(Exception):
+    """
+    Header chain is not valid
+
+    :param str message: Description of the issue
+    :param int height: Height of the offending header
+    """
+
+    def __init__(self, message: str, height: int = None):
+        super().__init__(message if height is None else f"{message} at height {height}")
+        self.height = height
+
+
+def bits_to_target(bits: int) -> int:
+    """
+    Convert the compact difficulty representation into the target
+
+    :param int bits: Compact target from the header
+    :return: Target the header hash has to be under
+    :rtype: int
+    """
+    exponent = bits >> 24
+    mantissa = bits & 0x7fffff
+    if bits & 0x800000:
+        raise ValueError("Negative target")
+    if exponent <= 3:
+        return mantissa >> 8 * (3 - exponent)
+    return mantissa << 8 * (exponent - 3)
+
+
+def target_to_bits(target: int) -> int:
+    """
+    Convert the target into its compact difficulty representation
+
+    :param int target: Target to convert
+    :return: Compact target
+    :rtype: int
+    """
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << 8 * (3 - size)
+    else:
+        mantissa = target >> 8 * (size - 3)
+    if mantissa & 0x800000:
+        mantissa >>= 8
+        size += 1
+    return size << 24 | mantissa
+
+
+def target_to_work(target: int) -> int:
+    """
+    :param int target: Target of the header
+    :return: Expected number of hashes needed to find a header under the target
+    :rtype: int
+    """
+    return (1 << 256) // (target + 1)
+
+
+def header_hash(header) -> bytes:
+    """
+    :param header: Raw 80 byte header
+    :return: Header hash in internal byte order (reverse of the displayed hash)
+    :rtype: bytes
+    """
+    return hashlib.sha256(hashlib.sha256(header).digest()).digest()
+
+
+def parse_header(header) -> Header:
+    """
+    Parse a raw header into its fields
+
+    Hashes in the result are in internal byte order.
+
+    :param header: Raw 80 byte header
+    :return: Parsed header
+    :rtype: Header
+    """
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Header must be {HEADER_SIZE} bytes long")
+    return Header(*_HEADER_FORMAT.unpack_from(header), header_hash(header))
+
+
+def iter_headers(data):
+    """
+    Iterate over concatenated raw headers without copying them
+
+    :param data: Bytes like object with concatenated headers
+    :return: Generator of memoryview slices, one per header
+    """
+    view = memoryview(data)
+    if len(view) % HEADER_SIZE:
+        raise ValueError(f"Header data length must be a multiple of {HEADER_SIZE}")
+    for offset in range(0, len(view), HEADER_SIZE):
+        yield view[offset:offset + HEADER_SIZE]
+
+
+def next_target(params: ChainParams, last_bits: int, first_timestamp: int, last_timestamp: int) -> int:
+    """
+    Target for the first block of a new retarget period
+
+    :param ChainParams params: Chain parameters
+    :param int last_bits: Bits of the last block in the finished period
+    :param int first_timestamp: Timestamp of the first block in the finished period
+    :param int last_timestamp: Timestamp of the last block in the finished period
+    :return: New target
+    :rtype: int
+    """
+    timespan = min(max(last_timestamp - first_timestamp, params.target_timespan // 4),
+                   params.target_timespan * 4)
+    target = bits_to_target(last_bits) * timespan // params.target_timespan
+    return min(target, params.pow_limit)
+
+
+class ChainState:
+    """
+    Tip of a verified header chain needed to continue verification
+
+    :param int height: Height of the tip, -1 for an empty chain
+    :param bytes tip_hash: Hash of the tip in internal byte order
+    :param int bits: Bits of the tip
+    :param int timestamp: Timestamp of the tip
+    :param int chainwork: Cumulative work up to and including the tip
+    :param period_start: Callable returning the timestamp of the header at the given height
+    :param int period_bits: Bits of the last header not mined with the testnet minimum difficulty,
+                            the bits of the tip by default
+    """
+
+    def __init__(self, height: int = -1, tip_hash: bytes = None, bits: int = None,
+                 timestamp: int = None, chainwork: int = 0, period_start=None, period_bits: int = None):
+        self.height = height
+        self.tip_hash = tip_hash
+        self.bits = bits
+        self.timestamp = timestamp
+        self.chainwork = chainwork
+        self.period_start = period_start
+        self.period_bits = bits if period_bits is None else period_bits
+
+
+def verify_headers(data, params: ChainParams = MAINNET, state: ChainState = None,
+                   on_header=None) -> ChainState:
+    """
+    Verify proof of work and linkage of concatenated headers
+
+    Each header must reference the previous one, its hash must be under the target of its bits
+    and the bits must follow the difficulty adjustment rules. Difficulty adjustment is only
+    checked when timestamps of the retarget period are available. Headers at the heights of the
+    checkpoints must have their hashes, so a new chain has to start with the genesis block.
+
+    :param data: Bytes like object with concatenated raw headers
+    :param ChainParams params: Parameters of the chain
+    :param ChainState state: State of the chain the headers continue, None for a new chain
+    :param on_header: Callable receiving the height, raw header, hash and chainwork for every
+                      verified header
+    :return: State of the chain after the last header
+    :rtype: ChainState
+    :raises HeaderChainError: A header is not valid
+    """
+    state = state or ChainState()
+    height = state.height
+    previous_hash = state.tip_hash
+    previous_bits = state.bits
+    previous_timestamp = state.timestamp
+    chainwork = state.chainwork
+    period_bits = state.period_bits
+    period_timestamps = {}
+    unpack = _HEADER_FORMAT.unpack_from
+    interval = params.retarget_interval
+    min_difficulty_bits = target_to_bits(params.pow_limit)
+    min_difficulty_delay = 2 * params.target_timespan // interval
+    checkpoints = {height: bytes.fromhex(block_hash)[::-1] for height, block_hash in params.checkpoints.items()}
+
+    for header in iter_headers(data):
+        height += 1
+        _, prevhash, _, timestamp, bits, _ = unpack(header)
+        block_hash = header_hash(header)
+
+        if previous_hash is not None and prevhash != previous_hash:
+            raise HeaderChainError("Header doesn't link to the previous header", height)
+        if height in checkpoints and block_hash != checkpoints[height]:
+            raise HeaderChainError("Header doesn't match the checkpoint", height)
+
+        try:
+            target = bits_to_target(bits)
+        except ValueError as error:
+            raise HeaderChainError(str(error), height) from error
+        if target <= 0 or target > params.pow_limit:
+            raise HeaderChainError("Target out of range", height)
+        if int.from_bytes(block_hash, "little") > target:
+            raise HeaderChainError("Insufficient proof of work", height)
+
+        if previous_bits is not None:
+            if params.no_retargeting or height % interval:
+                if params.allow_min_difficulty and not params.no_retargeting and \
+                        timestamp > previous_timestamp + min_difficulty_delay:
+                    expected_bits = min_difficulty_bits
+                else:
+                    # Testnet blocks at the minimum difficulty don't change the difficulty
+                    expected_bits = period_bits if params.allow_min_difficulty else previous_bits
+                if bits != expected_bits:
+                    raise HeaderChainError("Unexpected difficulty change", height)
+            else:
+                first_height = height - interval
+                first_timestamp = period_timestamps.get(first_height)
+                if first_timestamp is None and state.period_start and first_height >= 0:
+                    first_timestamp = state.period_start(first_height)
+                if first_timestamp is not None:
+                    expected = next_target(params, previous_bits, first_timestamp, previous_timestamp)
+                    if bits != target_to_bits(expected):
+                        raise HeaderChainError("Invalid difficulty adjustment", height)
+
+        if height % interval == 0:
+            period_timestamps[height] = timestamp
+        if height % interval == 0 or bits != min_difficulty_bits:
+            period_bits = bits
+
+        chainwork += target_to_work(target)
+        if on_header:
+            on_header(height, header, block_hash, chainwork)
+
+        previous_hash = block_hash
+        previous_bits = bits
+        previous_timestamp = timestamp
+
+    return ChainState(height, previous_hash, previous_bits, previous_timestamp, chainwork,
+                      state.period_start, period_bits)
+
+
+class HeaderStore:
+    """
+    Append only store of verified headers backed by memory-mapped files
+
+    Headers are kept in ``path`` as consecutive 80 byte records, so the header at a height is at
+    offset ``height * 80``. A sidecar ``path.idx`` file keeps the hash and cumulative work of every
+    header at the same position, which serves as the height index.
+
+    :param str path: File where headers are stored
+    :param ChainParams params: Parameters of the chain
+    """
+
+    def __init__(self, path, params: ChainParams = MAINNET):
+        self.path = os.fspath(path)
+        self.index_path = self.path + ".idx"
+        self.params = params
+        self._lock = threading.RLock()
+        self._heights = None
+        self._headers_map = None
+        self._index_map = None
+        for file_path in (self.path, self.index_path):
+            if not os.path.exists(file_path):
+                open(file_path, "wb").close()
+        self._map()
+
+    def __len__(self) -> int:
+        return len(self._headers_map) // HEADER_SIZE if self._headers_map else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def height(self) -> int:
+        """
+        :return: Height of the tip, -1 if the store is empty
+        :rtype: int
+        """
+        return len(self) - 1
+
+    @property
+    def tip_hash(self) -> bytes:
+        """
+        :return: Hash of the tip in internal byte order, None if the store is empty
+        :rtype: bytes
+        """
+        return self.hash_at(self.height) if len(self) else None
+
+    @property
+    def chainwork(self) -> int:
+        """
+        :return: Cumulative work of the stored chain
+        :rtype: int
+        """
+        return self.chainwork_at(self.height) if len(self) else 0
+
+    def header(self, height: int) -> bytes:
+        """
+        :param int height: Height of the header
+        :return: Raw header at the given height
+        :rtype: bytes
+        """
+        self._check_height(height)
+        offset = height * HEADER_SIZE
+        return self._headers_map[offset:offset + HEADER_SIZE]
+
+    def hash_at(self, height: int) -> bytes:
+        """
+        :param int height: Height of the header
+        :return: Hash of the header in internal byte order
+        :rtype: bytes
+        """
+        self._check_height(height)
+        offset = height * _INDEX_RECORD_SIZE
+        return self._index_map[offset:offset + HASH_SIZE]
+
+    def chainwork_at(self, height: int) -> int:
+        """
+        :param int height: Height of the header
+        :return: Cumulative work up to and including the header
+        :rtype: int
+        """
+        self._check_height(height)
+        offset = height * _INDEX_RECORD_SIZE + HASH_SIZE
+        return int.from_bytes(self._index_map[offset:offset + HASH_SIZE], "big")
+
+    def height_of(self, block_hash) -> int:
+        """
+        Find the height of a header by its hash
+
+        The hash to height mapping is built from the index file on first use.
+
+        :param block_hash: Hash in internal byte order or displayed hex format
+        :return: Height of the header or None if not in the store
+        :rtype: int
+        """
+        if isinstance(block_hash, str):
+            block_hash = bytes.fromhex(block_hash)[::-1]
+        with self._lock:
+            if self._heights is None:
+                index = self._index_map or b""
+                self._heights = {
+                    bytes(index[offset:offset + HASH_SIZE]): offset // _INDEX_RECORD_SIZE
+                    for offset in range(0, len(index), _INDEX_RECORD_SIZE)
+                }
+            return self._heights.get(bytes(block_hash))
+
+    def state(self) -> ChainState:
+        """
+        :return: State of the stored chain to continue verification from
+        :rtype: ChainState
+        """
+        if not len(self):
+            return ChainState(period_start=self._timestamp)
+        tip = parse_header(self.header(self.height))
+        return ChainState(self.height, tip.hash, tip.bits, tip.timestamp, self.chainwork,
+                          self._timestamp, self._period_bits())
+
+    def extend(self, data) -> int:
+        """
+        Verify headers continuing the stored chain and append them
+
+        Nothing is written if any of the headers is invalid.
+
+        :param data: Bytes like object with concatenated raw headers
+        :return: Height of the new tip
+        :rtype: int
+        :raises HeaderChainError: A header is not valid
+        """
+        with self._lock:
+            index = bytearray()
+
+            def add_index(_, __, block_hash, chainwork):
+                index.extend(block_hash)
+                index.extend(chainwork.to_bytes(HASH_SIZE, "big"))
+
+            state = verify_headers(data, self.params, self.state(), add_index)
+            if not index:
+                return self.height
+
+            start = len(self)
+            self._unmap()
+            with open(self.path, "ab") as headers_file, open(self.index_path, "ab") as index_file:
+                headers_file.write(data)
+                index_file.write(index)
+            if self._heights is not None:
+                for position in range(state.height - start + 1):
+                    offset = position * _INDEX_RECORD_SIZE
+                    self._heights[bytes(index[offset:offset + HASH_SIZE])] = start + position
+            self._map()
+            return state.height
+
+    def truncate(self, height: int) -> None:
+        """
+        Remove headers above the given height, used when the chain is reorganized
+
+        :param int height: Height of the last header to keep
+        """
+        with self._lock:
+            height = max(height, -1)
+            if height >= self.height:
+                return
+            self._unmap()
+            with open(self.path, "r+b") as headers_file:
+                headers_file.truncate((height + 1) * HEADER_SIZE)
+            with open(self.index_path, "r+b") as index_file:
+                index_file.truncate((height + 1) * _INDEX_RECORD_SIZE)
+            self._heights = None
+            self._map()
+
+    def close(self) -> None:
+        """
+        Release the memory maps
+        """
+        with self._lock:
+            self._unmap()
+
+    def _period_bits(self) -> int:
+        min_difficulty_bits = target_to_bits(self.params.pow_limit)
+        height = self.height
+        bits = _HEADER_FORMAT.unpack_from(self._headers_map, height * HEADER_SIZE)[4]
+        while height % self.params.retarget_interval and bits == min_difficulty_bits:
+            height -= 1
+            bits = _HEADER_FORMAT.unpack_from(self._headers_map, height * HEADER_SIZE)[4]
+        return bits
+
+    def _timestamp(self, height: int) -> int:
+        if height > self.height:
+            return None
+        return _HEADER_FORMAT.unpack_from(self._headers_map, height * HEADER_SIZE)[3]
+
+    def _check_height(self, height: int) -> None:
+        if not 0 <= height < len(self):
+            raise IndexError(f"No header at height {height}")
+
+    def _map(self) -> None:
+        self._headers_map = self._open_map(self.path)
+        self._index_map = self._open_map(self.index_path)
+        if len(self._headers_map or b"") // HEADER_SIZE != len(self._index_map or b"") // _INDEX_RECORD_SIZE:
+            raise HeaderChainError("Header store and its index are out of sync")
+
+    def _unmap(self) -> None:
+        for memory_map in (self._headers_map, self._index_map):
+            if memory_map is not None:
+                memory_map.close()
+        self._headers_map = self._index_map = None
+
+    @staticmethod
+    def _open_map(path):
+        if not os.path.getsize(path):
+            return None
+        with open(path, "rb") as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
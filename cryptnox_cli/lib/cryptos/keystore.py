@@ -320,18 +320,14 @@ class BIP32_KeyStore(Deterministic_KeyStore, Xpub):
     def add_xpub(self, xpub, xtype, electrum=False):
         self.xtype = xtype
         self.electrum = electrum
-        self.bip39_prefixes = (encode(self.coin.electrum_xprv_headers[xtype], 256, 4),
-                               encode(self.coin.electrum_xpub_headers[xtype], 256, 4)) if electrum else (
-        encode(self.coin.xprv_headers[xtype], 256, 4), encode(self.coin.xpub_headers[xtype], 256, 4))
+        self.bip39_prefixes = self.coin.bip32_prefixes(xtype, electrum)
         self.xpub = xpub
 
     def add_xprv_from_seed(self, bip32_seed, xtype, derivation, electrum=False):
         self.root_derivation = derivation
         self.xtype = xtype
         self.electrum = electrum
-        self.bip39_prefixes = (encode(self.coin.electrum_xprv_headers[xtype], 256, 4),
-                               encode(self.coin.electrum_xpub_headers[xtype], 256, 4)) if electrum else (
-        encode(self.coin.xprv_headers[xtype], 256, 4), encode(self.coin.xpub_headers[xtype], 256, 4))
+        self.bip39_prefixes = self.coin.bip32_prefixes(xtype, electrum)
         xprv = bip32_master_key(bip32_seed, self.bip39_prefixes)
         xprv = bip32_ckd(xprv, derivation, self.bip39_prefixes)
         self.add_xprv(xprv)
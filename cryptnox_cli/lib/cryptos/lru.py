@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded least recently used cache shared between threads.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+
+class LruCache:
+    """
+    Thread safe least recently used cache with hit and miss counters
+
+    :param int maxsize: Maximum number of entries kept in the cache
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, factory):
+        """
+        Get the value for the key, calling factory to compute it when it's not cached
+
+        :param key: Key of the entry
+        :param factory: Callable without arguments computing the value
+        :return: Cached or computed value
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self._misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+
+        value = factory()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+        return value
+
+    def info(self) -> CacheInfo:
+        """
+        :return: Statistics of the cache usage
+        :rtype: CacheInfo
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, self.maxsize,
+                             len(self._entries))
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = 0
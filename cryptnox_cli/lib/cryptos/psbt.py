@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Partially signed Bitcoin transactions (BIP174) on top of the transaction dictionaries of the
+library.
+
+The unsigned transaction and each key map are kept as raw bytes, so fields this module doesn't
+know about survive parsing and serializing unchanged. Signing is supported for pay to public key
+hash inputs, which are the inputs the wallet creates.
+"""
+import base64
+import binascii
+import struct
+from collections import OrderedDict
+from typing import Dict, List
+
+from .deterministic import parse_bip32_path
+from .main import bin_hash160, num_to_var_int
+from .transaction import (SIGHASH_ALL, bin_txhash, deserialize, serialize,
+                          serialize_script, signature_form, txhash, verify_tx_input)
+
+MAGIC = b"psbt\xff"
+
+GLOBAL_UNSIGNED_TX = 0x00
+
+IN_NON_WITNESS_UTXO = 0x00
+IN_WITNESS_UTXO = 0x01
+IN_PARTIAL_SIG = 0x02
+IN_SIGHASH_TYPE = 0x03
+IN_REDEEM_SCRIPT = 0x04
+IN_WITNESS_SCRIPT = 0x05
+IN_BIP32_DERIVATION = 0x06
+IN_FINAL_SCRIPTSIG = 0x07
+IN_FINAL_SCRIPTWITNESS = 0x08
+
+OUT_BIP32_DERIVATION = 0x02
+
+HARDENED = 0x80000000
+
+
+class PsbtError(Exception):
+    """
+    PSBT is malformed or can't be processed
+    """
+
+
+def _read_var_int(data: bytes, pos: int):
+    first = data[pos]
+    if first < 0xfd:
+        return first, pos + 1
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[first]
+    if pos + 1 + size > len(data):
+        raise PsbtError("Unexpected end of data")
+    return int.from_bytes(data[pos + 1:pos + 1 + size], "little"), pos + 1 + size
+
+
+def _read_map(data: bytes, pos: int):
+    entries = OrderedDict()
+    while True:
+        if pos >= len(data):
+            raise PsbtError("Unexpected end of data")
+        length, pos = _read_var_int(data, pos)
+        if length == 0:
+            return entries, pos
+        key = data[pos:pos + length]
+        pos += length
+        length, pos = _read_var_int(data, pos)
+        value = data[pos:pos + length]
+        pos += length
+        if len(value) != length:
+            raise PsbtError("Unexpected end of data")
+        if key in entries:
+            raise PsbtError(f"Duplicate key {key.hex()}")
+        entries[key] = value
+
+
+def _write_map(entries: Dict[bytes, bytes]) -> bytes:
+    result = []
+    for key, value in entries.items():
+        result.append(num_to_var_int(len(key)) + key + num_to_var_int(len(value)) + value)
+    result.append(b"\x00")
+    return b"".join(result)
+
+
+def encode_derivation(fingerprint: bytes, path: str) -> bytes:
+    """
+    :param bytes fingerprint: Fingerprint of the master key, 4 bytes
+    :param str path: Derivation path like m/44'/0'/0'/0/0
+    :return: Value of a BIP32 derivation field
+    :rtype: bytes
+    """
+    if len(fingerprint) != 4:
+        raise PsbtError("Fingerprint must be 4 bytes")
+    return fingerprint + b"".join(struct.pack("<I", index) for index in parse_bip32_path(path))
+
+
+def decode_derivation(value: bytes):
+    """
+    :param bytes value: Value of a BIP32 derivation field
+    :return: Fingerprint of the master key and derivation path
+    :rtype: tuple
+    """
+    if len(value) < 4 or len(value) % 4:
+        raise PsbtError("Invalid BIP32 derivation")
+    indexes = [index for (index,) in struct.iter_unpack("<I", value[4:])]
+    return value[:4], "/".join(["m"] + [f"{index - HARDENED}'" if index >= HARDENED else str(index)
+                                        for index in indexes])
+
+
+class Psbt:
+    """
+    Partially signed transaction
+
+    :param bytes unsigned_tx: Serialized transaction without scripts in its inputs
+    :param global_map: Global fields other than the unsigned transaction
+    :param inputs: Key map of each input
+    :param outputs: Key map of each output
+    """
+
+    def __init__(self, unsigned_tx: bytes, global_map: Dict[bytes, bytes] = None,
+                 inputs: List[Dict[bytes, bytes]] = None, outputs: List[Dict[bytes, bytes]] = None):
+        self.tx = deserialize(unsigned_tx.hex())
+        if any(tx_in["script"] for tx_in in self.tx["ins"]) or "witness" in self.tx:
+            raise PsbtError("Transaction must be unsigned")
+        self.unsigned_tx = unsigned_tx
+        self.global_map = OrderedDict(global_map or {})
+        self.inputs = [OrderedDict(entries) for entries in inputs] if inputs is not None \
+            else [OrderedDict() for _ in self.tx["ins"]]
+        self.outputs = [OrderedDict(entries) for entries in outputs] if outputs is not None \
+            else [OrderedDict() for _ in self.tx["outs"]]
+        if len(self.inputs) != len(self.tx["ins"]) or len(self.outputs) != len(self.tx["outs"]):
+            raise PsbtError("Number of key maps doesn't match the transaction")
+
+    @classmethod
+    def from_tx(cls, tx) -> "Psbt":
+        """
+        :param tx: Transaction dictionary or hex, scripts of its inputs are removed
+        :return: PSBT without any input data
+        :rtype: Psbt
+        """
+        tx = deserialize(tx) if isinstance(tx, str) else tx
+        tx = dict(tx, ins=[dict(tx_in, script="") for tx_in in tx["ins"]])
+        tx.pop("witness", None)
+        tx.pop("marker", None)
+        tx.pop("flag", None)
+        return cls(bytes.fromhex(serialize(tx)))
+
+    @classmethod
+    def parse(cls, data: bytes) -> "Psbt":
+        """
+        :param bytes data: Serialized PSBT
+        :return: Parsed PSBT
+        :rtype: Psbt
+        :raises PsbtError: Data is not a valid PSBT
+        """
+        if not data.startswith(MAGIC):
+            raise PsbtError("Missing PSBT magic bytes")
+        try:
+            global_map, pos = _read_map(data, len(MAGIC))
+            unsigned_tx = global_map.pop(bytes([GLOBAL_UNSIGNED_TX]), None)
+            if unsigned_tx is None:
+                raise PsbtError("Missing unsigned transaction")
+            tx = deserialize(unsigned_tx.hex())
+            inputs = []
+            for _ in tx["ins"]:
+                entries, pos = _read_map(data, pos)
+                inputs.append(entries)
+            outputs = []
+            for _ in tx["outs"]:
+                entries, pos = _read_map(data, pos)
+                outputs.append(entries)
+        except (IndexError, KeyError, ValueError) as error:
+            raise PsbtError(f"Malformed PSBT: {error}") from error
+        psbt = cls(unsigned_tx, global_map, inputs, outputs)
+        for index, entries in enumerate(psbt.inputs):
+            prev_tx = entries.get(bytes([IN_NON_WITNESS_UTXO]))
+            if prev_tx is not None:
+                psbt._check_utxo(index, prev_tx.hex())
+        return psbt
+
+    @classmethod
+    def from_base64(cls, text: str) -> "Psbt":
+        """
+        :param str text: PSBT in base64 format
+        :return: Parsed PSBT
+        :rtype: Psbt
+        """
+        try:
+            return cls.parse(base64.b64decode(text.strip(), validate=True))
+        except binascii.Error as error:
+            raise PsbtError(f"Invalid base64: {error}") from error
+
+    def serialize(self) -> bytes:
+        """
+        :return: PSBT in binary format
+        :rtype: bytes
+        """
+        global_map = OrderedDict([(bytes([GLOBAL_UNSIGNED_TX]), self.unsigned_tx)])
+        global_map.update(self.global_map)
+        return MAGIC + _write_map(global_map) + b"".join(_write_map(entries)
+                                                         for entries in self.inputs + self.outputs)
+
+    def to_base64(self) -> str:
+        """
+        :return: PSBT in base64 format
+        :rtype: str
+        """
+        return base64.b64encode(self.serialize()).decode()
+
+    def set_utxo(self, index: int, prev_tx: str) -> None:
+        """
+        Add the full transaction containing the output spent by the input
+
+        :param int index: Index of the input
+        :param str prev_tx: Spent transaction in hex format
+        """
+        self._check_utxo(index, prev_tx)
+        self.inputs[index][bytes([IN_NON_WITNESS_UTXO])] = bytes.fromhex(prev_tx)
+
+    def _check_utxo(self, index: int, prev_tx: str) -> None:
+        # A previous transaction not matching the outpoint could lie about the value of the input
+        outpoint = self.tx["ins"][index]["outpoint"]
+        try:
+            matches = txhash(prev_tx) == outpoint["hash"] and \
+                outpoint["index"] < len(deserialize(prev_tx)["outs"])
+        except (IndexError, KeyError, ValueError):
+            matches = False
+        if not matches:
+            raise PsbtError(f"Transaction doesn't match the outpoint of input {index}")
+
+    def set_witness_utxo(self, index: int, value: int, script: str) -> None:
+        """
+        Add only the spent output, for when the full transaction isn't available
+
+        :param int index: Index of the input
+        :param int value: Value of the spent output in satoshis
+        :param str script: Script of the spent output in hex format
+        """
+        script = bytes.fromhex(script)
+        self.inputs[index][bytes([IN_WITNESS_UTXO])] = struct.pack("<Q", value) + num_to_var_int(len(script)) + script
+
+    def spent_output(self, index: int) -> Dict:
+        """
+        :param int index: Index of the input
+        :return: Value and script in hex format of the output spent by the input
+        :rtype: Dict
+        """
+        entries = self.inputs[index]
+        prev_tx = entries.get(bytes([IN_NON_WITNESS_UTXO]))
+        if prev_tx is not None:
+            output = deserialize(prev_tx.hex())["outs"][self.tx["ins"][index]["outpoint"]["index"]]
+            return {"value": output["value"], "script": output["script"]}
+        witness_utxo = entries.get(bytes([IN_WITNESS_UTXO]))
+        if witness_utxo is not None:
+            length, pos = _read_var_int(witness_utxo, 8)
+            return {"value": struct.unpack("<Q", witness_utxo[:8])[0],
+                    "script": witness_utxo[pos:pos + length].hex()}
+        raise PsbtError(f"Input {index} has no spent output")
+
+    def sighash_type(self, index: int) -> int:
+        """
+        :param int index: Index of the input
+        :return: SIGHASH_ALL, the only type signed
+        :rtype: int
+        :raises PsbtError: The PSBT asks for another sighash type
+        """
+        value = self.inputs[index].get(bytes([IN_SIGHASH_TYPE]))
+        if value is None:
+            return SIGHASH_ALL
+        # Other types leave outputs or inputs unsigned, so someone else could redirect the funds
+        if len(value) != 4 or struct.unpack("<I", value)[0] != SIGHASH_ALL:
+            raise PsbtError(f"Input {index} asks for a sighash type other than SIGHASH_ALL")
+        return SIGHASH_ALL
+
+    def add_derivation(self, index: int, pubkey: str, path: str, fingerprint: bytes = b"\x00" * 4) -> None:
+        """
+        Record the key signing the input, so a signer knows which path to sign with
+
+        :param int index: Index of the input
+        :param str pubkey: Public key in hex format
+        :param str path: Derivation path of the key
+        :param bytes fingerprint: Fingerprint of the master key
+        """
+        key = bytes([IN_BIP32_DERIVATION]) + bytes.fromhex(pubkey)
+        self.inputs[index][key] = encode_derivation(fingerprint, path)
+
+    def derivations(self, index: int) -> Dict[str, str]:
+        """
+        :param int index: Index of the input
+        :return: Derivation path by public key in hex format
+        :rtype: Dict[str, str]
+        """
+        return {key[1:].hex(): decode_derivation(value)[1]
+                for key, value in self.inputs[index].items() if key[0] == IN_BIP32_DERIVATION}
+
+    def check_key(self, index: int, pubkey: str) -> None:
+        """
+        :param int index: Index of the input
+        :param str pubkey: Public key in hex format
+        :raises PsbtError: The input doesn't spend a pay to public key hash output of the key
+        """
+        if self.spent_output(index)["script"] != "76a914" + bin_hash160(bytes.fromhex(pubkey)).hex() + "88ac":
+            raise PsbtError(f"Key {pubkey} doesn't match the script spent by input {index}")
+
+    def sighash(self, index: int) -> bytes:
+        """
+        :param int index: Index of the input
+        :return: Hash the key of the input has to sign
+        :rtype: bytes
+        """
+        script = self.spent_output(index)["script"]
+        if not script.startswith("76a914"):
+            raise PsbtError(f"Input {index} is not pay to public key hash")
+        hashcode = self.sighash_type(index)
+        return bin_txhash(signature_form(self.unsigned_tx.hex(), index, script, hashcode), hashcode)
+
+    def add_signature(self, index: int, pubkey: str, signature: bytes) -> None:
+        """
+        :param int index: Index of the input
+        :param str pubkey: Public key in hex format
+        :param bytes signature: DER signature without the sighash type byte
+        """
+        self.inputs[index][bytes([IN_PARTIAL_SIG]) + bytes.fromhex(pubkey)] = \
+            signature + bytes([self.sighash_type(index)])
+
+    def signatures(self, index: int) -> Dict[str, bytes]:
+        """
+        :param int index: Index of the input
+        :return: Signatures with the sighash type byte by public key in hex format
+        :rtype: Dict[str, bytes]
+        """
+        return {key[1:].hex(): value for key, value in self.inputs[index].items() if key[0] == IN_PARTIAL_SIG}
+
+    def is_finalized(self, index: int = None) -> bool:
+        """
+        :param int index: Index of the input, all inputs if None
+        :return: Whether the input has its final script
+        :rtype: bool
+        """
+        indexes = range(len(self.inputs)) if index is None else [index]
+        return all(bytes([IN_FINAL_SCRIPTSIG]) in self.inputs[i] for i in indexes)
+
+    def finalize(self) -> None:
+        """
+        Build the final scripts from the verified signatures
+
+        :raises PsbtError: An input isn't signed or its signature isn't valid
+        """
+        for index, entries in enumerate(self.inputs):
+            if self.is_finalized(index):
+                continue
+            script = self.spent_output(index)["script"]
+            for pubkey, signature in self.signatures(index).items():
+                try:
+                    self.check_key(index, pubkey)
+                except PsbtError:
+                    continue
+                if verify_tx_input(self.unsigned_tx.hex(), index, script, signature.hex(), pubkey):
+                    break
+            else:
+                raise PsbtError(f"Input {index} has no valid signature")
+            # The finalizer removes the fields used for signing only, unknown fields are kept
+            removed = (IN_PARTIAL_SIG, IN_SIGHASH_TYPE, IN_REDEEM_SCRIPT, IN_WITNESS_SCRIPT, IN_BIP32_DERIVATION)
+            for key in [key for key in entries if key[0] in removed]:
+                del entries[key]
+            entries[bytes([IN_FINAL_SCRIPTSIG])] = bytes.fromhex(serialize_script([signature.hex(), pubkey]))
+
+    def extract(self) -> str:
+        """
+        :return: Signed transaction in hex format
+        :rtype: str
+        :raises PsbtError: Not all inputs are finalized
+        """
+        if not self.is_finalized():
+            raise PsbtError("PSBT is not finalized")
+        tx = deserialize(self.unsigned_tx.hex())
+        for tx_in, entries in zip(tx["ins"], self.inputs):
+            tx_in["script"] = entries[bytes([IN_FINAL_SCRIPTSIG])].hex()
+        return serialize(tx)
+
+
+__all__ = ["Psbt", "PsbtError", "encode_derivation", "decode_derivation"]
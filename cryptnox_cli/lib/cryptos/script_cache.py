@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded cache for address to output script conversions and back.
+
+Decoding a Base58Check address costs a base conversion and a double SHA256 checksum, and bech32
+addresses need a checksum pass as well. Payouts to recurring payees repeat this work for the same
+addresses, so the results are kept in a least recently used cache. Output scripts are built from
+precompiled templates by splicing the hash between a fixed prefix and suffix.
+"""
+from collections import namedtuple
+
+from . import segwit_addr
+from .lru import CacheInfo, LruCache
+from .main import bin_dbl_sha256
+from .specials import bin_to_b58check, changebase, get_code_string
+
+P2PKH = "p2pkh"
+P2SH = "p2sh"
+P2WPKH = "p2wpkh"
+P2WSH = "p2wsh"
+P2TR = "p2tr"
+WITNESS_UNKNOWN = "witness_unknown"
+
+AddressCheck = namedtuple("AddressCheck", ["address", "valid", "script_type", "script", "error"])
+
+
+class ScriptTemplate:
+    """
+    Output script with a fixed prefix and suffix around a hash of known length
+
+    :param str name: Name of the script type
+    :param bytes prefix: Script bytes in front of the hash
+    :param bytes suffix: Script bytes after the hash
+    :param int hash_length: Length of the hash in bytes
+    """
+    __slots__ = ("name", "prefix", "suffix", "hash_length", "_prefix_hex", "_suffix_hex", "_length")
+
+    def __init__(self, name: str, prefix: bytes, suffix: bytes, hash_length: int):
+        self.name = name
+        self.prefix = prefix
+        self.suffix = suffix
+        self.hash_length = hash_length
+        self._prefix_hex = prefix.hex()
+        self._suffix_hex = suffix.hex()
+        self._length = len(prefix) + hash_length + len(suffix)
+
+    def script(self, hash_bin: bytes) -> str:
+        """
+        Build the output script for the hash
+
+        :param bytes hash_bin: Hash to put into the script
+        :return: Output script in hex format
+        :rtype: str
+        """
+        if len(hash_bin) != self.hash_length:
+            raise ValueError(f"{self.name} script requires a {self.hash_length} byte hash")
+        return self._prefix_hex + hash_bin.hex() + self._suffix_hex
+
+    def match(self, script: bytes):
+        """
+        Extract the hash if the script was built from this template
+
+        :param bytes script: Output script
+        :return: Hash from the script or None if the script doesn't match the template
+        :rtype: bytes
+        """
+        if len(script) != self._length or not script.startswith(self.prefix) or \
+                not script.endswith(self.suffix):
+            return None
+        return script[len(self.prefix):len(self.prefix) + self.hash_length]
+
+
+TEMPLATES = {
+    P2PKH: ScriptTemplate(P2PKH, b"\x76\xa9\x14", b"\x88\xac", 20),
+    P2SH: ScriptTemplate(P2SH, b"\xa9\x14", b"\x87", 20),
+    P2WPKH: ScriptTemplate(P2WPKH, b"\x00\x14", b"", 20),
+    P2WSH: ScriptTemplate(P2WSH, b"\x00\x20", b"", 32),
+}
+
+
+_CACHE = LruCache()
+_BASE58_CHARACTERS = frozenset(get_code_string(58))
+
+
+def cache_info() -> CacheInfo:
+    """
+    :return: Statistics of the module wide address and script cache
+    :rtype: CacheInfo
+    """
+    return _CACHE.info()
+
+
+def cache_clear() -> None:
+    """
+    Empty the module wide address and script cache
+    """
+    _CACHE.clear()
+
+
+def b58check_decode(address: str):
+    """
+    Decode a Base58Check address into its version byte and payload
+
+    :param str address: Address to decode
+    :return: Version byte and payload
+    :rtype: tuple
+    :raises ValueError: Address is not Base58 or the checksum doesn't match
+    """
+    if not address or not _BASE58_CHARACTERS.issuperset(address):
+        raise ValueError("Address is not in Base58 format")
+    leading_zero_bytes = len(address) - len(address.lstrip("1"))
+    data = b"\x00" * leading_zero_bytes + changebase(address, 58, 256)
+    if len(data) < 6 or bin_dbl_sha256(data[:-4])[:4] != data[-4:]:
+        raise ValueError("Invalid address checksum")
+    return data[0], data[1:-4]
+
+
+def _witness_script(version: int, program: bytes) -> str:
+    if version == 0:
+        template = TEMPLATES[P2WPKH] if len(program) == 20 else TEMPLATES[P2WSH]
+        return template.script(program)
+    return bytes((version + 0x50, len(program))).hex() + program.hex()
+
+
+def _address_to_script(address: str, magicbyte: int, script_magicbyte: int, segwit_hrp: str) -> str:
+    if segwit_hrp and address.lower().startswith(segwit_hrp + "1"):
+        version, program = segwit_addr.decode(segwit_hrp, address)
+        if program is None:
+            raise ValueError(f"Invalid segwit address: {address}")
+        return _witness_script(version, bytes(program))
+
+    if segwit_hrp and segwit_addr.bech32_decode(address)[0] is not None:
+        raise ValueError(f"Address {address} doesn't belong to this network")
+    version, payload = b58check_decode(address)
+    if len(payload) != 20:
+        raise ValueError(f"Invalid address length: {address}")
+    if version == magicbyte:
+        return TEMPLATES[P2PKH].script(payload)
+    if version == script_magicbyte:
+        return TEMPLATES[P2SH].script(payload)
+    raise ValueError(f"Address {address} doesn't belong to this network")
+
+
+def address_to_script(address: str, magicbyte: int = 0, script_magicbyte: int = 5,
+                      segwit_hrp: str = None) -> str:
+    """
+    Convert an address into an output script using the cache
+
+    :param str address: Address to convert
+    :param int magicbyte: Version byte of pay to public key hash addresses
+    :param int script_magicbyte: Version byte of pay to script hash addresses
+    :param str segwit_hrp: Human readable part of segwit addresses, None if not supported
+    :return: Output script in hex format
+    :rtype: str
+    :raises ValueError: Address is not valid for the given network parameters
+    """
+    return _CACHE.get(("address", address, magicbyte, script_magicbyte, segwit_hrp),
+                      lambda: _address_to_script(address, magicbyte, script_magicbyte,
+                                                 segwit_hrp))
+
+
+def _script_to_address(script: bytes, magicbyte: int, script_magicbyte: int, segwit_hrp: str) -> str:
+    hash_bin = TEMPLATES[P2PKH].match(script)
+    if hash_bin is not None:
+        return bin_to_b58check(hash_bin, magicbyte)
+    hash_bin = TEMPLATES[P2SH].match(script)
+    if hash_bin is not None:
+        return bin_to_b58check(hash_bin, script_magicbyte)
+    if segwit_hrp:
+        for name in (P2WPKH, P2WSH):
+            hash_bin = TEMPLATES[name].match(script)
+            if hash_bin is not None:
+                return segwit_addr.encode(segwit_hrp, 0, hash_bin)
+        if len(script) >= 4 and 0x51 <= script[0] <= 0x60 and script[1] == len(script) - 2:
+            return segwit_addr.encode(segwit_hrp, script[0] - 0x50, script[2:])
+    raise ValueError("Output script doesn't have an address representation")
+
+
+def script_to_address(script, magicbyte: int = 0, script_magicbyte: int = 5,
+                      segwit_hrp: str = None) -> str:
+    """
+    Convert an output script into an address using the cache
+
+    :param script: Output script in hex or binary format
+    :param int magicbyte: Version byte of pay to public key hash addresses
+    :param int script_magicbyte: Version byte of pay to script hash addresses
+    :param str segwit_hrp: Human readable part of segwit addresses, None if not supported
+    :return: Address the script is paying to
+    :rtype: str
+    :raises ValueError: Script isn't one of the standard output scripts
+    """
+    if isinstance(script, str):
+        script = bytes.fromhex(script)
+    else:
+        script = bytes(script)
+    return _CACHE.get(("script", script, magicbyte, script_magicbyte, segwit_hrp),
+                      lambda: _script_to_address(script, magicbyte, script_magicbyte, segwit_hrp))
+
+
+def template_script(address: str, template: str) -> str:
+    """
+    Build an output script for a Base58Check address with the given template, without checking
+    the version byte of the address
+
+    :param str address: Base58Check address
+    :param str template: Name of the template, P2PKH or P2SH
+    :return: Output script in hex format
+    :rtype: str
+    """
+    return _CACHE.get(("template", address, template),
+                      lambda: TEMPLATES[template].script(b58check_decode(address)[1]))
+
+
+def script_type(script) -> str:
+    """
+    Determine the type of the standard output script
+
+    :param script: Output script in hex or binary format
+    :return: One of the script type names or None if the script is not a standard one
+    :rtype: str
+    """
+    if isinstance(script, str):
+        script = bytes.fromhex(script)
+    for name, template in TEMPLATES.items():
+        if template.match(script) is not None:
+            return name
+    if len(script) >= 4 and 0x51 <= script[0] <= 0x60 and script[1] == len(script) - 2:
+        return P2TR if script[0] == 0x51 and script[1] == 32 else WITNESS_UNKNOWN
+    return None
+
+
+def validate_addresses(addresses, magicbyte: int = 0, script_magicbyte: int = 5,
+                       segwit_hrp: str = None):
+    """
+    Validate many Base58Check and bech32/bech32m addresses in one call
+
+    Repeated addresses are decoded only once through the cache.
+
+    :param addresses: Iterable of addresses to check
+    :param int magicbyte: Version byte of pay to public key hash addresses
+    :param int script_magicbyte: Version byte of pay to script hash addresses
+    :param str segwit_hrp: Human readable part of segwit addresses, None if not supported
+    :return: Result for each entry in the same order as given
+    :rtype: List[AddressCheck]
+    """
+    results = []
+    for address in addresses:
+        if not isinstance(address, str) or not address.strip():
+            results.append(AddressCheck(address, False, None, None, "Empty address"))
+            continue
+        address = address.strip()
+        try:
+            script = address_to_script(address, magicbyte, script_magicbyte, segwit_hrp)
+        except ValueError as error:
+            results.append(AddressCheck(address, False, None, None, str(error)))
+        else:
+            results.append(AddressCheck(address, True, script_type(script), script, None))
+    return results
@@ -2,6 +2,9 @@
 """
 SegWit address encoding/decoding utilities (bech32/bech32m).
 """
+from enum import Enum
+from functools import lru_cache
+
 # Copyright (c) 2017 Pieter Wuille
 #
 # Permission is hereby granted, free of charge, to any person obtaining a copy
@@ -22,92 +25,126 @@ SegWit address encoding/decoding utilities (bech32/bech32m).
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-"""Reference implementation for Bech32 and segwit addresses."""
+"""Reference implementation for Bech32/Bech32m and segwit addresses, with table driven checksum."""
+
+
+class Encoding(Enum):
+    """Enumeration type to list the various supported encodings."""
+    BECH32 = 1
+    BECH32M = 2
 
 
 CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32M_CONST = 0x2bc830a3
+
+_CHARSET_MAP = {char: index for index, char in enumerate(CHARSET)}
+_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# XOR of the generators selected by each possible value of the top five checksum bits
+_POLYMOD_TABLE = tuple(
+    _GENERATOR[0] * (top & 1) ^ _GENERATOR[1] * (top >> 1 & 1) ^ _GENERATOR[2] * (top >> 2 & 1) ^
+    _GENERATOR[3] * (top >> 3 & 1) ^ _GENERATOR[4] * (top >> 4 & 1)
+    for top in range(32)
+)
+_SPEC_CONSTANT = {Encoding.BECH32: 1, Encoding.BECH32M: BECH32M_CONST}
 
 
 def bech32_polymod(values):
     """Internal function that computes the Bech32 checksum."""
-    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    table = _POLYMOD_TABLE
     chk = 1
     for value in values:
-        top = chk >> 25
-        chk = (chk & 0x1ffffff) << 5 ^ value
-        for i in range(5):
-            chk ^= generator[i] if ((top >> i) & 1) else 0
+        chk = (chk & 0x1ffffff) << 5 ^ value ^ table[chk >> 25]
     return chk
 
 
+@lru_cache(maxsize=16)
 def bech32_hrp_expand(hrp):
     """Expand the HRP into values for checksum computation."""
-    return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+    return bytes([ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp])
 
 
 def bech32_verify_checksum(hrp, data):
-    """Verify a checksum given HRP and converted data characters."""
-    return bech32_polymod(bech32_hrp_expand(hrp) + data) == 1
+    """Verify a checksum given HRP and converted data characters, return the encoding used."""
+    const = bech32_polymod(bech32_hrp_expand(hrp) + bytes(data))
+    if const == 1:
+        return Encoding.BECH32
+    if const == BECH32M_CONST:
+        return Encoding.BECH32M
+    return None
 
 
-def bech32_create_checksum(hrp, data):
+def bech32_create_checksum(hrp, data, spec=Encoding.BECH32):
     """Compute the checksum values given HRP and data."""
-    values = bech32_hrp_expand(hrp) + data
-    polymod = bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ 1
-    return [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    values = bech32_hrp_expand(hrp) + bytes(data)
+    polymod = bech32_polymod(values + b"\0\0\0\0\0\0") ^ _SPEC_CONSTANT[spec]
+    return bytes((polymod >> 5 * (5 - i)) & 31 for i in range(6))
 
 
-def bech32_encode(hrp, data):
+def bech32_encode(hrp, data, spec=Encoding.BECH32):
     """Compute a Bech32 string given HRP and data values."""
-    combined = data + bech32_create_checksum(hrp, data)
+    combined = bytes(data) + bech32_create_checksum(hrp, data, spec)
     return hrp + '1' + ''.join([CHARSET[d] for d in combined])
 
 
-def bech32_decode(bech):
-    """Validate a Bech32 string, and determine HRP and data."""
+def bech32_decode_spec(bech):
+    """Validate a Bech32/Bech32m string, and determine HRP, data and encoding."""
     if ((any(ord(x) < 33 or ord(x) > 126 for x in bech)) or
             (bech.lower() != bech and bech.upper() != bech)):
-        return (None, None)
+        return (None, None, None)
     bech = bech.lower()
     pos = bech.rfind('1')
     if pos < 1 or pos + 7 > len(bech) or len(bech) > 90:
-        return (None, None)
-    if not all(x in CHARSET for x in bech[pos+1:]):
-        return (None, None)
+        return (None, None, None)
+    try:
+        data = bytes(_CHARSET_MAP[x] for x in bech[pos+1:])
+    except KeyError:
+        return (None, None, None)
     hrp = bech[:pos]
-    data = [CHARSET.find(x) for x in bech[pos+1:]]
-    if not bech32_verify_checksum(hrp, data):
-        return (None, None)
-    return (hrp, data[:-6])
+    spec = bech32_verify_checksum(hrp, data)
+    if spec is None:
+        return (None, None, None)
+    return (hrp, data[:-6], spec)
+
+
+def bech32_decode(bech):
+    """Validate a Bech32/Bech32m string, and determine HRP and data."""
+    hrp, data, _ = bech32_decode_spec(bech)
+    return (hrp, data)
 
 
 def convertbits(data, frombits, tobits, pad=True):
-    """General power-of-2 base conversion."""
-    acc = 0
-    bits = 0
-    ret = []
-    maxv = (1 << tobits) - 1
-    max_acc = (1 << (frombits + tobits - 1)) - 1
-    for value in data:
-        if value < 0 or (value >> frombits):
-            return None
-        acc = ((acc << frombits) | value) & max_acc
-        bits += frombits
-        while bits >= tobits:
-            bits -= tobits
-            ret.append((acc >> bits) & maxv)
-    if pad:
-        if bits:
-            ret.append((acc << (tobits - bits)) & maxv)
-    elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
+    """General power-of-2 base conversion, returns bytes or None if data is invalid."""
+    data = bytes(data)
+    if data and max(data) >> frombits:
         return None
-    return ret
+    if frombits == 8:
+        acc = int.from_bytes(data, "big")
+    else:
+        acc = 0
+        for value in data:
+            acc = acc << frombits | value
+    bits = len(data) * frombits
+    if pad:
+        extra = -bits % tobits
+        acc <<= extra
+        bits += extra
+    else:
+        extra = bits % tobits
+        if extra >= frombits or acc & ((1 << extra) - 1):
+            return None
+        acc >>= extra
+        bits -= extra
+    count = bits // tobits
+    if tobits == 8:
+        return acc.to_bytes(count, "big")
+    mask = (1 << tobits) - 1
+    return bytes((acc >> (tobits * (count - 1 - i))) & mask for i in range(count))
 
 
 def decode(hrp, addr):
     """Decode a segwit address."""
-    hrpgot, data = bech32_decode(addr)
-    if hrpgot != hrp:
+    hrpgot, data, spec = bech32_decode_spec(addr)
+    if hrpgot != hrp or not data:
         return (None, None)
     decoded = convertbits(data[1:], 5, 8, False)
     if decoded is None or len(decoded) < 2 or len(decoded) > 40:
@@ -116,11 +153,15 @@ def decode(hrp, addr):
         return (None, None)
     if data[0] == 0 and len(decoded) != 20 and len(decoded) != 32:
         return (None, None)
+    if (data[0] == 0 and spec != Encoding.BECH32) or (data[0] != 0 and spec != Encoding.BECH32M):
+        return (None, None)
     return (data[0], decoded)
 
 
 def encode(hrp, witver, witprog):
     """Encode a segwit address."""
-    ret = bech32_encode(hrp, [witver] + convertbits(witprog, 8, 5))
-    assert decode(hrp, ret) != (None, None)
+    spec = Encoding.BECH32 if witver == 0 else Encoding.BECH32M
+    ret = bech32_encode(hrp, bytes([witver]) + convertbits(witprog, 8, 5), spec)
+    if decode(hrp, ret) == (None, None):
+        raise ValueError("Invalid witness program")
     return ret
@@ -5,6 +5,7 @@ Transaction building, serialization, signing, and parsing utilities.
 """
 #!/usr/bin/python
 import binascii, re, copy
+from . import script_cache
 from .main import *
 from _functools import reduce
 
@@ -319,24 +320,18 @@ def mk_pubkey_script(addr):
     """
     Used in converting p2pkh address to input or output script
     """
-    return '76a914' + b58check_to_hex(addr) + '88ac'
+    return script_cache.template_script(addr, script_cache.P2PKH)
 
 def mk_scripthash_script(addr):
     """
     Used in converting p2sh address to output script
     """
-    return 'a914' + b58check_to_hex(addr) + '87'
+    return script_cache.template_script(addr, script_cache.P2SH)
 
-def output_script_to_address(script, magicbyte=0):
-    if script.startswith('76'):
-        script = script[6:]
-    else:
-        script = script[4:]
-    if script.endswith('88ac'):
-        script = script[:-4]
-    else:
-        script = script[:-2]
-    return bin_to_b58check(safe_from_hex(script), magicbyte=magicbyte)
+def output_script_to_address(script, magicbyte=0, script_magicbyte=None, segwit_hrp=None):
+    if script_magicbyte is None:
+        script_magicbyte = magicbyte
+    return script_cache.script_to_address(script, magicbyte, script_magicbyte, segwit_hrp)
 
 def mk_p2w_scripthash_script(witver, witprog):
     """
@@ -344,7 +339,7 @@ def mk_p2w_scripthash_script(witver, witprog):
     """
     assert (0 <= witver <= 16)
     OP_n = witver + 0x50 if witver > 0 else 0
-    return bytes_to_hex_string([OP_n]) + '14' + (bytes_to_hex_string(witprog))
+    return bytes_to_hex_string([OP_n, len(witprog)]) + (bytes_to_hex_string(witprog))
 
 def mk_p2wpkh_redeemscript(pubkey):
     """
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Module for refreshing caches in the background
+
+The threads are daemons, so a hanging request can't keep the process alive, and they are joined
+when the process exits for up to JOIN_TIMEOUT seconds, so a one-shot command doesn't cut off a
+refresh it started.
+"""
+import atexit
+import threading
+import time
+from typing import Callable, List
+
+JOIN_TIMEOUT = 10
+
+_THREADS: List[threading.Thread] = []
+_LOCK = threading.Lock()
+
+
+def run_in_background(target: Callable[[], None]) -> threading.Thread:
+    """
+    Run the function in a thread joined before the process exits, ignoring its errors
+
+    :param target: Function to run
+    :return: Started thread
+    :rtype: threading.Thread
+    """
+    def run():
+        try:
+            target()
+        except Exception:
+            # A failed refresh is done again by the next use of the cache
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    with _LOCK:
+        _THREADS[:] = [running for running in _THREADS if running.is_alive()]
+        if not _THREADS:
+            # Registered again after the threads finished, so it runs before the exit handlers
+            # of the objects the threads use, which were registered before starting them
+            atexit.unregister(join_all)
+            atexit.register(join_all)
+        _THREADS.append(thread)
+    thread.start()
+    return thread
+
+
+def join_all(timeout: float = JOIN_TIMEOUT) -> None:
+    """
+    Wait for the threads running in the background
+
+    :param float timeout: Seconds to wait for all threads together
+    """
+    deadline = time.monotonic() + timeout
+    with _LOCK:
+        threads = list(_THREADS)
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
@@ -5,21 +5,26 @@ A basic BTC wallet library
 import math
 import json
 import re
-import urllib.parse
-import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Optional, Tuple
 
 from cryptnox_sdk_py import Derivation
 from tabulate import tabulate
 
-from .validators import EnumValidator, IntValidator
+from .background import run_in_background
+from .transport import DEFAULT_TIMEOUT, get_transport
+from .utxo_cache import UtxoCache
+from .validators import AnyValidator, EnumValidator, IntValidator, UrlListValidator
 
 try:
     from lib import cryptos
+    from lib.cryptos.lru import LruCache
     from lib.cryptos.wallet_utils import number_of_significant_digits
 except ImportError:
     from ..lib import cryptos
+    from ..lib.cryptos.lru import LruCache
     from ..lib.cryptos.wallet_utils import number_of_significant_digits
 
 
@@ -31,59 +36,114 @@ class BtcNetworks(Enum):
     TESTNET = "testnet"
 
 
+# Largest transaction relayed by the nodes, 400000 weight units for transactions without witness
+MAX_STANDARD_TX_SIZE = 100000
+
+# Parallel requests for the data of many addresses, below the rate limits of the public explorers
+DEFAULT_FETCH_WORKERS = 16
+
+
+def fetch_for_addresses(fetch, addresses, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict:
+    """
+    Call fetch for each address over a bounded thread pool
+
+    :param fetch: Callable taking an address
+    :param addresses: Addresses to fetch the data for
+    :param int max_workers: Maximum number of parallel requests
+    :return: Result of fetch by address
+    :rtype: Dict
+    """
+    addresses = list(dict.fromkeys(addresses))
+    if len(addresses) < 2:
+        return {address: fetch(address) for address in addresses}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(addresses))) as executor:
+        return dict(zip(addresses, executor.map(fetch, addresses)))
+
+
+def fee_for_target(fee_table: Dict[str, float], blocks: int = 6) -> int:
+    """
+    Fee rate for confirming within the number of blocks, from the slowest target not over it
+
+    When all targets are over the number of blocks the fastest one is used, so the transaction
+    is never sent without a fee.
+
+    :param dict fee_table: Fee rates by number of blocks
+    :param int blocks: Number of blocks the transaction should be confirmed in
+    :return: Fee rate rounded up
+    :rtype: int
+    :raises ValueError: The table has no fee rates
+    """
+    targets = [int(x) for x in fee_table.keys()]
+    if not targets:
+        raise ValueError("No fee rates available")
+    block_entries = [x for x in targets if x <= blocks]
+    target = max(block_entries) if block_entries else min(targets)
+    return math.ceil(fee_table[str(target)])
+
+
+class BtcBackends(Enum):
+    """
+    Class defining possible sources of Bitcoin chain data
+    """
+    EXPLORER = "explorer"
+    MOCK = "mock"
+
+
 class BlockCypherApi:
     """
     BlockCypherApi
     """
 
-    def __init__(self, api_key, network):
+    def __init__(self, api_key, network, timeout=DEFAULT_TIMEOUT):
         self.apikey = api_key
         self.url = "https://api.blockcypher.com/v1/btc/main/"
         if network.lower() == "testnet":
             self.url = "https://api.blockcypher.com/v1/btc/test3/"
-        self.params = {'token': self.apikey}
-        self.js_res = []
-        self.web_rsc = None
+        self.params = {'token': self.apikey} if self.apikey else {}
+        self.transport = get_transport(self.url, timeout=timeout)
 
-    def get_data(self, endpoint: str, params: Dict = None, data: bytes = None) \
-            -> None:
+    def get_data(self, endpoint: str, params: Dict = None, data: bytes = None):
         """
 
-        :rtype: None
         :param endpoint: str
         :param params: dict
         :param data: bytes
+        :return: Decoded JSON response
         """
-        params = params or {}
-        parameters = dict(params)
+        parameters = dict(params or {})
         parameters.update(self.params)
-        params_enc = urllib.parse.urlencode(parameters)
-        try:
-            req = urllib.request.Request(
-                self.url + endpoint + "?" + params_enc,
-                headers={'User-Agent': 'Mozilla/5.0'},
-                data=data
-            )
-            self.web_rsc = urllib.request.urlopen(req)
-            self.js_res = json.load(self.web_rsc)
-            self.web_rsc = None
-        except Exception as ex:
-            print(ex)
-            raise IOError("Error while processing request:\n%s" % (
-                    self.url + endpoint + "?" + params_enc
-            )) from ex
-
-    def check_api_resp(self) -> None:
+        return json.loads(self.transport.request(endpoint, parameters, data))
+
+    @staticmethod
+    def check_api_resp(response) -> None:
         """
 
+        :param response: Decoded JSON response
         :rtype: None
         """
-        if 'error' in self.js_res:
+        if 'error' in response:
             print(" !! ERROR :")
-            raise Exception(self.js_res['error'])
-        if 'errors' in self.js_res:
+            raise Exception(response['error'])
+        if 'errors' in response:
             print(" !! ERRORS :")
-            raise Exception(self.js_res['errors'])
+            raise Exception(response['errors'])
+
+    def get_fee_table(self) -> Dict[str, float]:
+        """
+        :return: Fee rate in satoshis per byte by number of blocks to confirm in
+        :rtype: Dict[str, float]
+        """
+        response = self.get_data("")
+        return {blocks: response.get(key, 0) / 1000 for blocks, key in
+                (("2", "high_fee_per_kb"), ("6", "medium_fee_per_kb"), ("12", "low_fee_per_kb"))}
+
+    def get_fee_estimates(self, blocks=6) -> int:
+        """
+        :param int blocks: Number of blocks the transaction should be confirmed in
+        :return: Fee rate in satoshis per byte
+        :rtype: int
+        """
+        return fee_for_target(self.get_fee_table(), blocks)
 
     def get_utx_os(self, addr: str, n_conf) -> List:  # n_conf 0 or 1
         """
@@ -92,11 +152,11 @@ class BlockCypherApi:
         :param n_conf: int (0 or 1)
         :return: List
         """
-        self.get_data("addrs/" + addr, {'unspentOnly': 'true'})
+        response = self.get_data("addrs/" + addr, {'unspentOnly': 'true'})
         # translate inputs from blockcypher to pybitcoinlib
-        addr_utxos = self.get_key('txrefs')
+        addr_utxos = self.get_key(response, 'txrefs')
         if n_conf == 0:
-            addr_utxos.extend(self.get_key('unconfirmed_txrefs'))
+            addr_utxos.extend(self.get_key(response, 'unconfirmed_txrefs'))
         sel_utxos = []
         for utxo in addr_utxos:
             sel_utxos.append({
@@ -105,23 +165,60 @@ class BlockCypherApi:
             })
         return sel_utxos
 
+    def get_utx_os_many(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, List]:
+        """
+        Get the unspent outputs of many addresses with parallel requests
+
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel requests
+        :return: Unspent outputs by address
+        :rtype: Dict[str, List]
+        """
+        return fetch_for_addresses(lambda address: self.get_utx_os(address, n_conf), addresses, max_workers)
+
+    def get_balances(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, int]:
+        """
+        Get the balances of many addresses in satoshis with parallel requests
+
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel requests
+        :return: Balance by address
+        :rtype: Dict[str, int]
+        """
+        return {address: sum(utxo['value'] for utxo in utxos)
+                for address, utxos in self.get_utx_os_many(addresses, n_conf, max_workers).items()}
+
+    def get_raw_tx(self, txid: str) -> str:
+        """
+        :param str txid: Id of the transaction
+        :return: Transaction in hex format
+        :rtype: str
+        """
+        response = self.get_data("txs/" + txid, {'includeHex': 'true', 'limit': 1})
+        self.check_api_resp(response)
+        return self.get_key(response, 'hex')
+
     def push_tx(self, tx_hex: str) -> Dict:
         """
         :param tx_hex:
         :return: str
         """
         data_tx = json.dumps({'tx': tx_hex}).encode('ascii')
-        self.get_data("txs/push", data=data_tx)
-        self.check_api_resp()
-        return self.get_key('tx/hash')
+        response = self.get_data("txs/push", data=data_tx)
+        self.check_api_resp(response)
+        return self.get_key(response, 'tx/hash')
 
-    def get_key(self, key_char: str) -> Dict:
+    @staticmethod
+    def get_key(response, key_char: str) -> Dict:
         """
 
+        :param response: Decoded JSON response
         :param key_char:str
         :return: Dict
         """
-        out = self.js_res
+        out = response
         path = key_char.split("/")
         for key in path:
             if key.isdigit():
@@ -139,11 +236,12 @@ class BlkHubApi:
     BlkHubApi
     """
 
-    def __init__(self, network):
+    def __init__(self, network, timeout=DEFAULT_TIMEOUT, url: str = None):
         network = network.lower()
-        self.url = BlkHubApi.get_api(network)
-        self.js_res = []
-        self.web_rsc = None
+        self.url = url or BlkHubApi.get_api(network)
+        if not self.url.endswith("/"):
+            self.url += "/"
+        self.transport = get_transport(self.url, timeout=timeout)
 
     @staticmethod
     def get_api(network: str) -> str:
@@ -160,56 +258,54 @@ class BlkHubApi:
             return "https://blockstream.info/testnet/api/"
         raise Exception("Unknown BC network name")
 
-    def get_data(self, endpoint: str, params: Dict = None, data: bytes = None) \
-            -> None:
+    def request(self, endpoint: str, params: Dict = None, data: bytes = None) -> bytes:
+        """
+        Send a request over the pooled connections of the server
+
+        :param endpoint: str
+        :param params: dict
+        :param data: bytes
+        :return: Body of the response
+        :rtype: bytes
+        """
+        return self.transport.request(endpoint, params, data)
+
+    def get_data(self, endpoint: str, params: Dict = None, data: bytes = None):
         """
 
         :param endpoint: str
         :param params: dict
         :param data: bytes
-        :return: None
-        """
-        params = params or {}
-        parameters = dict(params)
-        params_enc = urllib.parse.urlencode(parameters)
-        try:
-            req = urllib.request.Request(
-                self.url + endpoint + "?" + params_enc,
-                headers={'User-Agent': 'Mozilla/5.0'},
-                data=data
-            )
-            self.web_rsc = urllib.request.urlopen(req)
-            b_rep = self.web_rsc.read()
-            if len(b_rep) == 64 and b_rep[0] != ord('{'):
-                b_rep = b'{"txid":"' + b_rep + b'"}'
-            self.js_res = json.loads(b_rep)
-        except urllib.error.HTTPError as error:
-            raise IOError(f"Error while processing request:\n{error.code} - "
-                          f"{error.read().decode('utf8')}") from error
-        except Exception as error:
-            raise IOError(f"Error while processing request:\n{self.url}{endpoint}?params_enc\n"
-                          f"{error}") from error
-
-    def check_api_resp(self) -> None:
+        :return: Decoded JSON response
+        """
+        b_rep = self.request(endpoint, params, data)
+        if len(b_rep) == 64 and b_rep[0] != ord('{'):
+            b_rep = b'{"txid":"' + b_rep + b'"}'
+        return json.loads(b_rep)
+
+    @staticmethod
+    def check_api_resp(response) -> None:
         """
 
+        :param response: Decoded JSON response
         :rtype: None
         """
-        if 'error' in self.js_res:
+        if 'error' in response:
             print(" !! ERROR :")
-            raise Exception(self.js_res['error'])
-        if 'errors' in self.js_res:
+            raise Exception(response['error'])
+        if 'errors' in response:
             print(" !! ERRORS :")
-            raise Exception(self.js_res['errors'])
+            raise Exception(response['errors'])
+
+    def get_fee_table(self) -> Dict[str, float]:
+        """
+        :return: Fee rate in satoshis per byte by number of blocks to confirm in
+        :rtype: Dict[str, float]
+        """
+        return self.get_data("fee-estimates")
 
     def get_fee_estimates(self, blocks=6) -> int:
-        self.get_data("fee-estimates")
-        block_entries = [int(x) for x in self.js_res.keys() if int(x) <= blocks]
-        block_entries.sort()
-        try:
-            return math.ceil(self.js_res[str(block_entries.pop())])
-        except KeyError:
-            return 0
+        return fee_for_target(self.get_fee_table(), blocks)
 
     def get_utx_os(self, addr: str, _n_conf: int) -> List:
         """
@@ -218,8 +314,7 @@ class BlkHubApi:
         :param int _n_conf: 0 or 1
         :return: list
         """
-        self.get_data("address/" + addr + "/utxo")
-        addr_utx_os = self.js_res
+        addr_utx_os = self.get_data("address/" + addr + "/utxo")
         sel_utx_os = []
         # translate inputs from blkhub to pybitcoinlib
         for utxo in addr_utx_os:
@@ -229,23 +324,77 @@ class BlkHubApi:
             })
         return sel_utx_os
 
+    def get_address_txs(self, addr: str, last_seen: str = None) -> List[Dict]:
+        """
+        Get a page of confirmed transactions of the address, newest first
+
+        :param str addr: Address to look up
+        :param str last_seen: Id of the last transaction of the previous page, None for the first page
+        :return: Up to 25 transactions as returned by the API
+        :rtype: List[Dict]
+        """
+        return self.get_data(f"address/{addr}/txs/chain" + (f"/{last_seen}" if last_seen else ""))
+
+    def get_mempool_txs(self, addr: str) -> List[Dict]:
+        """
+        :param str addr: Address to look up
+        :return: Unconfirmed transactions of the address as returned by the API
+        :rtype: List[Dict]
+        """
+        return self.get_data(f"address/{addr}/txs/mempool")
+
+    def get_raw_tx(self, txid: str) -> str:
+        """
+        :param str txid: Id of the transaction
+        :return: Transaction in hex format
+        :rtype: str
+        """
+        return self.request(f"tx/{txid}/hex").decode("ascii").strip()
+
+    def get_utx_os_many(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, List]:
+        """
+        Get the unspent outputs of many addresses with parallel requests
+
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel requests
+        :return: Unspent outputs by address
+        :rtype: Dict[str, List]
+        """
+        return fetch_for_addresses(lambda address: self.get_utx_os(address, n_conf), addresses, max_workers)
+
+    def get_balances(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, int]:
+        """
+        Get the balances of many addresses in satoshis with parallel requests
+
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel requests
+        :return: Balance by address
+        :rtype: Dict[str, int]
+        """
+        return {address: sum(utxo['value'] for utxo in utxos)
+                for address, utxos in self.get_utx_os_many(addresses, n_conf, max_workers).items()}
+
     def push_tx(self, tx_hex: str) -> List:
         """
 
         :param tx_hex: str
         :return: List
         """
-        self.get_data("tx", data=tx_hex.encode('ascii'))
-        self.check_api_resp()
-        return self.get_key('txid')
+        response = self.get_data("tx", data=tx_hex.encode('ascii'))
+        self.check_api_resp(response)
+        return self.get_key(response, 'txid')
 
-    def get_key(self, key_char: str) -> List:
+    @staticmethod
+    def get_key(response, key_char: str) -> List:
         """
 
+        :param response: Decoded JSON response
         :param key_char: str
         :return: list
         """
-        out = self.js_res
+        out = response
         path = key_char.split("/")
         for key in path:
             if key.isdigit():
@@ -257,6 +406,188 @@ class BlkHubApi:
         return out
 
 
+class BlkHubExplorer:
+    """
+    Explorer backend for the coins of the cryptos library using the BlkHub and Blockstream REST API
+
+    Raw transactions are kept in a cache shared by all instances. The transaction id is the hash
+    of the transaction data, so the data fetched for an id doesn't change whichever API it comes
+    from, and transactions not matching their id are rejected before being cached.
+
+    Outputs, transactions and broadcasting go through the methods every API client of the wallet
+    has, so the explorer works over a HedgedApi or the mock chain as well. Block queries need an
+    API client sending raw requests, like BlkHubApi.
+
+    :param api: API client for the network of the coin
+    :param int max_workers: Maximum number of parallel requests
+    """
+    _tx_cache = LruCache(maxsize=10000)
+
+    def __init__(self, api, max_workers: int = 8):
+        self.api = api
+        self.max_workers = max_workers
+
+    @classmethod
+    def for_network(cls, network: str, **kwargs) -> "BlkHubExplorer":
+        """
+        Create the explorer for the given network
+
+        :param str network: mainnet or testnet
+        :return: Explorer for the network
+        :rtype: BlkHubExplorer
+        """
+        return cls(BlkHubApi(network), **kwargs)
+
+    def _request(self, endpoint: str) -> bytes:
+        request = getattr(self.api, "request", None)
+        if request is None:
+            raise NotImplementedError(f"Block queries aren't supported by {type(self.api).__name__}")
+        return request(endpoint)
+
+    def _json(self, endpoint: str):
+        return json.loads(self._request(endpoint))
+
+    def _text(self, endpoint: str) -> str:
+        return self._request(endpoint).decode("ascii").strip()
+
+    def unspent(self, *addrs, coin_symbol: str = None) -> List[Dict]:
+        """
+        Get unspent outputs of the addresses
+
+        :param addrs: Addresses to look up
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Unspent outputs in the format of the cryptos library
+        :rtype: List[Dict]
+        """
+        result = []
+        for addr in addrs:
+            for utxo in self.api.get_utx_os(addr, 0):
+                result.append({
+                    'output': utxo['output'],
+                    'value': utxo['value'],
+                    'address': addr
+                })
+        return result
+
+    def history(self, *addrs, coin_symbol: str = None) -> List[Dict]:
+        """
+        Get the unconfirmed and the latest confirmed transactions of the addresses
+
+        :param addrs: Addresses to look up
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Transactions as returned by the API
+        :rtype: List[Dict]
+        """
+        result = []
+        for addr in addrs:
+            result.extend(self.api.get_mempool_txs(addr))
+            result.extend(self.api.get_address_txs(addr))
+        return result
+
+    def fetchtx(self, txhash: str, coin_symbol: str = None) -> str:
+        """
+        Get the raw transaction, from the cache if it was already fetched
+
+        :param str txhash: Transaction id
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Raw transaction in hex format
+        :rtype: str
+        """
+        def fetch():
+            raw = self.api.get_raw_tx(txhash)
+            if not raw:
+                raise IOError(f"Transaction {txhash} not found")
+            if cryptos.public_txhash(raw) != txhash:
+                raise IOError(f"Transaction received for {txhash} has another id")
+            return raw
+
+        return BlkHubExplorer._tx_cache.get(txhash, fetch)
+
+    def fetchtxs(self, txhashes) -> Dict[str, str]:
+        """
+        Get many raw transactions, fetching each unique transaction once and in parallel
+
+        :param txhashes: Transaction ids
+        :return: Raw transactions in hex format by transaction id
+        :rtype: Dict[str, str]
+        """
+        txhashes = list(dict.fromkeys(txhashes))
+        if len(txhashes) < 2:
+            return {txhash: self.fetchtx(txhash) for txhash in txhashes}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(txhashes))) as executor:
+            return dict(zip(txhashes, executor.map(self.fetchtx, txhashes)))
+
+    def txinputs(self, txhash: str, coin_symbol: str = None) -> List[Dict]:
+        """
+        Get the outputs spent by the transaction
+
+        :param str txhash: Transaction id
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Spent outputs with their values
+        :rtype: List[Dict]
+        """
+        ins = cryptos.deserialize(self.fetchtx(txhash))['ins']
+        parents = self.fetchtxs(_in['outpoint']['hash'] for _in in ins)
+        outs = {txid: cryptos.deserialize(raw)['outs'] for txid, raw in parents.items()}
+        return [{
+            'output': f"{_in['outpoint']['hash']}:{_in['outpoint']['index']}",
+            'value': outs[_in['outpoint']['hash']][_in['outpoint']['index']]['value']
+        } for _in in ins]
+
+    def push_tx(self, tx_hex: str, coin_symbol: str = None) -> str:
+        """
+        Broadcast the transaction
+
+        :param str tx_hex: Signed transaction in hex format
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Transaction id
+        :rtype: str
+        """
+        return self.api.push_tx(tx_hex)
+
+    def block_height(self, txhash: str, coin_symbol: str = None) -> int:
+        """
+        :param str txhash: Transaction id
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Height of the block containing the transaction, None if it's not confirmed
+        :rtype: int
+        :raises NotImplementedError: The API client doesn't send raw requests
+        """
+        return self._json(f"tx/{txhash}/status").get("block_height")
+
+    def current_block_height(self, coin_symbol: str = None) -> int:
+        """
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Height of the chain tip
+        :rtype: int
+        :raises NotImplementedError: The API client doesn't send raw requests
+        """
+        return int(self._text("blocks/tip/height"))
+
+    def block_info(self, height: int, coin_symbol: str = None) -> Dict:
+        """
+        Get the header fields and transaction ids of the block
+
+        :param int height: Height of the block
+        :param str coin_symbol: Not used, part of the explorer interface
+        :return: Header fields and transaction ids under tx_hashes
+        :rtype: Dict
+        :raises NotImplementedError: The API client doesn't send raw requests
+        """
+        block_hash = self._text(f"block-height/{height}")
+        block = self._json(f"block/{block_hash}")
+        return {
+            "version": block["version"],
+            "hash": block["id"],
+            "prevhash": block.get("previousblockhash", "00" * 32),
+            "timestamp": block["timestamp"],
+            "merkle_root": block["merkle_root"],
+            "bits": block["bits"],
+            "nonce": block["nonce"],
+            "tx_hashes": self._json(f"block/{block_hash}/txids")
+        }
+
+
 def test_addr(btc_addr: str):
     """
 
@@ -280,36 +611,76 @@ class BTCwallet:
     PATH = "m/44'/0'/0'/0/0"
 
     def __init__(self, pubkey: str, coin_type: str, api,
-                 card) -> None:
+                 card, utxo_cache: UtxoCache = None, fetch_workers: int = DEFAULT_FETCH_WORKERS) -> None:
         """
         :param pubkey: str
         :param coin_type: str
         :param api:
         :param connection:
+        :param UtxoCache utxo_cache: Cache of the unspent outputs, one on disk for the address by default
+        :param int fetch_workers: Maximum number of parallel requests for the outputs of the addresses
         """
-        addr_header = 0x00
-        self.testnet = False
-        coin_type = coin_type.lower()
-        if coin_type == "testnet":
-            addr_header = 0x6F
-            self.testnet = True
+        self.network = coin_type
+        self.testnet = coin_type.lower() == "testnet"
+        self.coin = cryptos.get_coin("btc", self.testnet).with_explorer(BlkHubExplorer(api))
         self.pubkey = pubkey
         pkh = cryptos.bin_hash160(bytes.fromhex(pubkey))
-        self.address = cryptos.bin_to_b58check(pkh, addr_header)
+        self.address = cryptos.bin_to_b58check(pkh, self.coin.magicbyte)
         self.api = api
         self.card = card
+        self.utxo_cache = utxo_cache or UtxoCache(self.address, coin_type, api)
+        self.keys = {self.address: (self.pubkey, BTCwallet.PATH)}
+        self.utxo_caches = {self.address: self.utxo_cache}
+        self.fetch_workers = fetch_workers
         self.balance = None
         self.var_tx = None
         self.len_inputs = None
+        self.input_keys = []
         self.data_hash = []
+        self.batch = []
+        self.inputs = []
         self.fee = 2000
 
+    @property
+    def addresses(self) -> List[str]:
+        """
+        :return: Addresses the wallet spends from, the main address first
+        :rtype: List[str]
+        """
+        return list(self.keys)
+
+    def add_address(self, pubkey: str, path: str) -> str:
+        """
+        Add an address of the card the wallet can spend from
+
+        :param str pubkey: Public key of the address in hex format
+        :param str path: Derivation path of the key on the card
+        :return: Address of the public key
+        :rtype: str
+        """
+        address = self.coin.pubtoaddr(pubkey)
+        self.keys[address] = (pubkey, path)
+        if address not in self.utxo_caches:
+            self.utxo_caches[address] = UtxoCache(address, self.network, self.api)
+        return address
+
     def get_utx_os(self, n_conf: int = 0):
         """
+        Unspent outputs of all addresses, each with the address it belongs to. Addresses that
+        have to be fetched are fetched with parallel requests.
+
         :param n_conf: int (0 or 1)
         :return:
         """
-        return self.api.get_utx_os(self.address, n_conf)
+        stale = [address for address, cache in self.utxo_caches.items() if not cache.is_fresh(n_conf)]
+        fetched = {}
+        if len(stale) > 1 and hasattr(self.api, "get_utx_os_many"):
+            fetched = self.api.get_utx_os_many(stale, n_conf, self.fetch_workers)
+        utx_os = []
+        for address, cache in self.utxo_caches.items():
+            spendable = cache.update(fetched[address], n_conf) if address in fetched else cache.get(n_conf)
+            utx_os.extend(dict(utxo, address=address) for utxo in spendable)
+        return utx_os
 
     def get_balance(self) -> float:
         """
@@ -319,8 +690,18 @@ class BTCwallet:
         utx_os = self.get_utx_os()
         return self.balance_fm_utxos(utx_os)
 
+    def get_balances(self) -> Dict[str, int]:
+        """
+        :return: Balance of each address in satoshis
+        :rtype: Dict[str, int]
+        """
+        balances = dict.fromkeys(self.keys, 0)
+        for utxo in self.get_utx_os():
+            balances[utxo['address']] += utxo['value']
+        return balances
+
     def get_fee_estimate(self):
-        return self.api.get_fee_estimate()
+        return self.api.get_fee_estimates()
 
     def prepare(self, to_addr: str, payment_value: float, fee: float) \
             -> Union[float, int]:
@@ -342,22 +723,146 @@ class BTCwallet:
         if payment_value > max_spendable:
             raise Exception("Not enough fund for the tx")
         inputs = self.select_utxos(payment_value + fee, utx_os)
-        in_value = self.balance_fm_utxos(inputs)
-        change_value = in_value - payment_value - fee
-        outs = [{'value': payment_value, 'address': to_addr}]
-        if change_value > 0:
-            outs.append({'value': change_value, 'address': self.address})
-        self.var_tx = cryptos.coins.bitcoin.Bitcoin(testnet=self.testnet). \
-            mktx(inputs, outs)
-        script = cryptos.mk_pubkey_script(self.address)
-        # Finish tx
-        # Sign each input
+        self.var_tx, self.input_keys, self.data_hash = self._build(
+            inputs, [{'value': payment_value, 'address': to_addr}], fee)
         self.len_inputs = len(inputs)
-        for i in range(self.len_inputs):
-            signing_tx = cryptos.signature_form(self.var_tx, i, script, cryptos.SIGHASH_ALL)
-            self.data_hash.append(cryptos.bin_txhash(signing_tx, cryptos.SIGHASH_ALL))
+        self.inputs = inputs
+        self.batch = []
         return 0
 
+    def _build(self, inputs: List, outs: List[Dict], fee: int) -> Tuple[Dict, List, List[bytes]]:
+        change_value = self.balance_fm_utxos(inputs) - sum(out['value'] for out in outs) - fee
+        if change_value > 0:
+            outs = outs + [{'value': change_value, 'address': self.address}]
+        tx = self.coin.mktx(inputs, outs)
+        # Hash to sign for each input
+        input_keys = [self.keys[utxo.get('address', self.address)] for utxo in inputs]
+        data_hash = []
+        for i, utxo in enumerate(inputs):
+            script = self.coin.addrtoscript(utxo.get('address', self.address))
+            signing_tx = cryptos.signature_form(tx, i, script, cryptos.SIGHASH_ALL)
+            data_hash.append(cryptos.bin_txhash(signing_tx, cryptos.SIGHASH_ALL))
+        return tx, input_keys, data_hash
+
+    def prepare_batch(self, groups: List[List[Tuple[str, int]]], fee_rate: int) -> None:
+        """
+        Prepare one transaction for each group of payments
+
+        The unspent outputs are fetched and selected once for the whole batch, each transaction
+        gets its own inputs, so all of them can be signed in one session before broadcasting. A
+        group whose transaction would be over the standard size, because of the number of inputs
+        it needs, is split in halves.
+
+        :param groups: Groups of address and value in satoshis pairs, one transaction each
+        :param int fee_rate: Fee rate in satoshis per byte, each transaction pays it for its signed size
+        """
+        utx_os = self.get_utx_os()
+        balance = self.balance_fm_utxos(utx_os)
+        self.balance = balance / 10.0 ** 8
+        if sum(value for group in groups for _, value in group) > balance:
+            raise Exception("Not enough fund for the batch")
+
+        pool = sorted(utx_os, key=lambda x: x['value'])
+        pending = deque(groups)
+        self.batch = []
+        self.input_keys = []
+        self.data_hash = []
+        while pending:
+            group = pending.popleft()
+            number = len(self.batch) + 1
+            outs = [{'value': value, 'address': address} for address, value in group]
+            fee = 0
+            # Inputs and change depend on the fee and the fee on them, until the size doesn't grow
+            while True:
+                target = sum(out['value'] for out in outs) + fee
+                # Smallest output covering the transaction alone, otherwise the largest ones
+                single = next((utxo for utxo in pool if utxo['value'] >= target), None)
+                try:
+                    inputs = [single] if single else self.select_utxos(target, pool)
+                except Exception:
+                    raise Exception(f"Not enough unspent outputs left for transaction {number} of the "
+                                    f"batch, allow more outputs per transaction") from None
+                tx, input_keys, data_hash = self._build(inputs, outs, fee)
+                size = self._signed_size(tx, input_keys)
+                if fee >= fee_rate * size:
+                    break
+                fee = fee_rate * size
+            if size > MAX_STANDARD_TX_SIZE:
+                if len(group) == 1:
+                    raise Exception(f"Transaction {number} of the batch needs too many unspent outputs "
+                                    f"to be relayed")
+                middle = len(group) // 2
+                pending.extendleft([group[middle:], group[:middle]])
+                continue
+            used = {utxo['output'] for utxo in inputs}
+            pool = [utxo for utxo in pool if utxo['output'] not in used]
+            self.batch.append({"tx": tx, "inputs": inputs, "input_keys": input_keys, "payments": group,
+                               "fee": fee})
+            self.input_keys.extend(input_keys)
+            self.data_hash.extend(data_hash)
+
+        # Split groups are more transactions, each paying its own fee
+        self.fee = sum(item["fee"] for item in self.batch)
+        if sum(value for group in groups for _, value in group) + self.fee > balance:
+            raise Exception("Not enough fund for the batch")
+
+    @staticmethod
+    def _signed_size(tx: Dict, input_keys: List) -> int:
+        # Each input gets a DER signature of at most 72 bytes with its hash type, and its public key
+        return len(cryptos.serialize(tx)) // 2 + sum(1 + 73 + 1 + len(pubkey) // 2 for pubkey, _ in input_keys)
+
+    def send_batch(self, signatures: List[bytes]) -> List[str]:
+        """
+        Confirm the prepared batch with the user and broadcast its transactions
+
+        :param signatures: Signature of each input of all transactions, in the order of data_hash
+        :return: Ids of the broadcast transactions, none if canceled
+        :rtype: List[str]
+        """
+        offset = 0
+        for item in self.batch:
+            for i, (pubkey, _) in enumerate(item["input_keys"]):
+                item["tx"]["ins"][i]["script"] = cryptos.serialize_script(
+                    [signatures[offset + i].hex() + "01", pubkey])
+            offset += len(item["input_keys"])
+
+        total = sum(value for item in self.batch for _, value in item["payments"])
+        tabulate_table = [["BALANCE:", f"{self.balance}", "BTC", "ON", "ACCOUNT:", f"{self.address}"]]
+        for number, item in enumerate(self.batch, 1):
+            tabulate_table.append([f"TRANSACTION {number}:",
+                                   f"{sum(value for _, value in item['payments']) / 10 ** 8}", "BTC", "TO",
+                                   f"{len(item['payments'])}", "ADDRESSES"])
+        tabulate_table.append(["FEE:", f"{self.fee / 10 ** 8}"])
+        tabulate_table.append(["TOTAL:", (self.fee + total) / 10 ** 8])
+
+        floating_points = number_of_significant_digits((self.fee + total) / 10 ** 8)
+
+        print("\n\n--- Batch Ready ---\n")
+        print(tabulate(tabulate_table, tablefmt='plain', floatfmt=f".{floating_points}f"), "\n")
+        if input("Confirm ? [y/N] > ").lower() != "y":
+            return []
+
+        txids = []
+        for number, item in enumerate(self.batch, 1):
+            try:
+                txid = self.api.push_tx(cryptos.serialize(item["tx"]))
+            except Exception as error:
+                if not txids:
+                    raise
+                print(f"Transaction {number} of {len(self.batch)} failed: {error}")
+                break
+            self.record_sent(txid, item["tx"], item["input_keys"])
+            txids.append(txid)
+        return txids
+
+    @property
+    def input_paths(self) -> List[str]:
+        """
+        :return: Derivation path of the key signing each input of the prepared transaction
+        :rtype: List[str]
+        """
+        return [path for _, path in self.input_keys]
+
     def send(self, to_addr: str, payment_value: float, signature: List[bytes]) -> str:
         """
 
@@ -367,7 +872,8 @@ class BTCwallet:
         """
         # Cryptnox Sign
         for i in range(0, self.len_inputs):
-            self.var_tx["ins"][i]["script"] = cryptos.serialize_script([signature[i].hex() + "01", self.pubkey])
+            pubkey = self.input_keys[i][0] if self.input_keys else self.pubkey
+            self.var_tx["ins"][i]["script"] = cryptos.serialize_script([signature[i].hex() + "01", pubkey])
 
         tabulate_table = [
             ["BALANCE:", f"{self.balance}", "BTC", "ON", "ACCOUNT:",
@@ -387,9 +893,34 @@ class BTCwallet:
         conf = input("Confirm ? [y/N] > ")
         if conf.lower() == "y":
             tx_hex = cryptos.serialize(self.var_tx)
-            return "\nDONE, txID : " + self.api.push_tx(tx_hex)
+            txid = self.api.push_tx(tx_hex)
+            self.record_sent(txid)
+            return "\nDONE, txID : " + txid
         return "Canceled by the user."
 
+    def record_sent(self, txid: Optional[str], tx: Dict = None, input_keys: List = None) -> None:
+        """
+        Record the outputs spent by a transaction in the unspent outputs caches, and its change to
+        the wallet addresses once it is broadcast
+
+        :param str txid: Id of the broadcast transaction, None for a transaction not broadcast yet
+        :param dict tx: Transaction, the prepared one by default
+        :param list input_keys: Public key and path of each input, the ones of the prepared transaction by default
+        """
+        tx = tx or self.var_tx
+        input_keys = input_keys or self.input_keys
+        scripts = {self.coin.addrtoscript(address): address for address in self.utxo_caches}
+        for address, cache in self.utxo_caches.items():
+            spent = [f"{tx_in['outpoint']['hash']}:{tx_in['outpoint']['index']}"
+                     for tx_in, (pubkey, _) in zip(tx["ins"], input_keys)
+                     if self.keys[address][0] == pubkey]
+            change = [{"index": index, "value": out["value"]} for index, out in enumerate(tx["outs"])
+                      if txid is not None and scripts.get(out["script"]) == address]
+            if spent or change:
+                cache.mark_sent(txid, spent, change)
+                if txid is not None:
+                    run_in_background(cache.reconcile)
+
     @staticmethod
     def balance_fm_utxos(utxos) -> float:
         """
@@ -429,9 +960,30 @@ class BtcValidator:
     network = EnumValidator(BtcNetworks)
     fees = IntValidator()
     derivation = EnumValidator(Derivation)
+    esplora = UrlListValidator()
+    blockcypher_key = AnyValidator()
+    fee_ttl = IntValidator(min_value=0)
+    fee_blocks = IntValidator(min_value=1)
+    backend = EnumValidator(BtcBackends)
+    mock_utxos = IntValidator(min_value=0)
+    batch_max_outputs = IntValidator(min_value=1)
+    addresses = IntValidator(min_value=1)
+    fetch_workers = IntValidator(min_value=1)
 
     def __init__(self, network: str = "testnet", fees: int = 2000,
-                 derivation: str = "DERIVE"):
+                 derivation: str = "DERIVE", esplora: str = "", blockcypher_key: str = "",
+                 fee_ttl: int = 300, fee_blocks: int = 6, backend: str = "EXPLORER", mock_utxos: int = 10,
+                 batch_max_outputs: int = 100, addresses: int = 1,
+                 fetch_workers: int = DEFAULT_FETCH_WORKERS):
         self.network = network
         self.fees = fees
         self.derivation = derivation
+        self.esplora = esplora
+        self.blockcypher_key = blockcypher_key
+        self.fee_ttl = fee_ttl
+        self.fee_blocks = fee_blocks
+        self.backend = backend
+        self.mock_utxos = mock_utxos
+        self.batch_max_outputs = batch_max_outputs
+        self.addresses = addresses
+        self.fetch_workers = fetch_workers
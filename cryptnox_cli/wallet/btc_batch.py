@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Module for reading payment lists for batched Bitcoin sends
+
+A list is a CSV file with address and amount columns, the header line being optional, or a
+JSON lines file with an object with address and amount keys on each line. Amounts are in BTC.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import List, NamedTuple
+
+DEFAULT_MAX_OUTPUTS = 100
+
+
+class Payment(NamedTuple):
+    """
+    One output of a batch
+    """
+    address: str
+    value: int
+    line: int
+
+
+class PaymentListError(Exception):
+    """
+    Exception for payment lists with invalid entries, listing all of them at once
+    """
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("Invalid payment list:\n" + "\n".join(errors))
+
+
+def _to_satoshis(amount) -> int:
+    try:
+        value = Decimal(str(amount).strip()) * 10 ** 8
+    except InvalidOperation:
+        raise ValueError("not a number") from None
+    if not value.is_finite():
+        raise ValueError("not a number")
+    if value != value.to_integral_value():
+        raise ValueError("more than 8 decimals")
+    if value <= 0:
+        raise ValueError("not positive")
+    return int(value)
+
+
+def read_rows(path: Path):
+    """
+    Read the entries of a CSV or JSON lines payment list without validating them
+
+    :param Path path: Path of the file, files ending in .jsonl or .ndjson are read as JSON lines
+    :return: Generator of line number, address and amount, None for missing values
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for line, text in enumerate(file, 1):
+                if not text.strip():
+                    continue
+                try:
+                    entry = json.loads(text)
+                    yield line, entry.get("address"), entry.get("amount")
+                except (ValueError, AttributeError):
+                    yield line, None, None
+            return
+        for line, row in enumerate(csv.reader(file), 1):
+            if not row or not "".join(row).strip():
+                continue
+            if line == 1 and row[0].strip().lower() == "address":
+                continue
+            yield line, row[0].strip(), row[1] if len(row) > 1 else None
+
+
+def read_payments(path, coin) -> List[Payment]:
+    """
+    Read and validate a payment list, reporting all invalid entries together
+
+    :param path: Path of the CSV or JSON lines file
+    :param coin: Coin of the network the addresses have to belong to
+    :return: Payments in the order of the file
+    :rtype: List[Payment]
+    :raises PaymentListError: The list has invalid entries or is empty
+    """
+    rows = list(read_rows(Path(path)))
+    checks = coin.validate_addresses([address for _, address, _ in rows])
+    payments = []
+    errors = []
+    for (line, _, amount), check in zip(rows, checks):
+        if not check.valid:
+            errors.append(f"Line {line}: invalid address {check.address!r}: {check.error}")
+            continue
+        try:
+            payments.append(Payment(check.address, _to_satoshis(amount), line))
+        except ValueError as error:
+            errors.append(f"Line {line}: invalid amount {amount!r}: {error}")
+    if not rows:
+        errors.append("No payments in the list")
+    if errors:
+        raise PaymentListError(errors)
+    return payments
+
+
+def chunk_payments(payments: List[Payment], max_outputs: int = DEFAULT_MAX_OUTPUTS) -> List[List[Payment]]:
+    """
+    Split the payments into groups fitting one transaction each
+
+    :param payments: Payments of the batch
+    :param int max_outputs: Maximum number of payments in one transaction
+    :return: Groups of payments
+    :rtype: List[List[Payment]]
+    """
+    if max_outputs < 1:
+        raise ValueError("Maximum number of outputs must be at least 1")
+    return [payments[start:start + max_outputs] for start in range(0, len(payments), max_outputs)]
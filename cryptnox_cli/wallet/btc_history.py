@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Module for streaming the transaction history of a Bitcoin address
+
+Esplora explorers return the confirmed transactions of an address in pages of 25, newest first,
+each page continuing after the last transaction id of the previous one. Confirmed transactions
+don't change, so the pages already seen are kept on disk as one segment going back from the
+newest transaction. A following run only fetches pages until it reaches the cached segment.
+"""
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from .storage import cache_path, read_json, write_json
+
+PAGE_SIZE = 25
+
+
+def tx_summary(tx: Dict, address: str) -> Dict:
+    """
+    Summarize an Esplora transaction from the point of view of the address
+
+    :param dict tx: Transaction as returned by the API
+    :param str address: Address the history belongs to
+    :return: Transaction id, confirmation status, change of the balance of the address and fee
+    :rtype: Dict
+    """
+    status = tx.get("status", {})
+    received = sum(out.get("value", 0) for out in tx.get("vout", [])
+                   if out.get("scriptpubkey_address") == address)
+    sent = sum((tx_in.get("prevout") or {}).get("value", 0) for tx_in in tx.get("vin", [])
+               if (tx_in.get("prevout") or {}).get("scriptpubkey_address") == address)
+    return {
+        "txid": tx["txid"],
+        "confirmed": bool(status.get("confirmed")),
+        "block_height": status.get("block_height"),
+        "block_time": status.get("block_time"),
+        "value": received - sent,
+        "fee": tx.get("fee", 0)
+    }
+
+
+class AddressHistory:
+    """
+    Transaction history of one address with the confirmed transactions cached on disk
+
+    :param str address: Address to get the history of
+    :param str network: Name of the network
+    :param api: API object with get_address_txs(address, last_seen) and get_mempool_txs(address),
+                its cache_dir attribute if it has one replaces the cache directory of the application
+    :param Path path: File for keeping the cache, in the application cache directory by default
+    """
+
+    def __init__(self, address: str, network: str, api, path: Path = None):
+        self.address = address
+        self.api = api
+        self.path = path or cache_path("history", f"{network.lower()}-{address}.json",
+                                       root=getattr(api, "cache_dir", None))
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Dict]:
+        for page in self.pages():
+            yield from page
+
+    def _load(self) -> Dict:
+        with self._lock:
+            state = read_json(self.path, {})
+        state.setdefault("txs", [])
+        state.setdefault("complete", False)
+        return state
+
+    def _save(self, txs: List[Dict], complete: bool) -> None:
+        with self._lock:
+            write_json(self.path, {"txs": txs, "complete": complete})
+
+    def _fetch(self, last_seen: str = None) -> List[Dict]:
+        return self.api.get_address_txs(self.address, last_seen)
+
+    def pages(self) -> Iterator[List[Dict]]:
+        """
+        Generate the history page by page, newest first, fetching pages only when they're needed
+
+        Unconfirmed transactions come first. Pages fetched before the generator is closed are
+        cached if they connect to the cached ones.
+
+        :return: Generator of lists of transaction summaries
+        :rtype: Iterator[List[Dict]]
+        """
+        cached = self._load()
+        known = {tx["txid"]: index for index, tx in enumerate(cached["txs"])}
+
+        unconfirmed = [tx_summary(tx, self.address) for tx in self.api.get_mempool_txs(self.address)]
+        if unconfirmed:
+            yield unconfirmed
+
+        newest = []
+        older = None
+        complete = False
+        try:
+            last_seen = None
+            while True:
+                page = self._fetch(last_seen)
+                summaries = []
+                for tx in page:
+                    if tx["txid"] in known:
+                        older = cached["txs"][known[tx["txid"]]:]
+                        break
+                    summaries.append(tx_summary(tx, self.address))
+                newest.extend(summaries)
+                if summaries:
+                    yield summaries
+                if older is not None or len(page) < PAGE_SIZE:
+                    break
+                last_seen = page[-1]["txid"]
+
+            if older is None:
+                complete = True
+                return
+
+            complete = cached["complete"]
+            for start in range(0, len(older), PAGE_SIZE):
+                yield older[start:start + PAGE_SIZE]
+
+            # The cached segment ended before the first transaction of the address
+            last_seen = older[-1]["txid"]
+            while not complete:
+                page = self._fetch(last_seen)
+                summaries = [tx_summary(tx, self.address) for tx in page]
+                older.extend(summaries)
+                if summaries:
+                    yield summaries
+                    last_seen = page[-1]["txid"]
+                complete = len(page) < PAGE_SIZE
+        finally:
+            # Without reaching the cached segment there is a gap between the new pages and the
+            # cached ones, the cache is only replaced if it was empty
+            if older is not None or complete or not cached["txs"]:
+                self._save(newest + (older or []), complete)
+
+    def cached(self) -> List[Dict]:
+        """
+        :return: Confirmed transactions in the cache, newest first
+        :rtype: List[Dict]
+        """
+        return self._load()["txs"]
+
+    def clear(self) -> None:
+        """
+        Remove the cache from the disk
+        """
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
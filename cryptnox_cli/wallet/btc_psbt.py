@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Module for splitting Bitcoin sends into creating, signing and broadcasting PSBTs
+
+An online host creates the PSBTs of many payments, a signing station signs a whole queue of
+them with the card in one session and any host broadcasts them afterwards. The PSBT files
+contain the base64 encoded PSBT like the ones of Bitcoin Core.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple
+
+from tabulate import tabulate
+
+from .btc import BTCwallet, fetch_for_addresses
+
+try:
+    from lib import cryptos
+    from lib.cryptos.psbt import MAGIC, Psbt, PsbtError
+    from lib.cryptos.wallet_utils import number_of_significant_digits
+except ImportError:
+    from ..lib import cryptos
+    from ..lib.cryptos.psbt import MAGIC, Psbt, PsbtError
+    from ..lib.cryptos.wallet_utils import number_of_significant_digits
+
+
+class SigningRequest(NamedTuple):
+    """
+    Input of a PSBT to be signed by the card
+    """
+    psbt: Psbt
+    index: int
+    pubkey: str
+    path: str
+    data_hash: bytes
+
+
+def read_psbt(path) -> Psbt:
+    """
+    :param path: Path of a file with a base64 or binary PSBT
+    :return: Parsed PSBT
+    :rtype: Psbt
+    :raises PsbtError: File doesn't contain a valid PSBT
+    """
+    data = Path(path).read_bytes()
+    if data.startswith(MAGIC):
+        return Psbt.parse(data)
+    return Psbt.from_base64(data.decode("ascii", errors="replace"))
+
+
+def write_psbt(path, psbt: Psbt) -> None:
+    """
+    :param path: Path of the file to write the PSBT to in base64 format
+    :param Psbt psbt: PSBT to write
+    """
+    Path(path).write_text(psbt.to_base64() + "\n", encoding="ascii")
+
+
+def wallet_psbts(wallet: BTCwallet) -> List[Psbt]:
+    """
+    Create PSBTs of the transactions prepared by the wallet
+
+    The inputs of the wallet are pay to public key hash inputs, for which BIP174 requires the full
+    transactions spent by the inputs. They are fetched in parallel through the explorer of the
+    wallet coin, which keeps them cached.
+
+    :param BTCwallet wallet: Wallet with a transaction or batch prepared
+    :return: One PSBT for each prepared transaction
+    :rtype: List[Psbt]
+    :raises PsbtError: A transaction spent by an input can't be fetched
+    """
+    items = wallet.batch or [{"tx": wallet.var_tx, "inputs": wallet.inputs, "input_keys": wallet.input_keys}]
+    txids = {utxo["output"][:64] for item in items for utxo in item["inputs"]}
+    if not hasattr(wallet.api, "get_raw_tx"):
+        raise PsbtError("The API can't fetch the transactions spent by the inputs, which non-segwit inputs need")
+    try:
+        raw_txs = wallet.coin.fetchtxs(txids)
+    except Exception as error:
+        raise PsbtError(f"Can't fetch a transaction spent by an input, which non-segwit inputs need: "
+                        f"{error}") from error
+
+    psbts = []
+    for item in items:
+        psbt = Psbt.from_tx(item["tx"])
+        for index, (utxo, (pubkey, path)) in enumerate(zip(item["inputs"], item["input_keys"])):
+            psbt.set_utxo(index, raw_txs[utxo["output"][:64]])
+            psbt.add_derivation(index, pubkey, path)
+        psbts.append(psbt)
+    return psbts
+
+
+def signing_requests(psbts: Iterable[Psbt], pubkeys: Dict[str, str] = None) -> List[SigningRequest]:
+    """
+    Collect the inputs still to be signed of many PSBTs
+
+    :param psbts: PSBTs to sign
+    :param dict pubkeys: Public key in hex format by derivation path of the keys of the card, all
+                         keys recorded in the PSBTs if None
+    :return: Input to sign with its key and hash, in the order of the PSBTs and their inputs
+    :rtype: List[SigningRequest]
+    :raises PsbtError: An input can't be signed, or its key doesn't match the script it spends
+    """
+    requests = []
+    for psbt in psbts:
+        for index in range(len(psbt.inputs)):
+            if psbt.is_finalized(index):
+                continue
+            signed = psbt.signatures(index)
+            for pubkey, path in psbt.derivations(index).items():
+                if pubkey in signed or (pubkeys is not None and pubkeys.get(path) != pubkey):
+                    continue
+                psbt.check_key(index, pubkey)
+                requests.append(SigningRequest(psbt, index, pubkey, path, psbt.sighash(index)))
+    return requests
+
+
+def confirm_signing(psbts: Dict[str, Psbt], network: str, pubkeys: Iterable[str]) -> bool:
+    """
+    Show the outputs, amounts and fee of the PSBTs and ask the user to confirm signing them
+
+    :param dict psbts: PSBTs by name
+    :param str network: mainnet or testnet
+    :param pubkeys: Public keys of the card in hex format, outputs paying them are marked as change
+    :return: Whether the user confirmed
+    :rtype: bool
+    :raises PsbtError: An input has no spent output, so the fee can't be known
+    """
+    coin = cryptos.get_coin("btc", network.lower() == "testnet")
+    own_scripts = {coin.addrtoscript(coin.pubtoaddr(pubkey)) for pubkey in pubkeys}
+    for name, psbt in psbts.items():
+        spent = sum(psbt.spent_output(index)["value"] for index in range(len(psbt.inputs)))
+        paid = sum(out["value"] for out in psbt.tx["outs"])
+        tabulate_table = []
+        for number, out in enumerate(psbt.tx["outs"], 1):
+            try:
+                address = coin.scripttoaddr(out["script"])
+            except Exception:
+                address = f"script {out['script']}"
+            tabulate_table.append([f"OUTPUT {number}:", f"{out['value'] / 10 ** 8}", "BTC", "TO", address,
+                                   "(change)" if out["script"] in own_scripts else ""])
+        tabulate_table.append(["FEE:", f"{(spent - paid) / 10 ** 8}"])
+        tabulate_table.append(["TOTAL:", spent / 10 ** 8])
+
+        floating_points = max(number_of_significant_digits(value / 10 ** 8)
+                              for value in [spent, spent - paid] + [out["value"] for out in psbt.tx["outs"]])
+
+        print(f"\n\n--- Transaction Ready: {name} ---\n")
+        print(tabulate(tabulate_table, tablefmt='plain', floatfmt=f".{floating_points}f"), "\n")
+    return input("Confirm ? [y/N] > ").lower() == "y"
+
+
+def apply_signatures(requests: List[SigningRequest], signatures: List[bytes]) -> None:
+    """
+    :param requests: Signed inputs
+    :param signatures: DER signature of each request
+    """
+    for request, signature in zip(requests, signatures):
+        request.psbt.add_signature(request.index, request.pubkey, signature)
+
+
+def record_spends(wallet: BTCwallet, psbt: Psbt, txid: str = None) -> None:
+    """
+    Record the inputs of a PSBT as spent in the unspent outputs caches of the wallet, and its
+    change once it is broadcast, so following sends and PSBTs don't select the same outputs
+
+    :param BTCwallet wallet: Wallet of the card the PSBT spends from
+    :param Psbt psbt: Created or broadcast PSBT
+    :param str txid: Id of the broadcast transaction, None for a PSBT that was only created
+    """
+    # Derivations are removed by finalizing, the spent outputs are kept
+    keys = {wallet.coin.addrtoscript(address): key for address, key in wallet.keys.items()}
+    input_keys = [keys.get(psbt.spent_output(index)["script"], (None, None)) for index in range(len(psbt.inputs))]
+    wallet.record_sent(txid, psbt.tx, input_keys)
+
+
+def broadcast(api, psbts: Dict[str, Psbt], max_workers: int = 8, wallet: BTCwallet = None) -> Dict[str, str]:
+    """
+    Finalize the PSBTs and broadcast their transactions in parallel
+
+    :param api: API object with push_tx(tx_hex)
+    :param dict psbts: PSBTs by name
+    :param int max_workers: Maximum number of parallel broadcasts
+    :param BTCwallet wallet: Wallet whose unspent outputs caches record the broadcast transactions
+    :return: Transaction id or error message by name
+    :rtype: Dict[str, str]
+    """
+    def push(name):
+        try:
+            psbt = psbts[name]
+            if not psbt.is_finalized():
+                psbt.finalize()
+            return api.push_tx(psbt.extract())
+        except Exception as error:
+            return f"Error: {error}"
+
+    results = fetch_for_addresses(push, list(psbts), max_workers)
+    if wallet is not None:
+        for name, result in results.items():
+            if not result.startswith("Error: "):
+                record_spends(wallet, psbts[name], result)
+    return results
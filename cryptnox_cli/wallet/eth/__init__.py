@@ -2,9 +2,52 @@
 """
 Ethereum wallet utilities - aggregates and re-exports API components for easier imports.
 """
+from .abi import (  # noqa: F401
+    ContractAbi,
+    erc_abi,
+    get_abi
+)
 from .api import (  # noqa: F401
     address,
     Api,
     checksum_address,
     EthValidator
 )
+from .batch import (  # noqa: F401
+    BatchCall,
+    RpcBatch,
+    RpcError
+)
+from .clients import (  # noqa: F401
+    client_stats,
+    close_clients,
+    get_web3,
+    rpc_cache
+)
+from .log_index import (  # noqa: F401
+    LogIndex,
+    parse_conditions
+)
+from .logs import (  # noqa: F401
+    EventDecoder,
+    LogScanner
+)
+from .payouts import (  # noqa: F401
+    PaymentListError,
+    PayoutJournal,
+    read_payouts
+)
+from .rpc_cache import (  # noqa: F401
+    RpcCache,
+    RpcCacheInfo
+)
+from .subscriptions import (  # noqa: F401
+    Subscriber,
+    wait_for_receipt
+)
+from .watcher import (  # noqa: F401
+    DEFAULT_INTERVAL,
+    EventWatcher,
+    MANY,
+    Watch
+)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Module with the registry of contract ABIs shared by all contract calls
+
+Each ABI is parsed once, whether it's one of the ERC ABIs of the application or the ABI of a
+contract stored in the card configuration. The registry keeps the 4-byte selectors of its
+functions, the topics of its events and the Web3 contract classes created from it, so they aren't
+derived again for every contract object.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+from eth_abi import encode
+from eth_utils import (
+    abi_to_signature,
+    event_abi_to_log_topic,
+    function_abi_to_4byte_selector,
+    get_abi_input_types,
+    get_abi_output_types
+)
+from web3 import Web3
+
+ERC_PATH = Path(__file__).parent.parent.parent.joinpath("contract_abi")
+
+
+class ContractAbi:
+    """
+    Parsed ABI with the selectors of its functions and the topics of its events
+
+    :param list entries: Entries of the ABI
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise ValueError("ABI format is not json")
+        self.entries = entries
+        self.functions: Dict[str, List[Dict[str, Any]]] = {}
+        self.selectors: Dict[str, bytes] = {}
+        self.topics: Dict[str, bytes] = {}
+        self._types: Dict[str, Tuple[List[str], List[str]]] = {}
+        self._factories: Dict[int, Tuple[Web3, Any]] = {}
+        self._lock = threading.Lock()
+
+        for entry in entries:
+            if entry.get("type") == "function":
+                signature = abi_to_signature(entry)
+                self.functions.setdefault(entry["name"], []).append(entry)
+                self.selectors[signature] = function_abi_to_4byte_selector(entry)
+                self._types[signature] = (get_abi_input_types(entry), get_abi_output_types(entry))
+            elif entry.get("type") == "event" and not entry.get("anonymous"):
+                topic = event_abi_to_log_topic(entry)
+                self.topics[abi_to_signature(entry)] = topic
+                self.topics.setdefault(entry["name"], topic)
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        return [entry for entry in self.entries if entry.get("type") == "event"]
+
+    def _function(self, name: str, arguments: int = None) -> Dict[str, Any]:
+        for entry in self.functions.get(name, []):
+            if arguments is None or len(entry.get("inputs", [])) == arguments:
+                return entry
+        raise ValueError(f"Function {name} is not in the ABI")
+
+    def selector(self, name: str, arguments: int = None) -> bytes:
+        """
+        :param str name: Name of the function
+        :param int arguments: Number of arguments to choose between overloaded functions
+        :return: 4-byte selector of the function
+        :rtype: bytes
+        :raises ValueError: Function is not in the ABI
+        """
+        return self.selectors[abi_to_signature(self._function(name, arguments))]
+
+    def topic(self, name: str) -> bytes:
+        """
+        :param str name: Name or signature of the event
+        :return: Topic of the event
+        :rtype: bytes
+        :raises ValueError: Event is not in the ABI
+        """
+        try:
+            return self.topics[name]
+        except KeyError:
+            raise ValueError(f"Event {name} is not in the ABI")
+
+    def encode_call(self, name: str, arguments: Sequence = ()) -> str:
+        """
+        :param str name: Name of the function
+        :param arguments: Arguments of the function
+        :return: Call data of the function in hex format
+        :rtype: str
+        :raises ValueError: Function is not in the ABI
+        """
+        signature = abi_to_signature(self._function(name, len(arguments)))
+        input_types = self._types[signature][0]
+        return Web3.to_hex(self.selectors[signature] + encode(input_types, list(arguments)))
+
+    def output_types(self, name: str, arguments: int = None) -> List[str]:
+        """
+        :param str name: Name of the function
+        :param int arguments: Number of arguments to choose between overloaded functions
+        :return: Types of the values returned by the function
+        :rtype: List[str]
+        :raises ValueError: Function is not in the ABI
+        """
+        return self._types[abi_to_signature(self._function(name, arguments))][1]
+
+    def contract(self, web3: Web3, address: str):
+        """
+        :param Web3 web3: Client for the contract
+        :param str address: Address of the contract
+        :return: Contract object from the contract class of this ABI and client
+        """
+        with self._lock:
+            cached = self._factories.get(id(web3))
+            if cached is None or cached[0] is not web3:
+                cached = self._factories[id(web3)] = (web3, web3.eth.contract(abi=self.entries))
+        return cached[1](address=address)
+
+
+_REGISTRY: Dict[str, ContractAbi] = {}
+# Lists already registered by identity, so hashing them again isn't needed
+_BY_ID: Dict[int, Tuple[list, ContractAbi]] = {}
+_LOCK = threading.Lock()
+
+
+def _register(key: str, parse) -> ContractAbi:
+    with _LOCK:
+        result = _REGISTRY.get(key)
+    if result is None:
+        result = ContractAbi(parse())
+        with _LOCK:
+            result = _REGISTRY.setdefault(key, result)
+            _BY_ID[id(result.entries)] = (result.entries, result)
+    return result
+
+
+def erc_abi(value: int) -> ContractAbi:
+    """
+    :param int value: Number of the ERC standard
+    :return: ABI of the standard included in the application
+    :rtype: ContractAbi
+    :raises ValueError: Application doesn't have the ABI of the standard
+    """
+    def parse():
+        try:
+            return json.loads(ERC_PATH.joinpath(f"erc{int(value)}.json").read_text())
+        except (FileNotFoundError, PermissionError, json.decoder.JSONDecodeError):
+            raise ValueError("ERC not recognized by the application.")
+
+    return _register(f"erc{int(value)}", parse)
+
+
+def get_abi(value: Union[ContractAbi, int, str, List[Dict[str, Any]]]) -> ContractAbi:
+    """
+    Get the registered ABI of a configuration value
+
+    :param value: Number of an ERC standard, ABI in JSON format or parsed ABI
+    :return: ABI parsed once for all equal values
+    :rtype: ContractAbi
+    :raises ValueError: ABI is not valid
+    """
+    if isinstance(value, ContractAbi):
+        return value
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        return erc_abi(int(value))
+    if isinstance(value, str):
+        def parse():
+            try:
+                return json.loads(value)
+            except json.decoder.JSONDecodeError:
+                raise ValueError("ABI format is not json")
+
+        return _register(hashlib.sha256(value.encode()).hexdigest(), parse)
+    if isinstance(value, list):
+        cached = _BY_ID.get(id(value))
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        key = hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+        return _register(key, lambda: value)
+    raise ValueError("ABI format is not json")
@@ -2,12 +2,15 @@
 """
 A basic Ethereum wallet library
 """
+import asyncio
+import functools
+import time
 from typing import (
     Any,
-    Dict, Union
+    Dict, List, Optional, Union
 )
 
-import ecdsa
+import websockets
 from cryptnox_sdk_py import Derivation
 from eth_account._utils.legacy_transactions import (
     encode_transaction,
@@ -16,8 +19,16 @@ from eth_account._utils.legacy_transactions import (
 from eth_utils.curried import keccak
 from hexbytes import HexBytes
 from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
 
 from . import endpoint as ep
+from .abi import get_abi
+from .batch import BatchCall, RpcBatch, RpcError
+from .clients import get_web3, rpc_cache
+from .logs import EventDecoder, LogScanner
+from .rpc_cache import RpcCache
+from .signature import vrs
+from .subscriptions import wait_for_receipt
 from .. import validators
 
 try:
@@ -54,12 +65,60 @@ class Api:
         else:
             self.endpoint = ep.factory(endpoint, network, api_key)
 
+    def batch(self) -> RpcBatch:
+        """
+        :return: Batch of reads sent to the endpoint in one request
+        :rtype: RpcBatch
+        """
+        return RpcBatch(self._provider, self._web3)
+
+    def preflight(self, address: str, contract=None, nonce_block: str = "latest") -> Dict[str, BatchCall]:
+        """
+        Get everything needed before sending a transaction in one round trip
+
+        :param str address: Address sending the transaction
+        :param contract: ERC20 contract whose symbol and balance of the address are needed too
+        :param str nonce_block: Block for the transaction count, pending to include pending transactions
+        :return: Calls for gas_price, balance, nonce, and symbol and token_balance with a contract
+        :rtype: Dict[str, BatchCall]
+        """
+        with self.batch() as batch:
+            calls = {
+                "gas_price": batch.gas_price(),
+                "balance": batch.get_balance(address),
+                "nonce": batch.get_transaction_count(address, nonce_block)
+            }
+            if contract is not None:
+                calls["symbol"] = batch.call(contract, "symbol")
+                calls["token_balance"] = batch.call(contract, "balanceOf", Web3.to_checksum_address(address))
+        return calls
+
+    def log_scanner(self, address: str, topics: List[Optional[str]], decoder: EventDecoder = None,
+                    **kwargs) -> LogScanner:
+        """
+        :param str address: Address of the contract
+        :param list topics: Topic filters, the event topic first
+        :param EventDecoder decoder: Decoder of the logs, raw logs are returned if None
+        :param kwargs: Chunk size and maximum number of parallel requests
+        :return: Scanner of the logs of the contract on the endpoint
+        :rtype: LogScanner
+        """
+        return LogScanner(self._provider, address, topics, decoder, **kwargs)
+
+    @property
+    def rpc_cache(self) -> RpcCache:
+        """
+        :return: Cache of the idempotent reads sent to the endpoint, shared by all users of the endpoint
+        :rtype: RpcCache
+        """
+        return rpc_cache(self._provider)
+
     @property
     def block_number(self):
         return self._web3.eth.block_number
 
     def contract(self, address="", abi=""):
-        return self._web3.eth.contract(address=address, abi=abi)
+        return get_abi(abi).contract(self._web3, address)
 
     def get_transaction_count(self, address: str, blocks: str = None) -> int:
         return self._web3.eth.get_transaction_count(Web3.to_checksum_address(address), blocks)
@@ -86,15 +145,65 @@ class Api:
         return keccak(encoded_transaction)
 
     def push(self, transaction, signature, public_key):
+        return self.push_raw(self.signed_transaction(transaction, signature, public_key))
+
+    def signed_transaction(self, transaction: Dict[str, Any], signature: bytes, public_key: str) -> bytes:
+        """
+        :param dict transaction: Transaction that was signed
+        :param bytes signature: Signature of the transaction hash generated by the card
+        :param str public_key: Public key of the card that signed the transaction
+        :return: RLP encoded signed transaction
+        :rtype: bytes
+        """
         unsigned_transaction = serializable_unsigned_transaction_from_dict(transaction)
         var_v, var_r, var_s = Api._decode_vrs(signature, self._chain_id,
                                               self.transaction_hash(transaction),
                                               cryptos.decode_pubkey(public_key))
 
-        rlp_encoded = encode_transaction(unsigned_transaction, (var_v, var_r, var_s))
+        return encode_transaction(unsigned_transaction, (var_v, var_r, var_s))
 
+    def push_raw(self, rlp_encoded: bytes):
         return self._web3.eth.send_raw_transaction(HexBytes(rlp_encoded))
 
+    def has_transaction(self, transaction_hash) -> bool:
+        """
+        :param transaction_hash: Hash of the transaction
+        :return: Whether the node knows the transaction, pending or included in a block
+        :rtype: bool
+        """
+        try:
+            self._web3.eth.get_transaction(transaction_hash)
+        except TransactionNotFound:
+            return False
+        return True
+
+    def wait_for_receipt(self, transaction_hash, timeout: float = 300):
+        """
+        Wait until a transaction is included in a block
+
+        With a WebSocket endpoint the receipt is checked when a new block is announced, otherwise
+        and when the WebSocket connection fails the endpoint is polled.
+
+        :param transaction_hash: Hash of the transaction
+        :param float timeout: Seconds to wait
+        :return: Receipt of the transaction
+        :raises TimeExhausted: Transaction wasn't included in time
+        """
+        transaction_hash = Web3.to_hex(HexBytes(transaction_hash))
+        deadline = time.monotonic() + timeout
+        url = self.endpoint.websocket_provider
+        if url:
+            try:
+                asyncio.run(wait_for_receipt(url, transaction_hash, timeout))
+            except asyncio.TimeoutError:
+                raise TimeExhausted(f"Transaction {transaction_hash} is not in the chain after {timeout} seconds")
+            except (OSError, RpcError, websockets.WebSocketException):
+                # Connection failed or subscriptions aren't supported, polling for the time left
+                pass
+            else:
+                return self._web3.eth.get_transaction_receipt(transaction_hash)
+        return self._web3.eth.wait_for_transaction_receipt(transaction_hash, max(deadline - time.monotonic(), 0))
+
     @property
     def _chain_id(self) -> int:
         return self.endpoint.network.value
@@ -110,30 +219,16 @@ class Api:
         :param q_pub: Wallets q_pub
         :return: Tuple containing v, r, s values
         """
-        curve = ecdsa.curves.SECP256k1
-        signature_decode = ecdsa.util.sigdecode_der
-        generator = curve.generator
-        var_r, var_s = signature_decode(signature_der, generator.order())
-
-        # Parity recovery
-        var_q = ecdsa.keys.VerifyingKey.from_public_key_recovery_with_digest(
-            signature_der, transaction, curve, sigdecode=signature_decode)[1]
-
-        i = 35
-        if var_q.to_string("uncompressed") == cryptos.encode_pubkey(q_pub, "bin"):
-            i += 1
-
-        var_v = 2 * chain_id + i
-
-        return var_v, var_r, var_s
+        return vrs(signature_der, transaction, q_pub, chain_id)
 
     @property
     def _provider(self) -> str:
         return self.endpoint.provider
 
-    @property
+    @functools.cached_property
     def _web3(self) -> Web3:
-        return Web3(Web3.HTTPProvider(self._provider))
+        # Resolved once, so calls don't go through the lock of the shared clients every time
+        return get_web3(self._provider)
 
 
 class EthValidator:
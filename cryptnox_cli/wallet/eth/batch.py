@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Module for sending independent Ethereum reads as one JSON-RPC batch request
+
+Every call added to a batch returns a handle. After the batch is executed each handle holds the
+typed result of its call, or the error the node returned for that call alone. Nodes that don't
+accept batches get the calls one by one.
+"""
+from typing import Any, Callable, List
+
+import requests
+from eth_abi.exceptions import DecodingError
+from web3 import Web3
+
+from .abi import get_abi
+from .clients import post_json
+
+
+class RpcError(ValueError):
+    """
+    Error returned by the node for one call, with the error object as argument like the errors
+    of Web3
+
+    :param int code: JSON-RPC error code
+    :param str message: Error message
+    :param data: Additional error data, like the revert reason of a call
+    """
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        self.code = code
+        self.message = message
+        self.data = data
+        super().__init__({"code": code, "message": message, "data": data})
+
+    def __str__(self) -> str:
+        return f"{self.message} ({self.code})"
+
+
+class BatchCall:
+    """
+    Handle of a call in a batch
+
+    :param str method: JSON-RPC method
+    :param list params: Parameters of the method
+    :param formatter: Callable converting the raw result into its type
+    """
+
+    _PENDING = object()
+
+    def __init__(self, method: str, params: List, formatter: Callable = None):
+        self.method = method
+        self.params = params
+        self.formatter = formatter
+        self._value = BatchCall._PENDING
+        self._error = None
+
+    def _resolve(self, response: dict) -> None:
+        error = response.get("error")
+        if error is not None:
+            self._error = RpcError(error.get("code", 0), error.get("message", "Unknown error"),
+                                   error.get("data"))
+            return
+        try:
+            self._value = self.formatter(response.get("result")) if self.formatter else response.get("result")
+        except (DecodingError, TypeError, ValueError) as error:
+            self._error = RpcError(0, f"Invalid result of {self.method}: {error}")
+
+    @property
+    def done(self) -> bool:
+        return self._error is not None or self._value is not BatchCall._PENDING
+
+    @property
+    def error(self) -> RpcError:
+        """
+        :return: Error of the call, None if it succeeded
+        :rtype: RpcError
+        """
+        return self._error
+
+    def result(self):
+        """
+        :return: Typed result of the call
+        :raises RpcError: Node returned an error for the call
+        :raises RuntimeError: Batch wasn't executed yet
+        """
+        if self._error is not None:
+            raise self._error
+        if self._value is BatchCall._PENDING:
+            raise RuntimeError("Batch wasn't executed yet")
+        return self._value
+
+
+def _to_int(value: str) -> int:
+    return int(value, 16)
+
+
+class RpcBatch:
+    """
+    Reads collected for one JSON-RPC batch request
+
+    :param str provider: URL of the HTTP provider
+    :param Web3 web3: Client of the provider, used for decoding contract call results
+    """
+
+    def __init__(self, provider: str, web3: Web3):
+        self.provider = provider
+        self.web3 = web3
+        self.calls: List[BatchCall] = []
+
+    def __enter__(self) -> "RpcBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None and any(not call.done for call in self.calls):
+            self.execute()
+
+    def add(self, method: str, params: List = None, formatter: Callable = None) -> BatchCall:
+        """
+        :param str method: JSON-RPC method
+        :param list params: Parameters of the method
+        :param formatter: Callable converting the raw result into its type
+        :return: Handle of the call
+        :rtype: BatchCall
+        """
+        call = BatchCall(method, params or [], formatter)
+        self.calls.append(call)
+        return call
+
+    def gas_price(self) -> BatchCall:
+        return self.add("eth_gasPrice", [], _to_int)
+
+    def block_number(self) -> BatchCall:
+        return self.add("eth_blockNumber", [], _to_int)
+
+    def get_balance(self, address: str, block: str = "latest") -> BatchCall:
+        return self.add("eth_getBalance", [Web3.to_checksum_address(address), block], _to_int)
+
+    def get_transaction_count(self, address: str, block: str = "latest") -> BatchCall:
+        return self.add("eth_getTransactionCount", [Web3.to_checksum_address(address), block], _to_int)
+
+    def call(self, contract, function: str, *args, block: str = "latest") -> BatchCall:
+        """
+        Call a read only function of a contract
+
+        :param contract: Web3 contract
+        :param str function: Name of the function
+        :param args: Arguments of the function
+        :param str block: Block to call the function in
+        :return: Handle of the call, its result is the decoded return value, a tuple if the
+                 function returns more than one value
+        :rtype: BatchCall
+        """
+        abi = get_abi(contract.abi)
+        output_types = abi.output_types(function, len(args))
+
+        def decode(result: str):
+            values = self.web3.codec.decode(output_types, Web3.to_bytes(hexstr=result))
+            return values[0] if len(values) == 1 else values
+
+        data = abi.encode_call(function, args)
+        return self.add("eth_call", [{"to": contract.address, "data": data}, block], decode)
+
+    def execute(self) -> List[BatchCall]:
+        """
+        Send all pending calls in one request
+
+        :return: Handles of the calls
+        :rtype: List[BatchCall]
+        :raises requests.RequestException: Request failed
+        """
+        pending = [call for call in self.calls if not call.done]
+        if not pending:
+            return self.calls
+        payload = [{"jsonrpc": "2.0", "id": index, "method": call.method, "params": call.params}
+                   for index, call in enumerate(pending)]
+        responses = None
+        if len(payload) > 1:
+            try:
+                responses = post_json(self.provider, payload)
+            except requests.HTTPError:
+                pass
+        if isinstance(responses, list):
+            by_id = {response.get("id"): response for response in responses if isinstance(response, dict)}
+            for index, call in enumerate(pending):
+                call._resolve(by_id.get(index, {"error": {"code": -32603, "message": "Missing response"}}))
+        else:
+            # Single call or the node doesn't accept batches
+            for request, call in zip(payload, pending):
+                call._resolve(post_json(self.provider, request))
+        return self.calls
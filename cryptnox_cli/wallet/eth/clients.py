@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Module with Web3 clients shared by all users of the same provider
+
+Each provider URL and connection settings get one Web3 instance over its own keep-alive connection
+pool, so the calls of a command reuse the same TCP and TLS connection instead of opening a new
+one for every call. Every thread sends its requests with its own session mounted on the pool.
+Idempotent reads are answered from a response cache of the client, which lives as long as the
+client, so the commands of an interactive session share it.
+"""
+import logging
+import threading
+from typing import Any, Dict, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3._utils.http_session_manager import HTTPSessionManager
+
+from .rpc_cache import RpcCache, RpcCacheMiddleware
+from ..transport import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+
+
+class _Client:
+    """
+    Web3 instance, connection pool and response cache of a provider
+
+    The connection pool is shared by all threads. Every thread gets its own session mounted on
+    the pool as sessions themselves are not thread safe.
+
+    :param str provider: URL of the HTTP provider
+    :param timeout: Seconds to wait, or tuple of seconds to connect and to read
+    :param int pool_size: Maximum number of connections kept open
+    """
+
+    def __init__(self, provider: str, timeout, pool_size: int):
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.cache = RpcCache()
+        self.uses = 0
+        self._local = threading.local()
+        web3_provider = Web3.HTTPProvider(provider, request_kwargs={"timeout": timeout})
+        web3_provider._request_session_manager = _SessionManager(self)
+        self.web3 = Web3(web3_provider)
+        # Innermost, so cached responses still go through the formatting of the other middleware
+        self.web3.middleware_onion.inject(RpcCacheMiddleware.build(self.cache), "rpc_cache", layer=0)
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        :return: Session of the current thread
+        :rtype: requests.Session
+        """
+        try:
+            return self._local.session
+        except AttributeError:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._local.session = session
+            return session
+
+
+class _SessionManager(HTTPSessionManager):
+    # Web3 keeps sessions by thread in a cache that closes the evicted ones, which would close the
+    # shared pool, so the session of the thread is taken from the client instead
+    def __init__(self, client: _Client):
+        super().__init__()
+        self._client = client
+
+    def cache_and_return_session(self, endpoint_uri, session=None, request_timeout=None) -> requests.Session:
+        return self._client.session
+
+
+logger = logging.getLogger(__name__)
+
+_CLIENTS: Dict[Tuple[str, Any, int], _Client] = {}
+_LOCK = threading.Lock()
+
+
+def _client(provider: str, timeout, pool_size: int) -> _Client:
+    key = (provider, timeout, pool_size)
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = _Client(provider, timeout, pool_size)
+            logger.debug("Created Web3 client for %s", urlsplit(provider).netloc)
+        client.uses += 1
+        return client
+
+
+def get_web3(provider: str, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+             pool_size: int = DEFAULT_POOL_SIZE) -> Web3:
+    """
+    Get the Web3 client shared by all users of the provider with the same settings
+
+    :param str provider: URL of the HTTP provider
+    :param timeout: Seconds to wait, or tuple of seconds to connect and to read
+    :param int pool_size: Maximum number of connections kept open
+    :return: Client of the provider with these settings, created if it doesn't exist yet
+    :rtype: Web3
+    """
+    return _client(provider, timeout, pool_size).web3
+
+
+def post_json(provider: str, payload: Any) -> Any:
+    """
+    Send a raw JSON-RPC payload over the connections of the client of the provider
+
+    :param str provider: URL of the HTTP provider
+    :param payload: JSON-RPC request or list of requests
+    :return: Decoded JSON response
+    :raises requests.RequestException: Request failed or the response isn't JSON
+    """
+    client = _client(provider, DEFAULT_TIMEOUT, DEFAULT_POOL_SIZE)
+    response = client.session.post(provider, json=payload, timeout=client.timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def rpc_cache(provider: str) -> RpcCache:
+    """
+    :param str provider: URL of the HTTP provider
+    :return: Response cache of the client of the provider
+    :rtype: RpcCache
+    """
+    return _client(provider, DEFAULT_TIMEOUT, DEFAULT_POOL_SIZE).cache
+
+
+def client_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Connection reuse and response cache usage of the clients, by host so API keys in the URLs aren't
+    shown
+
+    :return: Number of times the clients were used, HTTP requests sent, connections opened, and
+             responses served from the cache or requested
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    with _LOCK:
+        clients = list(_CLIENTS.items())
+    result = {}
+    for (provider, _, _), client in clients:
+        stats = result.setdefault(urlsplit(provider).netloc, {"clients": 0, "uses": 0, "requests": 0,
+                                                              "connections": 0, "cache_hits": 0,
+                                                              "cache_misses": 0})
+        stats["clients"] += 1
+        stats["uses"] += client.uses
+        cache_info = client.cache.info()
+        stats["cache_hits"] += sum(cache_info.hits.values())
+        stats["cache_misses"] += sum(cache_info.misses.values())
+        pools = client.adapter.poolmanager.pools
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    return result
+
+
+def close_clients() -> None:
+    """
+    Close the connections of all clients and forget them
+    """
+    with _LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.adapter.close()
@@ -3,7 +3,7 @@
 Module for endpoints that can be used for working with the Ethereum network
 """
 import abc
-from typing import List
+from typing import List, Optional
 
 from .. import validators
 
@@ -72,6 +72,14 @@ class Endpoint(metaclass=abc.ABCMeta):
         :rtype: str
         """
 
+    @property
+    def websocket_provider(self) -> Optional[str]:
+        """
+        :return: WebSocket URL for subscriptions, None if the endpoint doesn't have one
+        :rtype: Optional[str]
+        """
+        return None
+
 
 class InfuraEndpoint(Endpoint):
     """
@@ -95,6 +103,10 @@ class InfuraEndpoint(Endpoint):
     def provider(self) -> str:
         return f"https://{self.domain}/{self._api_key}"
 
+    @property
+    def websocket_provider(self) -> str:
+        return f"wss://{self.network.name.lower()}.infura.io/ws/v3/{self._api_key}"
+
 
 class CryptnoxEndpoint(Endpoint):
     """
@@ -141,16 +153,38 @@ class PublicNodeEndpoint(Endpoint):
     def provider(self) -> str:
         return f"https://{self.domain}"
 
+    @property
+    def websocket_provider(self) -> str:
+        network_name = self._NETWORK_MAPPING.get(self.network, self.network.name.lower())
+        return f"wss://{network_name}-rpc.publicnode.com"
+
 
 class DirectEndpoint:
-    def __init__(self, url: str, network: enums.EthNetwork):
+    """
+    Endpoint given by its URL in the configuration
+
+    Most hosted nodes serve WebSocket connections on the same URL with the ws or wss scheme, so
+    that is the WebSocket URL unless another one is given. Users of the WebSocket URL fall back to
+    polling when the node doesn't accept the connection.
+
+    :param str url: HTTP URL of the node
+    :param enums.EthNetwork network: Ethereum network of the node
+    :param str websocket_url: WebSocket URL of the node, derived from the HTTP URL by default
+    """
+
+    def __init__(self, url: str, network: enums.EthNetwork, websocket_url: str = None):
         self.network = network
         self.url = url
+        self.websocket_url = websocket_url or "ws" + url[len("http"):]
 
     @property
     def provider(self) -> str:
         return self.url
 
+    @property
+    def websocket_provider(self) -> Optional[str]:
+        return self.websocket_url
+
 
 def factory(endpoint: str, network: enums.EthNetwork, api_key: str = "") -> Endpoint:
     """
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Module for keeping decoded contract events in a local SQLite index
+
+For every chain, contract and event topic the index knows the contiguous block range it holds, so
+a query only fetches the blocks outside of it. The most recent blocks can still be replaced by a
+reorganization, so they are removed and fetched again on every sync. Argument values are indexed
+too, for finding the events of an address or token id without scanning them all.
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+from .logs import LogScanner
+from ..storage import cache_path
+
+DEFAULT_REORG_DEPTH = 12
+
+# Logs written before committing the progress of a sync
+_COMMIT_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    chain_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    transaction_index INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (chain_id, address, topic, block_number, log_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS log_args (
+    chain_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    PRIMARY KEY (chain_id, address, topic, name, value, block_number, log_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS synced (
+    chain_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    from_block INTEGER NOT NULL,
+    to_block INTEGER NOT NULL,
+    PRIMARY KEY (chain_id, address, topic)
+) WITHOUT ROWID;
+"""
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def _key(value: Any) -> str:
+    """
+    :param value: Argument value
+    :return: Text the value is indexed by, so equal values of any format match
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, str) and value.startswith("0x"):
+        return value.lower()
+    if isinstance(value, (list, tuple)):
+        return json.dumps(_json_value(value))
+    return str(value)
+
+
+class LogIndex:
+    """
+    Local index of decoded contract events
+
+    :param Path path: File of the database, in the application cache directory by default
+    :param int reorg_depth: Number of most recent indexed blocks fetched again on every sync
+    """
+
+    def __init__(self, path: Path = None, reorg_depth: int = DEFAULT_REORG_DEPTH):
+        self.path = path or cache_path("eth-logs.sqlite3")
+        self.reorg_depth = reorg_depth
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "LogIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def synced(self, chain_id: int, address: str, topic: str) -> Optional[Tuple[int, int]]:
+        """
+        :return: First and last block of the indexed range, None if nothing is indexed
+        :rtype: Optional[Tuple[int, int]]
+        """
+        row = self._connection.execute("SELECT from_block, to_block FROM synced "
+                                       "WHERE chain_id = ? AND address = ? AND topic = ?",
+                                       (chain_id, address, topic)).fetchone()
+        return tuple(row) if row else None
+
+    def _set_synced(self, key: Tuple[int, str, str], from_block: int, to_block: int) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO synced VALUES (?, ?, ?, ?, ?)",
+                                 key + (from_block, to_block))
+
+    def _delete(self, key: Tuple[int, str, str], from_block: int, to_block: int) -> None:
+        for table in ("logs", "log_args"):
+            self._connection.execute(f"DELETE FROM {table} WHERE chain_id = ? AND address = ? AND topic = ? "
+                                     f"AND block_number BETWEEN ? AND ?", key + (from_block, to_block))
+
+    def _insert(self, key: Tuple[int, str, str], entry: Dict[str, Any]) -> None:
+        position = (entry["blockNumber"], entry["logIndex"])
+        self._connection.execute(
+            "INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            key + position + (entry["event"], HexBytes(entry["transactionHash"]).hex(), entry["transactionIndex"],
+                              HexBytes(entry["blockHash"]).hex(),
+                              json.dumps({name: _json_value(value) for name, value in entry["args"].items()})))
+        self._connection.executemany("INSERT OR REPLACE INTO log_args VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     [key + (name, _key(value)) + position for name, value in entry["args"].items()])
+
+    def _fetch(self, key: Tuple[int, str, str], scanner: LogScanner, from_block: int, to_block: int,
+               synced_from: int, commit: bool) -> int:
+        # Logs come in block order, so all blocks before the one of a log are complete
+        count = 0
+        for entry in scanner.scan(from_block, to_block):
+            self._insert(key, entry)
+            count += 1
+            if commit and count % _COMMIT_EVERY == 0 and entry["blockNumber"] > from_block:
+                self._set_synced(key, synced_from, entry["blockNumber"] - 1)
+                self._connection.commit()
+        return count
+
+    def sync(self, chain_id: int, scanner: LogScanner, topic: str, from_block: int, to_block: int) -> int:
+        """
+        Fetch the events of a block range that aren't indexed yet
+
+        The indexed range stays contiguous, so blocks between it and the requested range are
+        fetched too. The most recent indexed blocks are always fetched again.
+
+        :param int chain_id: Id of the chain
+        :param LogScanner scanner: Scanner for the contract and topic
+        :param str topic: Topic of the event in hex format
+        :param int from_block: First block that must be indexed
+        :param int to_block: Last block that must be indexed
+        :return: Number of events fetched
+        :rtype: int
+        """
+        key = (chain_id, scanner.address, topic)
+        count = 0
+        with self._lock:
+            try:
+                synced = self.synced(*key)
+                if synced is None:
+                    count += self._fetch(key, scanner, from_block, to_block, from_block, True)
+                    self._set_synced(key, from_block, to_block)
+                    self._connection.commit()
+                    return count
+
+                start, end = synced
+                if from_block < start:
+                    # Older blocks are committed at once, the range must stay contiguous
+                    count += self._fetch(key, scanner, from_block, start - 1, from_block, False)
+                    start = from_block
+                    self._set_synced(key, start, end)
+                    self._connection.commit()
+
+                rollback = max(start, end - self.reorg_depth + 1)
+                if to_block >= rollback:
+                    last = max(end, to_block)
+                    self._delete(key, rollback, last)
+                    count += self._fetch(key, scanner, rollback, last, start, True)
+                    self._set_synced(key, start, last)
+                    self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+        return count
+
+    def query(self, chain_id: int, address: str, topic: str, from_block: int = None, to_block: int = None,
+              args: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Get indexed events in block order
+
+        :param int chain_id: Id of the chain
+        :param str address: Address of the contract
+        :param str topic: Topic of the event in hex format
+        :param int from_block: First block, no limit if None
+        :param int to_block: Last block, no limit if None
+        :param dict args: Values the arguments must have by argument name
+        :return: Events in the format of the log scanner, bytes values in hex format
+        :rtype: List[Dict[str, Any]]
+        """
+        conditions = ["logs.chain_id = ?", "logs.address = ?", "logs.topic = ?"]
+        parameters: List[Any] = [chain_id, Web3.to_checksum_address(address), topic]
+        if from_block is not None:
+            conditions.append("logs.block_number >= ?")
+            parameters.append(from_block)
+        if to_block is not None:
+            conditions.append("logs.block_number <= ?")
+            parameters.append(to_block)
+        for name, value in (args or {}).items():
+            conditions.append("EXISTS (SELECT 1 FROM log_args WHERE log_args.chain_id = logs.chain_id "
+                              "AND log_args.address = logs.address AND log_args.topic = logs.topic "
+                              "AND log_args.name = ? AND log_args.value = ? "
+                              "AND log_args.block_number = logs.block_number "
+                              "AND log_args.log_index = logs.log_index)")
+            parameters.extend((name, _key(value)))
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT address, block_number, log_index, event, transaction_hash, transaction_index, block_hash, "
+                f"args FROM logs WHERE {' AND '.join(conditions)} ORDER BY block_number, log_index",
+                parameters).fetchall()
+        return [{
+            "event": event,
+            "args": json.loads(arguments),
+            "address": row_address,
+            "blockNumber": block_number,
+            "blockHash": HexBytes(block_hash),
+            "transactionHash": HexBytes(transaction_hash),
+            "transactionIndex": transaction_index,
+            "logIndex": log_index
+        } for row_address, block_number, log_index, event, transaction_hash, transaction_index, block_hash, arguments
+            in rows]
+
+
+def parse_conditions(conditions: Iterable[str]) -> Dict[str, str]:
+    """
+    :param conditions: Conditions in NAME=VALUE format
+    :return: Values by argument name
+    :rtype: Dict[str, str]
+    :raises ValueError: Condition isn't in NAME=VALUE format
+    """
+    result = {}
+    for condition in conditions:
+        name, separator, value = condition.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"Condition {condition!r} isn't in NAME=VALUE format")
+        result[name.strip()] = value.strip()
+    return result
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Module for scanning contract logs over any block range with concurrent eth_getLogs requests
+
+The range is partitioned into chunks that are fetched in parallel. A chunk for which the provider
+refuses to return all results is split in halves, and later chunks get the smaller size too.
+Logs are decoded in the worker threads and yielded in block order as soon as all earlier chunks
+are done.
+"""
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from eth_abi import decode
+from eth_utils import collapse_if_tuple
+from hexbytes import HexBytes
+from web3 import Web3
+
+from .batch import RpcError
+from .clients import post_json
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_MAX_WORKERS = 4
+MAX_CHUNK_SIZE = 100000
+
+# Error codes and messages of providers refusing a range with too many results or blocks
+_RESULT_LIMIT_CODES = (-32005, -32614)
+_RESULT_LIMIT_MESSAGE = re.compile(r"more than \d+ (results|logs|blocks)|too many (results|logs|blocks)|"
+                                   r"range (is )?too (large|big|wide)|block range|limited to|response size|"
+                                   r"exceeds? (the )?max(imum)? (results|logs|blocks|range)",
+                                   re.IGNORECASE)
+# Messages of rate limits and exhausted quotas, which the same code can be used for
+_QUOTA_MESSAGE = re.compile(r"rate limit|capacity|quota|credits|compute units|daily|monthly|request count",
+                            re.IGNORECASE)
+
+
+def is_result_limit(error: RpcError) -> bool:
+    """
+    :param RpcError error: Error returned for eth_getLogs
+    :return: Provider refused the range because of its size and a smaller range can succeed, False
+             for rate limits and quotas that splitting would only make worse
+    :rtype: bool
+    """
+    if _QUOTA_MESSAGE.search(error.message):
+        return False
+    return error.code in _RESULT_LIMIT_CODES or bool(_RESULT_LIMIT_MESSAGE.search(error.message))
+
+
+class EventDecoder:
+    """
+    Decoder of the logs of one event, with the types of its arguments resolved once
+
+    :param dict event_abi: ABI entry of the event
+    """
+
+    def __init__(self, event_abi: Dict[str, Any]):
+        self.name = event_abi["name"]
+        inputs = event_abi.get("inputs", [])
+        self._names = [argument["name"] for argument in inputs]
+        self._indexed = [argument for argument in inputs if argument.get("indexed")]
+        self._data = [argument for argument in inputs if not argument.get("indexed")]
+        self._data_types = [collapse_if_tuple(argument) for argument in self._data]
+
+    @staticmethod
+    def _normalize(abi_type: str, value):
+        return Web3.to_checksum_address(value) if abi_type == "address" else value
+
+    def _topic_value(self, argument: Dict[str, Any], topic: bytes):
+        abi_type = collapse_if_tuple(argument)
+        # Reference types are indexed by their hash
+        if abi_type in ("string", "bytes") or "[" in abi_type or abi_type.startswith("("):
+            return HexBytes(topic)
+        return self._normalize(abi_type, decode([abi_type], topic)[0])
+
+    def decode(self, logs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        :param logs: Logs of the event as returned by eth_getLogs
+        :return: Logs with their decoded arguments, logs removed by a reorganization are left out
+        :rtype: List[Dict[str, Any]]
+        """
+        result = []
+        for log in logs:
+            if log.get("removed"):
+                continue
+            topics = [HexBytes(topic) for topic in log.get("topics", [])][1:]
+            values = {argument["name"]: self._topic_value(argument, topic)
+                      for argument, topic in zip(self._indexed, topics)}
+            data = decode(self._data_types, HexBytes(log.get("data", "0x")))
+            values.update((argument["name"], self._normalize(abi_type, value))
+                          for argument, abi_type, value in zip(self._data, self._data_types, data))
+            result.append({
+                "event": self.name,
+                "args": {name: values.get(name) for name in self._names},
+                "address": Web3.to_checksum_address(log["address"]),
+                "blockNumber": int(log["blockNumber"], 16),
+                "blockHash": HexBytes(log["blockHash"]),
+                "transactionHash": HexBytes(log["transactionHash"]),
+                "transactionIndex": int(log["transactionIndex"], 16),
+                "logIndex": int(log["logIndex"], 16)
+            })
+        return result
+
+
+class LogScanner:
+    """
+    Scanner of the logs of a contract
+
+    :param str provider: URL of the HTTP provider
+    :param str address: Address of the contract
+    :param list topics: Topic filters, the event topic first
+    :param EventDecoder decoder: Decoder of the logs, raw logs are returned if None
+    :param int chunk_size: Number of blocks requested at first in one call
+    :param int max_workers: Maximum number of requests in flight
+    """
+
+    def __init__(self, provider: str, address: str, topics: List[Optional[str]], decoder: EventDecoder = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.provider = provider
+        self.address = Web3.to_checksum_address(address)
+        self.topics = topics
+        self.decoder = decoder
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        # Largest chunk worth trying after the provider refused a range
+        self._ceiling = MAX_CHUNK_SIZE
+        self.requests = 0
+        self.splits = 0
+        self._lock = threading.Lock()
+
+    def _get_logs(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.requests += 1
+        response = post_json(self.provider, {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "eth_getLogs",
+            "params": [{
+                "fromBlock": hex(from_block),
+                "toBlock": hex(to_block),
+                "address": self.address,
+                "topics": self.topics
+            }]
+        })
+        error = response.get("error")
+        if error is not None:
+            raise RpcError(error.get("code", 0), error.get("message", "Unknown error"), error.get("data"))
+        return response.get("result") or []
+
+    def _fetch(self, executor: ThreadPoolExecutor, from_block: int, to_block: int):
+        try:
+            logs = self._get_logs(from_block, to_block)
+        except RpcError as error:
+            if from_block == to_block or not is_result_limit(error):
+                raise
+            middle = (from_block + to_block) // 2
+            with self._lock:
+                self.splits += 1
+                self._ceiling = max(1, min(self._ceiling, (to_block - from_block + 1) // 2))
+                self.chunk_size = min(self.chunk_size, self._ceiling)
+            return (executor.submit(self._fetch, executor, from_block, middle),
+                    executor.submit(self._fetch, executor, middle + 1, to_block))
+        if len(logs) == 0:
+            with self._lock:
+                self.chunk_size = min(self._ceiling, max(self.chunk_size, (to_block - from_block + 1) * 2))
+        return self.decoder.decode(logs) if self.decoder else logs
+
+    def scan(self, from_block: int, to_block: int) -> Iterator[Dict[str, Any]]:
+        """
+        Get the logs of a block range
+
+        Closing the iterator early cancels the requests not started yet.
+
+        :param int from_block: First block of the range
+        :param int to_block: Last block of the range
+        :return: Logs in block order
+        :rtype: Iterator[Dict[str, Any]]
+        :raises RpcError: Provider returned an error other than a result limit
+        :raises requests.RequestException: Request failed
+        """
+        next_block = from_block
+        pending: deque = deque()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or next_block <= to_block:
+                # Keep the workers busy without requesting far ahead of the consumer
+                while next_block <= to_block and len(pending) < self.max_workers * 2:
+                    last_block = min(to_block, next_block + self.chunk_size - 1)
+                    pending.append(executor.submit(self._fetch, executor, next_block, last_block))
+                    next_block = last_block + 1
+                result = pending.popleft().result()
+                if isinstance(result, tuple):
+                    pending.extendleft(reversed(result))
+                    continue
+                yield from result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
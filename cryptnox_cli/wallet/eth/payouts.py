@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Module for paying many Ethereum addresses with sequential nonces allocated locally
+
+The state of a batch is kept in a journal on disk and written before every step that can't be
+repeated. Nonces are allocated and saved before signing and signed transactions are saved
+before broadcasting. A batch resumed after a crash broadcasts the same signed transactions
+again, so a nonce is never reused for another payment or skipped.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, List
+
+from eth_account._utils.legacy_transactions import Transaction
+from eth_utils import keccak
+from web3 import Web3
+
+from ..btc_batch import PaymentListError, read_rows
+from ..storage import cache_path, read_json, write_json
+
+SIGNED = "signed"
+SENT = "sent"
+FAILED = "failed"
+
+# Errors of nodes that already have the transaction
+_KNOWN_ERRORS = ("already known", "known transaction", "alreadyknown")
+# Errors for which the signed transaction can never be accepted, so it is signed again
+_PERMANENT_ERRORS = ("nonce too low", "underpriced", "insufficient funds", "intrinsic gas too low",
+                     "exceeds block gas limit", "invalid sender", "less than block base fee")
+
+
+def read_payouts(path, integer: bool = False) -> List[Dict]:
+    """
+    Read and validate a list of payouts, reporting all invalid entries together
+
+    :param path: Path of the CSV or JSON lines file with address and amount of each payout
+    :param bool integer: Amounts must be whole numbers, for token amounts in base units
+    :return: Payouts with line number, checksum address and amount as string
+    :rtype: List[Dict]
+    :raises PaymentListError: The list has invalid entries or is empty
+    """
+    payouts = []
+    errors = []
+    for line, address, amount in read_rows(Path(path)):
+        if not isinstance(address, str) or not Web3.is_address(address):
+            errors.append(f"Line {line}: invalid address {address!r}")
+            continue
+        try:
+            value = Decimal(str(amount).strip())
+        except InvalidOperation:
+            value = None
+        if value is None or not value.is_finite() or value <= 0:
+            errors.append(f"Line {line}: invalid amount {amount!r}")
+            continue
+        if integer and value != value.to_integral_value():
+            errors.append(f"Line {line}: token amount {amount!r} isn't a whole number of base units")
+            continue
+        payouts.append({"line": line, "to": Web3.to_checksum_address(address), "amount": str(value)})
+    if not payouts and not errors:
+        errors.append("No payments in the list")
+    if errors:
+        raise PaymentListError(errors)
+    return payouts
+
+
+class PayoutJournal:
+    """
+    Journal of one payout batch
+
+    :param str sender: Address paying the batch
+    :param int chain_id: Id of the chain
+    :param list payouts: Payouts of the batch as returned by read_payouts
+    :param str token: Address of the ERC20 contract, None for ETH
+    :param Path path: File of the journal, in the application cache directory by default
+    """
+
+    def __init__(self, sender: str, chain_id: int, payouts: List[Dict], token: str = None, path: Path = None):
+        digest = hashlib.sha256(repr((sender, chain_id, token, payouts)).encode()).hexdigest()[:16]
+        self.path = path or cache_path("eth-payouts", f"{chain_id}-{sender}-{digest}.json")
+        self._lock = threading.Lock()
+        self.state = read_json(self.path, None) or {
+            "sender": sender,
+            "chain_id": chain_id,
+            "token": token,
+            "entries": [dict(payout, nonce=None, raw=None, hash=None, status=None, error=None)
+                        for payout in payouts]
+        }
+
+    @property
+    def entries(self) -> List[Dict]:
+        return self.state["entries"]
+
+    def save(self) -> None:
+        with self._lock:
+            write_json(self.path, self.state)
+
+    def allocate_nonces(self, next_nonce: int) -> List[Dict]:
+        """
+        Give the entries not signed yet sequential nonces from the pending transaction count,
+        skipping the nonces of the signed entries, and save them
+
+        Nonces of unsigned entries were never used, so they are allocated again in case the
+        sender made other transactions in between. Nonces of transactions that were rejected for
+        good are free again and are filled first, so the later transactions aren't stuck.
+
+        :param int next_nonce: Pending transaction count of the sender
+        :return: Entries to sign
+        :rtype: List[Dict]
+        """
+        signed = {entry["nonce"] for entry in self.entries if entry["raw"] is not None}
+        nonce = next_nonce
+        entries = self.unsigned()
+        for entry in entries:
+            while nonce in signed:
+                nonce += 1
+            entry["nonce"] = nonce
+            nonce += 1
+        self.save()
+        return entries
+
+    def unsigned(self) -> List[Dict]:
+        return [entry for entry in self.entries if entry["raw"] is None]
+
+    def unsent(self) -> List[Dict]:
+        return [entry for entry in self.entries if entry["raw"] is not None and entry["status"] != SENT]
+
+    def unsent_gas_cost(self) -> int:
+        """
+        :return: Maximum gas cost in wei of the signed transactions not sent yet
+        :rtype: int
+        """
+        cost = 0
+        for entry in self.unsent():
+            transaction = Transaction.from_bytes(bytes.fromhex(entry["raw"]))
+            cost += transaction.gasPrice * transaction.gas
+        return cost
+
+    def record_signed(self, entry: Dict, raw: bytes) -> None:
+        entry["raw"] = raw.hex()
+        entry["hash"] = "0x" + keccak(raw).hex()
+        entry["status"] = SIGNED
+        self.save()
+
+    def broadcast(self, push_raw, has_transaction=None, max_workers: int = 8) -> List[Dict]:
+        """
+        Broadcast all signed transactions not known to be sent yet in parallel
+
+        Transactions rejected for good lose their signature and nonce, so the next run signs
+        them again. A transaction with a nonce too low can be our own, sent by a run that stopped
+        before saving it, so it is looked up before.
+
+        :param push_raw: Callable sending a raw signed transaction
+        :param has_transaction: Callable telling whether the node knows a transaction hash
+        :param int max_workers: Maximum number of parallel broadcasts
+        :return: Entries that were broadcast, with their status and error
+        :rtype: List[Dict]
+        """
+        entries = self.unsent()
+
+        def push(entry):
+            try:
+                push_raw(bytes.fromhex(entry["raw"]))
+            except Exception as error:
+                message = str(error.args[0].get("message", error)) if error.args and \
+                    isinstance(error.args[0], dict) else str(error)
+                lowered = message.lower()
+                if any(known in lowered for known in _KNOWN_ERRORS) or \
+                        ("nonce too low" in lowered and has_transaction is not None and
+                         has_transaction(entry["hash"])):
+                    entry["status"], entry["error"] = SENT, None
+                elif any(permanent in lowered for permanent in _PERMANENT_ERRORS):
+                    entry["status"], entry["error"] = FAILED, f"{message} (nonce {entry['nonce']})"
+                    entry["raw"] = entry["nonce"] = entry["hash"] = None
+                else:
+                    entry["status"], entry["error"] = FAILED, message
+            else:
+                entry["status"], entry["error"] = SENT, None
+            self.save()
+
+        if entries:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(entries))) as executor:
+                list(executor.map(push, entries))
+        return entries
+
+    def done(self) -> bool:
+        return all(entry["status"] == SENT for entry in self.entries)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Module for caching the responses of idempotent JSON-RPC reads of a provider
+
+The chain id never changes, so it is fetched once. The block number is kept for about one block
+time. Calls and contract code at a block number given by the caller are kept until evicted, as the
+state at a given block doesn't change. Results of the latest block are kept apart for one block
+time, since the node may have answered from a newer block than the one last seen.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from eth_utils.toolz import curry
+from web3.middleware.base import Web3MiddlewareBuilder
+
+DEFAULT_BLOCK_TIME = 12
+DEFAULT_MAXSIZE = 1024
+
+_BY_BLOCK = ("eth_call", "eth_getCode")
+_STATE_CHANGING = ("eth_sendRawTransaction", "eth_sendTransaction")
+
+
+class RpcCacheInfo(NamedTuple):
+    """
+    Usage of the cache
+
+    :param dict hits: Responses served from the cache by method
+    :param dict misses: Requests sent to the provider by cached method
+    :param int evictions: Entries removed to keep the size bounded
+    :param int maxsize: Maximum number of entries
+    :param int currsize: Current number of entries
+    """
+    hits: Dict[str, int]
+    misses: Dict[str, int]
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class RpcCache:
+    """
+    Thread safe least recently used cache of JSON-RPC responses of one provider
+
+    :param int maxsize: Maximum number of responses kept
+    :param float block_time: Seconds the block number and the results of the latest block are kept
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, block_time: float = DEFAULT_BLOCK_TIME):
+        self.maxsize = maxsize
+        self.block_time = block_time
+        # Expiry time, None for never, and response by key
+        self._entries: "OrderedDict[Tuple, Tuple[Optional[float], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._evictions = 0
+
+    def _key(self, method: str, params: Any, now: float) -> Tuple[Optional[Tuple], Optional[float]]:
+        """
+        :return: Key of the response and its expiry time, no key if the response can't be cached
+        """
+        if method == "eth_chainId":
+            return (method,), None
+        if method == "eth_blockNumber":
+            return (method,), now + self.block_time
+        if method not in _BY_BLOCK or not params:
+            return None, None
+        block = params[1] if len(params) > 1 else "latest"
+        if not isinstance(block, str):
+            return None, None
+        try:
+            target = json.dumps(params[0], sort_keys=True)
+        except TypeError:
+            return None, None
+        if block.startswith("0x"):
+            return (method, int(block, 16), target), None
+        if block != "latest":
+            # Pending, safe and finalized states change without a new block number
+            return None, None
+        return (method, "latest", target), now + self.block_time
+
+    def get(self, method: str, params: Any, make_request: Callable[[str, Any], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Get the response of a request, sending it when it's not cached
+
+        :param str method: JSON-RPC method
+        :param params: Parameters of the method
+        :param make_request: Function sending the request
+        :return: Cached or received response
+        :rtype: Dict[str, Any]
+        """
+        now = time.monotonic()
+        key, expiry = self._key(method, params, now)
+        if key is None:
+            response = make_request(method, params)
+            if method in _STATE_CHANGING:
+                self.invalidate_latest()
+            return response
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self._hits[method] = self._hits.get(method, 0) + 1
+                return dict(entry[1])
+            self._misses[method] = self._misses.get(method, 0) + 1
+
+        response = make_request(method, params)
+        if "error" in response or response.get("result") is None:
+            return response
+
+        with self._lock:
+            self._entries[key] = (expiry, dict(response))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return response
+
+    def invalidate_latest(self) -> None:
+        """
+        Forget the block number and the results of the latest block
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key == ("eth_blockNumber",) or key[1:2] == ("latest",)]:
+                del self._entries[key]
+
+    def info(self) -> RpcCacheInfo:
+        """
+        :return: Statistics of the cache usage
+        :rtype: RpcCacheInfo
+        """
+        with self._lock:
+            return RpcCacheInfo(dict(self._hits), dict(self._misses), self._evictions, self.maxsize,
+                                len(self._entries))
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits.clear()
+            self._misses.clear()
+            self._evictions = 0
+
+
+class RpcCacheMiddleware(Web3MiddlewareBuilder):
+    """
+    Web3 middleware answering idempotent reads from an RpcCache
+    """
+    cache: RpcCache
+
+    @staticmethod
+    @curry
+    def build(cache: RpcCache, w3) -> "RpcCacheMiddleware":
+        """
+        :param RpcCache cache: Cache of the provider of the Web3 instance
+        :param w3: Web3 instance, given by Web3 when the middleware is used
+        :return: Middleware using the cache
+        :rtype: RpcCacheMiddleware
+        """
+        middleware = RpcCacheMiddleware(w3)
+        middleware.cache = cache
+        return middleware
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            return self.cache.get(method, params, make_request)
+
+        return middleware
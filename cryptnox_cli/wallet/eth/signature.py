@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Module for turning DER signatures of the card into Ethereum v, r and s values
+
+The card returns DER signatures without the recovery id. Instead of recovering the candidate
+public keys and comparing them with the key of the card, the signature is verified against the
+key of the card. The verification computes the point R of the signature, and the parity of its
+y coordinate is the recovery id. This takes one joint multiplication instead of one for every
+candidate.
+
+Run the module to compare its speed with the recovery by the ecdsa library::
+
+    python -m cryptnox_cli.wallet.eth.signature
+"""
+import hashlib
+import os
+import timeit
+from typing import Tuple
+
+import ecdsa
+
+try:
+    from lib.cryptos.main import Gx, Gy, N, from_jacobian, inv, jacobian_add, jacobian_double
+except ImportError:
+    from ...lib.cryptos.main import Gx, Gy, N, from_jacobian, inv, jacobian_add, jacobian_double
+
+_INFINITY = (0, 0, 1)
+
+
+def decode_der(signature: bytes) -> Tuple[int, int]:
+    """
+    :param bytes signature: DER encoded signature, with or without a trailing sighash byte
+    :return: r and s values of the signature
+    :rtype: Tuple[int, int]
+    :raises ValueError: Signature isn't DER encoded
+    """
+    signature = bytes(signature)
+    if len(signature) < 8 or signature[0] != 0x30 or signature[1] > len(signature) - 2:
+        raise ValueError("Signature isn't DER encoded")
+    values = []
+    offset = 2
+    for _ in range(2):
+        if offset + 2 > len(signature) or signature[offset] != 0x02:
+            raise ValueError("Signature isn't DER encoded")
+        length = signature[offset + 1]
+        start, offset = offset + 2, offset + 2 + length
+        if length == 0 or offset > 2 + signature[1]:
+            raise ValueError("Signature isn't DER encoded")
+        values.append(int.from_bytes(signature[start:offset], "big"))
+    return values[0], values[1]
+
+
+def _double_multiply(first: tuple, first_factor: int, second: tuple, second_factor: int) -> tuple:
+    # Shamir's trick: one pass of doublings for the sum of both products
+    both = jacobian_add(first, second)
+    addends = (None, first, second, both)
+    result = _INFINITY
+    for bit in range(max(first_factor.bit_length(), second_factor.bit_length()) - 1, -1, -1):
+        result = jacobian_double(result)
+        addend = addends[(first_factor >> bit & 1) | (second_factor >> bit & 1) << 1]
+        if addend is not None:
+            result = jacobian_add(result, addend)
+    return result
+
+
+def recovery_parity(digest: bytes, var_r: int, var_s: int, public_key: Tuple[int, int]) -> int:
+    """
+    Verify a signature and get the parity of the y coordinate of its point R
+
+    :param bytes digest: Signed hash
+    :param int var_r: r value of the signature
+    :param int var_s: s value of the signature
+    :param tuple public_key: Point of the public key that made the signature
+    :return: 0 if y of R is even, 1 if it's odd
+    :rtype: int
+    :raises ValueError: Signature wasn't made by the key for the hash
+    """
+    if not (0 < var_r < N and 0 < var_s < N):
+        raise ValueError("Signature values out of range")
+    var_w = inv(var_s, N)
+    point = _double_multiply((Gx, Gy, 1), int.from_bytes(digest, "big") * var_w % N,
+                             (public_key[0], public_key[1], 1), var_r * var_w % N)
+    if not point[1] or not point[2]:
+        raise ValueError("Signature doesn't match the public key")
+    var_x, var_y = from_jacobian(point)
+    if var_x % N != var_r:
+        raise ValueError("Signature doesn't match the public key")
+    return var_y & 1
+
+
+def vrs(signature: bytes, digest: bytes, public_key: Tuple[int, int], chain_id: int = None,
+        typed: bool = False) -> Tuple[int, int, int]:
+    """
+    Get the v, r and s values of a transaction signature
+
+    The s value is normalized to the lower half of the curve order as required since EIP-2.
+
+    :param bytes signature: DER signature generated by the card
+    :param bytes digest: Signed transaction hash
+    :param tuple public_key: Point of the public key of the card
+    :param int chain_id: Chain id for EIP-155 legacy transactions, None for the original 27 and 28
+    :param bool typed: Return the y parity as v, for typed transactions
+    :return: v, r and s values
+    :rtype: Tuple[int, int, int]
+    :raises ValueError: Signature isn't valid for the hash and key
+    """
+    var_r, var_s = decode_der(signature)
+    parity = recovery_parity(digest, var_r, var_s, public_key)
+    if var_s > N // 2:
+        var_s = N - var_s
+        parity ^= 1
+
+    if typed:
+        var_v = parity
+    elif chain_id is None:
+        var_v = 27 + parity
+    else:
+        var_v = 35 + 2 * chain_id + parity
+    return var_v, var_r, var_s
+
+
+def _ecdsa_vrs(signature: bytes, digest: bytes, public_key: Tuple[int, int], chain_id: int) -> Tuple[int, int, int]:
+    # Recovery of all candidate keys with the ecdsa library, as done before
+    curve = ecdsa.curves.SECP256k1
+    var_r, var_s = ecdsa.util.sigdecode_der(signature, curve.generator.order())
+    candidate = ecdsa.keys.VerifyingKey.from_public_key_recovery_with_digest(
+        signature, digest, curve, sigdecode=ecdsa.util.sigdecode_der)[1]
+    expected = public_key[0].to_bytes(32, "big") + public_key[1].to_bytes(32, "big")
+    return 2 * chain_id + (36 if candidate.to_string() == expected else 35), var_r, var_s
+
+
+def benchmark(rounds: int = 50) -> None:
+    """
+    Print the time of getting v, r and s of random signatures with both methods
+
+    :param int rounds: Number of signatures to time
+    """
+    key = ecdsa.SigningKey.generate(curve=ecdsa.curves.SECP256k1)
+    point = key.get_verifying_key().pubkey.point
+    public_key = (point.x(), point.y())
+    samples = []
+    for _ in range(rounds):
+        digest = hashlib.sha256(os.urandom(32)).digest()
+        # Low s signatures, so both methods must give the same values
+        signature = key.sign_digest(digest, sigencode=ecdsa.util.sigencode_der_canonize)
+        if vrs(signature, digest, public_key, 1) != _ecdsa_vrs(signature, digest, public_key, 1):
+            raise AssertionError("Methods returned different values")
+        samples.append((signature, digest))
+
+    for name, method in (("ecdsa recovery", _ecdsa_vrs), ("verification parity", vrs)):
+        seconds = timeit.timeit(lambda: [method(signature, digest, public_key, 1) for signature, digest in samples],
+                                number=1)
+        print(f"{name:>20}: {seconds / rounds * 1000:.2f} ms per signature")
+
+
+if __name__ == "__main__":
+    benchmark()
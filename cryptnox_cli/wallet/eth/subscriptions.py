@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Module for eth_subscribe subscriptions over the WebSocket endpoint of a provider
+
+Subscriptions reconnect on their own when the connection drops. A logs subscription started from
+a block first gets the logs since that block with eth_getLogs, and again after every reconnect for
+the blocks missed in between, so no log is lost and none is delivered twice.
+"""
+import asyncio
+import itertools
+import json
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import websockets
+
+from .batch import RpcError
+
+DEFAULT_RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+# Logs remembered for leaving out the ones delivered by both a backfill and the subscription
+_SEEN_LOGS = 4096
+
+logger = logging.getLogger(__name__)
+
+
+class Connection:
+    """
+    JSON-RPC client over an open WebSocket, dispatching responses and subscription notifications
+
+    :param websocket: Open WebSocket connection
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._notifications: Dict[str, asyncio.Queue] = {}
+        self._closed: Optional[BaseException] = None
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self) -> None:
+        try:
+            async for message in self.websocket:
+                data = json.loads(message)
+                if data.get("method") == "eth_subscription":
+                    params = data.get("params", {})
+                    self._queue(params.get("subscription")).put_nowait(params.get("result"))
+                    continue
+                future = self._pending.pop(data.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if data.get("error") is not None:
+                    error = data["error"]
+                    future.set_exception(RpcError(error.get("code", 0), error.get("message", "Unknown error"),
+                                                  error.get("data")))
+                else:
+                    future.set_result(data.get("result"))
+            self._closed = websockets.ConnectionClosedOK(None, None)
+        except (websockets.ConnectionClosed, OSError, ValueError) as error:
+            self._closed = error
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Connection closed: {self._closed}"))
+        for queue in self._notifications.values():
+            queue.put_nowait(self._closed)
+
+    def _queue(self, subscription: str) -> asyncio.Queue:
+        return self._notifications.setdefault(subscription, asyncio.Queue())
+
+    async def request(self, method: str, params: List = None) -> Any:
+        """
+        :param str method: JSON-RPC method
+        :param list params: Parameters of the method
+        :return: Result of the call
+        :raises RpcError: Node returned an error
+        :raises ConnectionError: Connection closed before the response
+        """
+        if self._closed is not None:
+            raise ConnectionError(f"Connection closed: {self._closed}")
+        request_id = next(self._ids)
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        await self.websocket.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method,
+                                              "params": params or []}))
+        return await future
+
+    async def subscribe(self, kind: str, *params) -> str:
+        """
+        :param str kind: Kind of subscription, logs or newHeads
+        :param params: Filter of the subscription
+        :return: Id of the subscription
+        :rtype: str
+        """
+        subscription = await self.request("eth_subscribe", [kind, *params])
+        self._queue(subscription)
+        return subscription
+
+    async def notifications(self, subscription: str) -> AsyncIterator[Any]:
+        """
+        :param str subscription: Id of the subscription
+        :return: Results sent for the subscription until the connection closes
+        :raises ConnectionError: Connection closed
+        """
+        queue = self._queue(subscription)
+        while True:
+            item = await queue.get()
+            if isinstance(item, BaseException):
+                raise ConnectionError(f"Connection closed: {item}")
+            yield item
+
+    async def close(self) -> None:
+        self._reader.cancel()
+        await self.websocket.close()
+
+
+class Subscriber:
+    """
+    Subscriptions of one WebSocket endpoint, reconnecting when the connection drops
+
+    :param str url: WebSocket URL of the provider
+    :param float reconnect_delay: Seconds to wait before the first reconnect, doubled up to
+                                  MAX_RECONNECT_DELAY for every failed attempt
+    :param float open_timeout: Seconds to wait for the connection to open
+    """
+
+    def __init__(self, url: str, reconnect_delay: float = DEFAULT_RECONNECT_DELAY, open_timeout: float = 10):
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.open_timeout = open_timeout
+        self.connections = 0
+
+    async def connect(self) -> Connection:
+        """
+        :return: New connection to the endpoint
+        :rtype: Connection
+        """
+        websocket = await websockets.connect(self.url, open_timeout=self.open_timeout, max_size=None)
+        self.connections += 1
+        return Connection(websocket)
+
+    async def _reconnecting(self, kind: str, params: List, on_connect=None) -> AsyncIterator[Any]:
+        delay = self.reconnect_delay
+        while True:
+            connection = None
+            try:
+                connection = await self.connect()
+                subscription = await connection.subscribe(kind, *params)
+                delay = self.reconnect_delay
+                if on_connect is not None:
+                    for item in await on_connect(connection):
+                        yield item
+                async for item in connection.notifications(subscription):
+                    yield item
+            except (ConnectionError, OSError, asyncio.TimeoutError, websockets.WebSocketException) as error:
+                logger.debug("Subscription to %s lost: %s", kind, error)
+            finally:
+                if connection is not None:
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def heads(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        :return: Headers of new blocks, with block numbers as hex strings like the node sends them
+        """
+        return self._reconnecting("newHeads", [])
+
+    async def logs(self, address: Union[str, List[str]], topics: List, from_block: int = None) \
+            -> AsyncIterator[Dict[str, Any]]:
+        """
+        Logs matching a filter, including the ones of reorganized blocks with removed set
+
+        :param address: Address or addresses of the contracts
+        :param list topics: Topic filters, the event topic first
+        :param int from_block: First block to get logs from, only new logs if None
+        :return: Logs as returned by eth_getLogs
+        """
+        log_filter = {"address": address, "topics": topics}
+        # The block of the last delivered log is fetched again, the connection can drop between
+        # two logs of the same block. Repeated logs are left out.
+        next_start = from_block
+        seen = deque(maxlen=_SEEN_LOGS)
+        seen_keys = set()
+
+        async def backfill(connection: Connection) -> List[Dict[str, Any]]:
+            if next_start is None:
+                return []
+            head = int(await connection.request("eth_blockNumber"), 16)
+            if head < next_start:
+                return []
+            return await connection.request("eth_getLogs", [dict(log_filter, fromBlock=hex(next_start),
+                                                                 toBlock=hex(head))]) or []
+
+        async for log in self._reconnecting("logs", [log_filter], backfill):
+            key = (log.get("blockHash"), log.get("transactionHash"), log.get("logIndex"), bool(log.get("removed")))
+            if key in seen_keys:
+                continue
+            if len(seen) == seen.maxlen:
+                seen_keys.discard(seen[0])
+            seen.append(key)
+            seen_keys.add(key)
+            if not log.get("removed"):
+                next_start = max(next_start or 0, int(log["blockNumber"], 16))
+            yield log
+
+
+async def wait_for_receipt(url: str, transaction_hash: str, timeout: float = 300) -> Dict[str, Any]:
+    """
+    Wait until a transaction is included in a block, checking at every new block
+
+    :param str url: WebSocket URL of the provider
+    :param str transaction_hash: Hash of the transaction in hex format
+    :param float timeout: Seconds to wait
+    :return: Receipt of the transaction
+    :rtype: Dict[str, Any]
+    :raises asyncio.TimeoutError: Transaction wasn't included in time
+    """
+    subscriber = Subscriber(url)
+
+    async def wait() -> Dict[str, Any]:
+        while True:
+            connection = await subscriber.connect()
+            try:
+                subscription = await connection.subscribe("newHeads")
+                # The transaction can be in a block mined before subscribing
+                receipt = await connection.request("eth_getTransactionReceipt", [transaction_hash])
+                if receipt:
+                    return receipt
+                async for _ in connection.notifications(subscription):
+                    receipt = await connection.request("eth_getTransactionReceipt", [transaction_hash])
+                    if receipt:
+                        return receipt
+            except ConnectionError as error:
+                logger.debug("Waiting for receipt interrupted: %s", error)
+            finally:
+                await connection.close()
+            await asyncio.sleep(subscriber.reconnect_delay)
+
+    return await asyncio.wait_for(wait(), timeout)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Module for watching contract events in the background with asyncio
+
+Every poll sends one JSON-RPC batch with the eth_getLogs calls of all watched events to each
+endpoint, over one keep-alive connection per endpoint. The last polled block and the number of new
+events of every watched event are kept on disk, so the counts survive restarts and only new blocks
+are requested.
+
+Endpoints with a WebSocket URL also get a logs subscription for the watched events. A new log wakes
+up the poll at once instead of at the next interval, and after a reconnect the logs of the blocks
+missed in between wake it up too.
+"""
+import asyncio
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .batch import RpcError
+from .logs import is_result_limit
+from .subscriptions import Subscriber
+from ..storage import cache_path, read_json, write_json
+
+DEFAULT_INTERVAL = 60
+
+# Count of an event with more results than the provider returns at once
+MANY = -1
+
+logger = logging.getLogger(__name__)
+
+
+class Watch(NamedTuple):
+    """
+    Event to watch
+
+    :param tuple label: Card serial number, contract alias and event name the count is shown for
+    :param str provider: URL of the HTTP provider
+    :param str address: Address of the contract
+    :param str topic: Topic of the event in hex format
+    :param int seen: Last block the user has seen the events of, None to count from the next poll
+    :param str websocket: WebSocket URL of the provider for being notified of new events, None to only poll
+    :param int chain_id: Chain the contract is on, the checkpoints are by provider host if it's None
+    """
+    label: Tuple[str, str, str]
+    provider: str
+    address: str
+    topic: str
+    seen: Optional[int] = None
+    websocket: Optional[str] = None
+    chain_id: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        # Same contract address on two chains are two contracts
+        chain = str(self.chain_id) if self.chain_id is not None else urlsplit(self.provider).netloc
+        return ":".join(self.label[:1] + (chain, self.address.lower(), self.topic))
+
+
+class EventWatcher:
+    """
+    Background watcher counting new events
+
+    :param int interval: Seconds between polls
+    :param Path path: File of the checkpoints, in the application cache directory by default
+    """
+
+    def __init__(self, interval: int = DEFAULT_INTERVAL, path=None):
+        self.interval = interval
+        self.path = path or cache_path("eth-watch.json")
+        self.state: Dict[str, Dict[str, int]] = read_json(self.path, {})
+        self._watches: List[Watch] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._subscriptions: Dict[str, Tuple[Tuple, asyncio.Task]] = {}
+
+    def watch(self, watches: List[Watch]) -> None:
+        """
+        Replace the watched events and poll them soon
+
+        :param list watches: Events to watch
+        """
+        with self._lock:
+            changed = watches != self._watches
+            self._watches = list(watches)
+        if changed and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def counts(self) -> Dict[Tuple[str, str, str], int]:
+        """
+        :return: Number of events not seen yet by label, MANY if there are too many to count
+        :rtype: Dict[Tuple[str, str, str], int]
+        """
+        with self._lock:
+            watches = list(self._watches)
+            state = {key: dict(value) for key, value in self.state.items()}
+        result = {}
+        for watch in watches:
+            entry = state.get(watch.key)
+            if entry and entry.get("count") and entry.get("seen") == watch.seen:
+                result[watch.label] = entry["count"]
+        return result
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        started = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._run(started),), daemon=True,
+                                        name="event-watcher")
+        self._thread.start()
+        started.wait()
+
+    def stop(self) -> None:
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join(timeout=5)
+        self._loop = self._thread = None
+
+    async def _run(self, started: threading.Event) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._wake = asyncio.Event()
+        started.set()
+        sessions: Dict[str, aiohttp.ClientSession] = {}
+        try:
+            while not self._stop.is_set():
+                # Events arriving during the poll wake up the next one
+                self._wake.clear()
+                await self.poll(sessions)
+                self._subscribe()
+                waits = [asyncio.ensure_future(self._stop.wait()), asyncio.ensure_future(self._wake.wait())]
+                await asyncio.wait(waits, timeout=self.interval, return_when=asyncio.FIRST_COMPLETED)
+                for wait in waits:
+                    wait.cancel()
+        finally:
+            for _, task in self._subscriptions.values():
+                task.cancel()
+            self._subscriptions.clear()
+            await asyncio.gather(*(session.close() for session in sessions.values()))
+
+    def _subscribe(self) -> None:
+        """
+        Keep one logs subscription for the watched events of every WebSocket endpoint
+        """
+        with self._lock:
+            by_url: Dict[str, List[Watch]] = {}
+            for watch in self._watches:
+                if watch.websocket:
+                    by_url.setdefault(watch.websocket, []).append(watch)
+            blocks = {url: min((self.state[watch.key]["block"] for watch in watches if watch.key in self.state),
+                               default=None)
+                      for url, watches in by_url.items()}
+        for url in list(self._subscriptions):
+            if url not in by_url:
+                self._subscriptions.pop(url)[1].cancel()
+        for url, watches in by_url.items():
+            log_filter = (tuple(sorted({watch.address.lower() for watch in watches})),
+                          tuple(sorted({watch.topic for watch in watches})))
+            current = self._subscriptions.get(url)
+            if current is not None and current[0] == log_filter and not current[1].done():
+                continue
+            if current is not None:
+                current[1].cancel()
+            if blocks[url] is None:
+                # Not polled yet, subscribed after the first successful poll
+                continue
+            task = asyncio.ensure_future(self._listen(url, log_filter, blocks[url] + 1))
+            self._subscriptions[url] = (log_filter, task)
+
+    async def _listen(self, url: str, log_filter: Tuple, from_block: int) -> None:
+        addresses, topics = log_filter
+        try:
+            async for _ in Subscriber(url).logs(list(addresses), [list(topics)], from_block):
+                self._wake.set()
+        except RpcError as error:
+            # Endpoint without subscriptions, polling goes on
+            logger.debug("Subscribing to events on %s failed: %s", url, error)
+
+    async def poll(self, sessions: Dict[str, aiohttp.ClientSession]) -> None:
+        """
+        Poll every endpoint once, concurrently
+
+        :param dict sessions: Session by provider, created for new providers
+        """
+        with self._lock:
+            watches = list(self._watches)
+        by_provider: Dict[str, List[Watch]] = {}
+        for watch in watches:
+            by_provider.setdefault(watch.provider, []).append(watch)
+        for provider in by_provider:
+            if provider not in sessions:
+                # One keep-alive connection per endpoint, the calls of a poll are batched
+                sessions[provider] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1),
+                                                           timeout=aiohttp.ClientTimeout(total=30))
+        results = await asyncio.gather(*(self._poll_provider(sessions[provider], provider, provider_watches)
+                                         for provider, provider_watches in by_provider.items()),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.debug("Polling events failed: %s", result)
+        with self._lock:
+            state = {key: dict(value) for key, value in self.state.items()}
+        try:
+            write_json(self.path, state)
+        except OSError as error:
+            logger.debug("Saving event checkpoints failed: %s", error)
+
+    @staticmethod
+    async def _post(session: aiohttp.ClientSession, provider: str, payload):
+        async with session.post(provider, json=payload) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _poll_provider(self, session: aiohttp.ClientSession, provider: str, watches: List[Watch]) -> None:
+        response = await self._post(session, provider, {"jsonrpc": "2.0", "id": 0, "method": "eth_blockNumber",
+                                                        "params": []})
+        if "error" in response:
+            raise RpcError(response["error"].get("code", 0), response["error"].get("message", "Unknown error"))
+        head = int(response["result"], 16)
+
+        ranges = []
+        with self._lock:
+            for watch in watches:
+                entry = self.state.get(watch.key)
+                if entry is None or entry.get("seen") != watch.seen:
+                    # New watch, or the user has seen the events since the last poll
+                    start = head if watch.seen is None else watch.seen
+                    entry = self.state[watch.key] = {"seen": watch.seen, "block": start, "count": 0}
+                if entry["block"] < head:
+                    ranges.append((watch, entry["block"] + 1))
+        if not ranges:
+            return
+
+        payload = [{"jsonrpc": "2.0", "id": index, "method": "eth_getLogs",
+                    "params": [{"fromBlock": hex(from_block), "toBlock": hex(head), "address": watch.address,
+                                "topics": [watch.topic]}]}
+                   for index, (watch, from_block) in enumerate(ranges)]
+        responses = await self._post(session, provider, payload)
+        if not isinstance(responses, list):
+            raise RpcError(0, "Endpoint doesn't support batch requests")
+        by_id = {response.get("id"): response for response in responses if isinstance(response, dict)}
+
+        with self._lock:
+            for index, (watch, _) in enumerate(ranges):
+                entry = self.state.get(watch.key)
+                if entry is None or entry.get("seen") != watch.seen:
+                    # Reset while polling
+                    continue
+                response = by_id.get(index, {})
+                if "result" in response:
+                    if entry["count"] != MANY:
+                        entry["count"] += sum(1 for log in response["result"] or [] if not log.get("removed"))
+                    entry["block"] = head
+                    continue
+                error = response.get("error") or {}
+                if is_result_limit(RpcError(error.get("code", 0), error.get("message", ""))):
+                    entry.update(block=head, count=MANY)
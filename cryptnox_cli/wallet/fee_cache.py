@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Module for caching fee estimates on disk
+
+The whole fee table of the explorer is kept, so any confirmation target can be served from it.
+A stale table is still used while a fresh one is fetched in the background, only a missing or
+expired table is fetched before answering. The refresh is finished before the process exits.
+"""
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+from .background import run_in_background
+from .btc import fee_for_target
+from .storage import cache_path, read_json, write_json
+
+DEFAULT_TTL = 300
+MAX_AGE = 60 * 60
+DEFAULT_BLOCKS = 6
+
+
+class FeeCache:
+    """
+    Fee estimate table of a network, persisted on disk
+
+    :param str network: Name of the network
+    :param api: API object with get_fee_table() for fetching the table, its cache_dir attribute if
+                it has one replaces the cache directory of the application
+    :param int ttl: Seconds after which the table is refreshed in the background
+    :param int max_age: Seconds after which the table isn't used anymore
+    :param Path path: File for keeping the table, in the application cache directory by default
+    """
+
+    def __init__(self, network: str, api, ttl: int = DEFAULT_TTL, max_age: int = MAX_AGE,
+                 path: Path = None):
+        self.api = api
+        self.ttl = ttl
+        self.max_age = max(max_age, ttl)
+        self.path = path or cache_path("fees", f"{network.lower()}.json", root=getattr(api, "cache_dir", None))
+        self._lock = threading.Lock()
+        self._refreshing = None
+
+    def _fetch(self) -> Dict[str, float]:
+        table = self.api.get_fee_table()
+        with self._lock:
+            write_json(self.path, {"fetched": time.time(), "table": table})
+        return table
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing is not None and self._refreshing.is_alive():
+            return
+        self._refreshing = run_in_background(self._fetch)
+
+    def table(self) -> Dict[str, float]:
+        """
+        :return: Fee rates by number of blocks to confirm in
+        :rtype: Dict[str, float]
+        """
+        with self._lock:
+            cached = read_json(self.path, {})
+        age = time.time() - cached.get("fetched", 0)
+        if not cached.get("table") or age >= self.max_age:
+            return self._fetch()
+        if age >= self.ttl:
+            self._refresh_in_background()
+        return cached["table"]
+
+    def estimate(self, blocks: int = DEFAULT_BLOCKS) -> int:
+        """
+        :param int blocks: Number of blocks the transaction should be confirmed in
+        :return: Fee rate rounded up
+        :rtype: int
+        """
+        return fee_for_target(self.table(), blocks)
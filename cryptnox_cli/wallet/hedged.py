@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Module for using many Bitcoin explorer backends as one
+
+Reads go to the backend that has been fastest and most reliable so far. If it hasn't answered
+by the time it answers 95 % of its requests, the next backend is asked as well and the first
+successful answer is used. Transactions are broadcast to all backends at once.
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, List
+
+from .btc import BlkHubApi, BlockCypherApi, DEFAULT_FETCH_WORKERS, fee_for_target, fetch_for_addresses
+
+DEFAULT_DELAY = 0.75
+MIN_DELAY = 0.05
+MAX_DELAY = 3.0
+FAILURE_PENALTY = 60
+
+
+class BackendStats:
+    """
+    Latency and error statistics of one backend
+
+    :param int samples: Number of latest latencies kept
+    """
+
+    def __init__(self, samples: int = 100):
+        self.latencies = deque(maxlen=samples)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0
+        self._lock = threading.Lock()
+
+    def success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.successes += 1
+            self.consecutive_failures = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+
+    def quantile(self, value: float, default: float = None) -> float:
+        """
+        :param float value: Quantile between 0 and 1
+        :param float default: Value if there are no samples
+        :return: Latency quantile in seconds
+        :rtype: float
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return default
+        return latencies[min(len(latencies) - 1, math.ceil(value * len(latencies)) - 1)]
+
+    def score(self) -> float:
+        """
+        :return: Expected latency in seconds, with a penalty for recent failures
+        :rtype: float
+        """
+        score = self.quantile(0.5, DEFAULT_DELAY)
+        if self.consecutive_failures and time.monotonic() - self.last_failure < FAILURE_PENALTY:
+            score += FAILURE_PENALTY * self.consecutive_failures
+        return score
+
+
+_STATS: Dict[str, BackendStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def backend_stats(url: str) -> BackendStats:
+    """
+    Statistics of the backend, shared by all clients in the process
+
+    :param str url: URL of the backend
+    :return: Statistics of the backend
+    :rtype: BackendStats
+    """
+    with _STATS_LOCK:
+        return _STATS.setdefault(url, BackendStats())
+
+
+class HedgedApi:
+    """
+    Client using many Bitcoin explorer APIs with hedged reads and broadcasting to all of them
+
+    :param backends: API objects with the interface of BlkHubApi
+    :param float quantile: Latency quantile of a backend after which the next one is asked too
+    """
+
+    def __init__(self, backends: List, quantile: float = 0.95):
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = list(backends)
+        self.quantile = quantile
+
+    @classmethod
+    def from_config(cls, network: str, config: Dict) -> "HedgedApi":
+        """
+        Create the client with the built-in backends and the Esplora URLs from the configuration
+
+        :param str network: mainnet or testnet
+        :param dict config: Bitcoin section of the configuration
+        :return: Client for the network
+        :rtype: HedgedApi
+        """
+        backends = [BlkHubApi(network)]
+        backends.extend(BlkHubApi(network, url=url.strip())
+                        for url in config.get("esplora", "").split(",") if url.strip())
+        backends.append(BlockCypherApi(config.get("blockcypher_key", ""), network))
+        return cls(backends)
+
+    @property
+    def url(self) -> str:
+        """
+        :return: URL of the backend currently preferred
+        :rtype: str
+        """
+        return self.ranked()[0].url
+
+    def ranked(self) -> List:
+        """
+        :return: Backends ordered by expected latency
+        :rtype: List
+        """
+        return sorted(self.backends, key=lambda backend: backend_stats(backend.url).score())
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        :return: Statistics of each backend by URL
+        :rtype: Dict[str, Dict]
+        """
+        result = {}
+        for backend in self.backends:
+            stats = backend_stats(backend.url)
+            result[backend.url] = {
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "p50": stats.quantile(0.5),
+                "p95": stats.quantile(0.95)
+            }
+        return result
+
+    def _hedge_delay(self, backend) -> float:
+        delay = backend_stats(backend.url).quantile(self.quantile, DEFAULT_DELAY)
+        return min(MAX_DELAY, max(MIN_DELAY, delay))
+
+    @staticmethod
+    def _attempt(backend, method: str, *args) -> Future:
+        # Daemon threads, so a backend that hangs doesn't keep the application from exiting
+        future = Future()
+        stats = backend_stats(backend.url)
+
+        def run():
+            start = time.monotonic()
+            try:
+                result = getattr(backend, method)(*args)
+            except Exception as error:
+                stats.failure()
+                future.set_exception(error)
+            else:
+                stats.success(time.monotonic() - start)
+                future.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _read(self, method: str, *args):
+        remaining = [backend for backend in self.ranked() if hasattr(backend, method)]
+        if not remaining:
+            raise IOError(f"No backend supports {method}")
+        backend = remaining.pop(0)
+        pending = {self._attempt(backend, method, *args)}
+        delay = self._hedge_delay(backend)
+        errors = []
+        while pending:
+            done, pending = wait(pending, timeout=delay if remaining else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+            # The slowest acceptable time passed or a backend failed, ask the next one
+            if remaining:
+                backend = remaining.pop(0)
+                pending.add(self._attempt(backend, method, *args))
+                delay = self._hedge_delay(backend)
+        raise IOError(f"All backends failed: {errors[0]}") from errors[0]
+
+    def get_utx_os(self, addr: str, n_conf: int = 0) -> List:
+        """
+        :param str addr: Address to look up
+        :param int n_conf: 0 or 1
+        :return: Unspent outputs of the address
+        :rtype: List
+        """
+        return self._read("get_utx_os", addr, n_conf)
+
+    def get_utx_os_many(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, List]:
+        """
+        Get the unspent outputs of many addresses with parallel hedged requests
+
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel lookups
+        :return: Unspent outputs by address
+        :rtype: Dict[str, List]
+        """
+        return fetch_for_addresses(lambda address: self.get_utx_os(address, n_conf), addresses, max_workers)
+
+    def get_balances(self, addresses, n_conf: int = 0, max_workers: int = DEFAULT_FETCH_WORKERS) -> Dict[str, int]:
+        """
+        :param addresses: Addresses to look up
+        :param int n_conf: 0 or 1
+        :param int max_workers: Maximum number of parallel lookups
+        :return: Balance in satoshis by address
+        :rtype: Dict[str, int]
+        """
+        return {address: sum(utxo['value'] for utxo in utxos)
+                for address, utxos in self.get_utx_os_many(addresses, n_conf, max_workers).items()}
+
+    def get_address_txs(self, addr: str, last_seen: str = None) -> List[Dict]:
+        """
+        Get a page of confirmed transactions of the address from the Esplora backends
+
+        :param str addr: Address to look up
+        :param str last_seen: Id of the last transaction of the previous page, None for the first page
+        :return: Transactions as returned by the API
+        :rtype: List[Dict]
+        """
+        return self._read("get_address_txs", addr, last_seen)
+
+    def get_mempool_txs(self, addr: str) -> List[Dict]:
+        """
+        :param str addr: Address to look up
+        :return: Unconfirmed transactions of the address as returned by the API
+        :rtype: List[Dict]
+        """
+        return self._read("get_mempool_txs", addr)
+
+    def get_raw_tx(self, txid: str) -> str:
+        """
+        :param str txid: Id of the transaction
+        :return: Transaction in hex format
+        :rtype: str
+        """
+        return self._read("get_raw_tx", txid)
+
+    def get_fee_table(self) -> Dict[str, float]:
+        """
+        :return: Fee rate by number of blocks to confirm in
+        :rtype: Dict[str, float]
+        """
+        return self._read("get_fee_table")
+
+    def get_fee_estimates(self, blocks: int = 6) -> int:
+        """
+        :param int blocks: Number of blocks the transaction should be confirmed in
+        :return: Fee rate estimate
+        :rtype: int
+        """
+        return fee_for_target(self.get_fee_table(), blocks)
+
+    def push_tx(self, tx_hex: str) -> str:
+        """
+        Broadcast the transaction through all backends at once
+
+        :param str tx_hex: Signed transaction in hex format
+        :return: Transaction id from the first backend accepting the transaction
+        :rtype: str
+        """
+        pending = {self._attempt(backend, "push_tx", tx_hex) for backend in self.backends}
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+
+def api_from_config(network: str, config: Dict):
+    """
+    Create the source of chain data selected by the backend key of the configuration
+
+    :param str network: mainnet or testnet
+    :param dict config: Bitcoin section of the configuration
+    :return: HedgedApi over the explorers, or the mock chain shared by the process
+    """
+    if config.get("backend", "explorer").lower() == "mock":
+        from .mock_chain import shared_mock_chain
+        return shared_mock_chain(network, auto_fund=int(config.get("mock_utxos", 10)))
+    return HedgedApi.from_config(network, config)
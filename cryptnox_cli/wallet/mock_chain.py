@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Module with an in memory Bitcoin chain standing in for the explorer APIs
+
+It has the interface of BlkHubApi, so the send pipeline can be exercised and benchmarked
+offline. Pushed transactions are parsed, their inputs are checked against the unspent outputs
+and their signatures are verified before the outputs are added to the set.
+"""
+import atexit
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from .btc import fee_for_target
+
+try:
+    from lib import cryptos
+except ImportError:
+    from ..lib import cryptos
+
+
+class MockChainError(Exception):
+    """
+    Exception for transactions the mock chain rejects
+    """
+
+
+class MockChainApi:
+    """
+    In memory unspent output set with the interface of BlkHubApi
+
+    :param str network: mainnet or testnet
+    :param float latency: Seconds every call waits
+    :param float jitter: Maximum random seconds added to the latency
+    :param float error_rate: Probability between 0 and 1 of a call failing with IOError
+    :param int auto_fund: Number of outputs created for an address when it's first looked up
+    :param int fund_value: Value in satoshis of each automatically created output
+    :param bool verify_signatures: Verify the signatures of pushed transactions
+    :param dict fee_table: Fee rates returned by get_fee_table
+    :param int seed: Seed of the random generator for repeatable runs
+
+    Caches of wallets using the mock chain are kept in a temporary cache_dir removed on exit, as
+    the chain only lives as long as the process.
+    """
+
+    def __init__(self, network: str = "testnet", latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, auto_fund: int = 0, fund_value: int = 100000,
+                 verify_signatures: bool = True, fee_table: Dict[str, float] = None, seed: int = None):
+        self.url = f"mock://{network.lower()}/"
+        self.coin = cryptos.get_coin("btc", network)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.auto_fund = auto_fund
+        self.fund_value = fund_value
+        self.verify_signatures = verify_signatures
+        self.fee_table = fee_table or {"1": 20.0, "3": 12.0, "6": 6.0, "144": 1.0}
+        self.utxos: Dict[str, Dict[str, int]] = {}
+        self.owners: Dict[str, str] = {}
+        self.transactions: Dict[str, str] = {}
+        self.records: Dict[str, Dict] = {}
+        self.history: Dict[str, List[str]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.cache_dir = tempfile.mkdtemp(prefix="cryptnox-mock-")
+        atexit.register(shutil.rmtree, self.cache_dir, True)
+
+    def _call(self) -> None:
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise IOError("Error while processing request:\nmock chain injected failure")
+
+    def fund(self, address: str, count: int = 1, value=None) -> List[str]:
+        """
+        Create outputs for the address out of thin air, with a funding transaction spending a
+        random outpoint so get_raw_tx can return it
+
+        :param str address: Address receiving the outputs
+        :param int count: Number of outputs
+        :param value: Value of each output, or tuple of minimum and maximum for random values
+        :return: Created outpoints in txid:index format
+        :rtype: List[str]
+        """
+        value = self.fund_value if value is None else value
+        script = self.coin.addrtoscript(address)
+        values = [self._random.randint(*value) if isinstance(value, tuple) else value for _ in range(count)]
+        tx_hex = cryptos.serialize({
+            "version": 1,
+            "ins": [{"outpoint": {"hash": os.urandom(32).hex(), "index": 0}, "script": "",
+                     "sequence": 0xffffffff}],
+            "outs": [{"value": output_value, "script": script} for output_value in values],
+            "locktime": 0
+        })
+        txid = cryptos.txhash(tx_hex)
+        outpoints = []
+        with self._lock:
+            self.transactions[txid] = tx_hex
+            outputs = self.utxos.setdefault(address, {})
+            for index, output_value in enumerate(values):
+                outpoint = f"{txid}:{index}"
+                outputs[outpoint] = output_value
+                self.owners[outpoint] = address
+                outpoints.append(outpoint)
+        return outpoints
+
+    def get_utx_os(self, addr: str, _n_conf: int = 0) -> List:
+        """
+        :param str addr: Address to look up
+        :param int _n_conf: Not used, all outputs are confirmed
+        :return: Unspent outputs in the format of BlkHubApi
+        :rtype: List
+        """
+        self._call()
+        if self.auto_fund and addr not in self.utxos:
+            self.fund(addr, self.auto_fund)
+        with self._lock:
+            return [{'value': value, 'output': outpoint}
+                    for outpoint, value in self.utxos.get(addr, {}).items()]
+
+    def get_address_txs(self, addr: str, last_seen: str = None) -> List[Dict]:
+        """
+        :param str addr: Address to look up
+        :param str last_seen: Id of the last transaction of the previous page, None for the first page
+        :return: Up to 25 pushed transactions of the address in the Esplora format, newest first
+        :rtype: List[Dict]
+        """
+        self._call()
+        with self._lock:
+            txids = self.history.get(addr, [])[::-1]
+            start = txids.index(last_seen) + 1 if last_seen in txids else 0
+            return [self.records[txid] for txid in txids[start:start + 25]]
+
+    def get_mempool_txs(self, _addr: str) -> List[Dict]:
+        """
+        :param str _addr: Not used, pushed transactions are confirmed right away
+        :return: Empty list
+        :rtype: List[Dict]
+        """
+        self._call()
+        return []
+
+    def get_raw_tx(self, txid: str) -> str:
+        """
+        :param str txid: Id of a pushed or funding transaction
+        :return: Transaction in hex format
+        :rtype: str
+        :raises IOError: Transaction wasn't pushed or created by fund()
+        """
+        self._call()
+        try:
+            return self.transactions[txid]
+        except KeyError:
+            raise IOError(f"Error while processing request:\nTransaction {txid} not found") from None
+
+    def get_fee_table(self) -> Dict[str, float]:
+        self._call()
+        return dict(self.fee_table)
+
+    def get_fee_estimates(self, blocks: int = 6) -> int:
+        return fee_for_target(self.get_fee_table(), blocks)
+
+    def _verify_input(self, tx_hex: str, index: int, script_sig: str, address: str) -> None:
+        try:
+            sig, pubkey = cryptos.deserialize_script(script_sig)
+        except ValueError:
+            raise MockChainError(f"Input {index} doesn't have a pay to public key hash script") from None
+        if self.coin.pubtoaddr(pubkey) != address:
+            raise MockChainError(f"Public key of input {index} doesn't match {address}")
+        if self.verify_signatures and \
+                not cryptos.verify_tx_input(tx_hex, index, self.coin.addrtoscript(address), sig, pubkey):
+            raise MockChainError(f"Invalid signature of input {index}")
+
+    def push_tx(self, tx_hex: str) -> str:
+        """
+        Validate the transaction and apply it to the unspent outputs
+
+        :param str tx_hex: Signed transaction in hex format
+        :return: Transaction id
+        :rtype: str
+        :raises MockChainError: Transaction is not valid
+        """
+        self._call()
+        tx = cryptos.deserialize(tx_hex)
+        txid = cryptos.txhash(tx_hex)
+        with self._lock:
+            if txid in self.transactions:
+                return txid
+            spent = []
+            in_value = 0
+            vin = []
+            for index, tx_in in enumerate(tx["ins"]):
+                outpoint = f"{tx_in['outpoint']['hash']}:{tx_in['outpoint']['index']}"
+                address = self.owners.get(outpoint)
+                if address is None or outpoint not in self.utxos.get(address, {}):
+                    raise MockChainError(f"Input {outpoint} is missing or spent")
+                if outpoint in spent:
+                    raise MockChainError(f"Input {outpoint} is spent twice")
+                self._verify_input(tx_hex, index, tx_in["script"], address)
+                spent.append(outpoint)
+                in_value += self.utxos[address][outpoint]
+                vin.append({"prevout": {"scriptpubkey_address": address,
+                                        "value": self.utxos[address][outpoint]}})
+            out_value = sum(out["value"] for out in tx["outs"])
+            if out_value > in_value:
+                raise MockChainError("Outputs are worth more than the inputs")
+            for outpoint in spent:
+                del self.utxos[self.owners.pop(outpoint)][outpoint]
+            vout = []
+            for index, out in enumerate(tx["outs"]):
+                try:
+                    address = self.coin.scripttoaddr(out["script"])
+                except Exception:
+                    vout.append({"value": out["value"]})
+                    continue
+                vout.append({"scriptpubkey_address": address, "value": out["value"]})
+                outpoint = f"{txid}:{index}"
+                self.utxos.setdefault(address, {})[outpoint] = out["value"]
+                self.owners[outpoint] = address
+            self.transactions[txid] = tx_hex
+            self.records[txid] = {
+                "txid": txid,
+                "status": {"confirmed": True, "block_height": len(self.transactions),
+                           "block_time": int(time.time())},
+                "fee": in_value - out_value,
+                "vin": vin,
+                "vout": vout
+            }
+            for address in {item["scriptpubkey_address"] for item in vin + vout if "scriptpubkey_address" in item}:
+                self.history.setdefault(address, []).append(txid)
+        return txid
+
+
+_SHARED: Dict[str, MockChainApi] = {}
+
+
+def shared_mock_chain(network: str, **kwargs) -> MockChainApi:
+    """
+    Mock chain of the network shared by all commands of the process
+
+    :param str network: mainnet or testnet
+    :param kwargs: Arguments for a new MockChainApi, used only if it doesn't exist yet
+    :return: Mock chain of the network
+    :rtype: MockChainApi
+    """
+    try:
+        return _SHARED[network.lower()]
+    except KeyError:
+        return _SHARED.setdefault(network.lower(), MockChainApi(network, **kwargs))
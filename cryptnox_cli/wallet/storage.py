@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Module for keeping cached wallet data on disk
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from appdirs import user_cache_dir
+
+
+def cache_path(*parts: str, root: str = None) -> Path:
+    """
+    Path of a file in the cache directory of the application, creating its directory
+
+    :param parts: Subdirectories and name of the file
+    :param str root: Directory to use instead of the cache directory of the application
+    :return: Path of the file
+    :rtype: Path
+    """
+    path = Path(root or user_cache_dir('cryptnox-cli', 'cryptnox')).joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def read_json(path: Path, default: Any = None) -> Any:
+    """
+    Read a JSON file, returning the default if it doesn't exist or can't be read
+
+    :param Path path: Path of the file
+    :param default: Value returned when the file can't be used
+    :return: Content of the file
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Path, data: Any) -> None:
+    """
+    Write a JSON file atomically, so readers never see a partially written file
+
+    :param Path path: Path of the file
+    :param data: Data to write
+    """
+    path = Path(path)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
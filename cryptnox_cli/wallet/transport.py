@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP transport for the REST API clients
+
+Connections are kept alive and shared between all clients of the same server, so repeated
+requests don't pay for a new TCP and TLS handshake.
+"""
+import threading
+from typing import Dict, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_POOL_SIZE = 16
+
+
+class HttpTransport:
+    """
+    Keep-alive HTTP transport for one server
+
+    The connection pool is shared by all threads. Every thread gets its own session mounted on
+    the pool as sessions themselves are not thread safe.
+
+    :param str base_url: URL the endpoints are appended to
+    :param timeout: Seconds to wait, or tuple of seconds to connect and to read
+    :param int pool_size: Maximum number of connections kept open
+    :param int retries: Number of retries on connection errors
+    :param int max_concurrency: Maximum number of requests in flight to the server, the pool size
+                                by default
+    """
+
+    def __init__(self, base_url: str, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 pool_size: int = DEFAULT_POOL_SIZE, retries: int = 0, max_concurrency: int = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency or pool_size)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        :return: Session of the current thread
+        :rtype: requests.Session
+        """
+        try:
+            return self._local.session
+        except AttributeError:
+            session = requests.Session()
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0",
+                "Accept-Encoding": "gzip, deflate"
+            })
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+            return session
+
+    def request(self, endpoint: str, params: Dict = None, data: bytes = None,
+                headers: Dict = None) -> bytes:
+        """
+        Send a GET request, or a POST request when there is data to send
+
+        :param str endpoint: Path appended to the base URL
+        :param dict params: Query parameters
+        :param bytes data: Body of the POST request
+        :param dict headers: Additional headers of the request
+        :return: Decompressed body of the response
+        :rtype: bytes
+        :raises IOError: Request failed or server responded with an error
+        """
+        url = self.base_url + endpoint
+        try:
+            with self._slots:
+                response = self.session.request("POST" if data is not None else "GET", url,
+                                                params=params, data=data, headers=headers,
+                                                timeout=self.timeout)
+            response.raise_for_status()
+        except requests.HTTPError as error:
+            raise IOError(f"Error while processing request:\n{error.response.status_code} - "
+                          f"{error.response.text}") from error
+        except requests.RequestException as error:
+            raise IOError(f"Error while processing request:\n{url}\n{error}") from error
+        return response.content
+
+    def close(self) -> None:
+        """
+        Close all pooled connections
+        """
+        self._adapter.close()
+
+
+_TRANSPORTS = {}
+_LOCK = threading.Lock()
+
+
+def get_transport(base_url: str, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                  pool_size: int = DEFAULT_POOL_SIZE, retries: int = 0,
+                  max_concurrency: int = None) -> HttpTransport:
+    """
+    Get the transport shared by all clients of the server with the same settings
+
+    Clients asking for other settings get a transport of their own, so a timeout or pool size
+    is never silently ignored.
+
+    :param str base_url: URL the endpoints are appended to
+    :param timeout: Seconds to wait, or tuple of seconds to connect and to read
+    :param int pool_size: Maximum number of connections kept open
+    :param int retries: Number of retries on connection errors
+    :param int max_concurrency: Maximum number of requests in flight to the server
+    :return: Transport for the server
+    :rtype: HttpTransport
+    """
+    key = (base_url, timeout, pool_size, retries, max_concurrency)
+    with _LOCK:
+        try:
+            return _TRANSPORTS[key]
+        except KeyError:
+            transport = _TRANSPORTS[key] = HttpTransport(base_url, timeout, pool_size, retries,
+                                                         max_concurrency)
+            return transport
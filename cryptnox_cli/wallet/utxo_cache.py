@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Module for caching unspent outputs of an address on disk
+
+Explorers keep showing the outputs spent by a broadcast transaction for a while and don't show
+its change yet. The cache marks spent outputs and adds our own change as pending right after the
+broadcast, so a following transaction doesn't select the same outputs again. The outputs are
+then reconciled in the background, finishing before the process exits.
+"""
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .storage import cache_path, read_json, write_json
+
+DEFAULT_TTL = 60
+PENDING_TTL = 3 * 60 * 60
+
+
+class UtxoCache:
+    """
+    Unspent outputs of one address, persisted on disk
+
+    :param str address: Address the outputs belong to
+    :param str network: Name of the network
+    :param api: API object with get_utx_os(address, n_conf) for fetching the outputs, its cache_dir
+                attribute if it has one replaces the cache directory of the application
+    :param int ttl: Seconds the fetched outputs are used before fetching them again
+    :param Path path: File for keeping the cache, in the application cache directory by default
+    """
+
+    def __init__(self, address: str, network: str, api, ttl: int = DEFAULT_TTL, path: Path = None):
+        self.address = address
+        self.api = api
+        self.ttl = ttl
+        self.path = path or cache_path("utxo", f"{network.lower()}-{address}.json",
+                                       root=getattr(api, "cache_dir", None))
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        state = read_json(self.path, {})
+        state.setdefault("fetched", 0)
+        state.setdefault("n_conf", 0)
+        state.setdefault("utxos", [])
+        state.setdefault("spent", {})
+        state.setdefault("pending", [])
+        return state
+
+    @staticmethod
+    def _reconcile(state: Dict, utxos: List[Dict], n_conf: int, now: float) -> None:
+        visible = {utxo["output"] for utxo in utxos}
+        # Pending change stays until the explorer shows it or the transaction is considered dropped
+        state["pending"] = [utxo for utxo in state["pending"]
+                            if utxo["output"] not in visible and now - utxo["created"] < PENDING_TTL]
+        pending = {utxo["output"] for utxo in state["pending"]}
+        # Spent outputs stay marked until the explorer stops showing them, and spent pending change
+        # as long as the change itself is kept, or until the transaction is considered dropped
+        state["spent"] = {output: spent_at for output, spent_at in state["spent"].items()
+                          if (output in visible or output in pending) and now - spent_at < PENDING_TTL}
+        state["utxos"] = utxos
+        state["n_conf"] = n_conf
+        state["fetched"] = now
+
+    @staticmethod
+    def _spendable(state: Dict) -> List[Dict]:
+        result = [utxo for utxo in state["utxos"] if utxo["output"] not in state["spent"]]
+        if state["n_conf"] == 0:
+            # Pending change is unconfirmed
+            result.extend({"value": utxo["value"], "output": utxo["output"]}
+                          for utxo in state["pending"] if utxo["output"] not in state["spent"])
+        return result
+
+    def is_fresh(self, n_conf: int = 0) -> bool:
+        """
+        :param int n_conf: 0 or 1, the outputs fetched with another value aren't fresh
+        :return: Whether the cached outputs are younger than the TTL
+        :rtype: bool
+        """
+        state = self._load()
+        return state["n_conf"] == n_conf and time.time() - state["fetched"] < self.ttl
+
+    def update(self, utxos: List[Dict], n_conf: int = 0) -> List[Dict]:
+        """
+        Reconcile outputs fetched by the caller, for fetching many addresses at once
+
+        :param utxos: Unspent outputs of the address as returned by the API
+        :param int n_conf: 0 or 1, the value the outputs were fetched with
+        :return: Outputs not spent by our own transactions, including our pending change with n_conf 0
+        :rtype: List[Dict]
+        """
+        with self._lock:
+            state = self._load()
+            self._reconcile(state, utxos, n_conf, time.time())
+            write_json(self.path, state)
+            return self._spendable(state)
+
+    def get(self, n_conf: int = 0, refresh: bool = False) -> List[Dict]:
+        """
+        Get the spendable outputs, fetching them if the cached ones are older than the TTL
+
+        :param int n_conf: 0 or 1, passed to the API
+        :param bool refresh: Fetch the outputs even if the cached ones are still valid
+        :return: Outputs not spent by our own transactions, including our pending change with n_conf 0
+        :rtype: List[Dict]
+        """
+        with self._lock:
+            state = self._load()
+            now = time.time()
+            if refresh or state["n_conf"] != n_conf or now - state["fetched"] >= self.ttl:
+                self._reconcile(state, self.api.get_utx_os(self.address, n_conf), n_conf, now)
+                write_json(self.path, state)
+            return self._spendable(state)
+
+    def mark_sent(self, txid: Optional[str], spent: Iterable[str], change: Iterable[Dict]) -> None:
+        """
+        Record a broadcast transaction, or the inputs of one created to be broadcast later
+
+        :param str txid: Id of the transaction, None if it isn't known yet
+        :param spent: Outpoints spent by the transaction in txid:index format
+        :param change: Outputs of the transaction to the address with index and value
+        """
+        with self._lock:
+            state = self._load()
+            now = time.time()
+            for output in spent:
+                state["spent"][output] = now
+            for output in change:
+                state["pending"].append({
+                    "output": f"{txid}:{output['index']}",
+                    "value": output["value"],
+                    "created": now
+                })
+            write_json(self.path, state)
+
+    def reconcile(self, n_conf: int = 0) -> None:
+        """
+        Fetch the outputs and reconcile them with the recorded transactions
+
+        :param int n_conf: 0 or 1, passed to the API
+        """
+        self.get(n_conf, refresh=True)
+
+    def clear(self) -> None:
+        """
+        Remove the cache from the disk
+        """
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
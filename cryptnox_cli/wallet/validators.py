@@ -60,12 +60,12 @@ class IntValidator(Validator):
     def validate(self, value) -> int:
         if not is_int(value):
             raise ValidationError("Number must be integer")
-        if self.min_value and self.max_value \
-                and self.min_value > int(value) > self.max_value:
-            raise ValidationError(f"Number must be integer larger than: "
-                                  f"{self.min_value} and smaller "
-                                  f"than {self.max_value}")
-        return int(float(value))
+        number = int(float(value))
+        if self.min_value is not None and number < self.min_value:
+            raise ValidationError(f"Number must be integer of at least {self.min_value}")
+        if self.max_value is not None and number > self.max_value:
+            raise ValidationError(f"Number must be integer of at most {self.max_value}")
+        return number
 
 
 class EnumValidator(Validator):
@@ -105,6 +105,18 @@ class UrlValidator(Validator):
         return value
 
 
+class UrlListValidator(Validator):
+    """
+    Class for validating comma separated list of URLs, empty for none
+    """
+
+    def validate(self, value: str) -> str:
+        urls = [url.strip() for url in str(value).split(",") if url.strip()]
+        for url in urls:
+            UrlValidator().validate(url)
+        return ",".join(urls)
+
+
 def is_int(value: Any) -> bool:
     value = str(value)
     if value[0] in ('-', '+'):